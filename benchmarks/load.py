@@ -0,0 +1,361 @@
+"""Load test the main routes and compare the results with a baseline.
+
+Run from the project root:
+
+    python -m benchmarks.load [--server] [--requests 200] [--concurrency 4]
+    python -m benchmarks.load --save-baseline
+
+A scratch database is seeded with restaurants, NPOs, foods and orders,
+then every route is driven in turn, either in-process through the test
+client or over HTTP against a local server. Throughput and p50/p95/p99
+latencies are printed per route. When a baseline file exists the run
+fails if any route got slower than it by more than the tolerance.
+"""
+import argparse
+import http.client
+import http.cookies
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from flask import current_app
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import WSGIRequestHandler, make_server
+from website import create_app, db
+from website.config import SETTINGS
+from website.insight import BUCKETS
+from website.migrations import upgrade
+from website.models import Food, User
+from website.seed import FOODS, LOCATIONS, seed
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+PASSWORD = 'benchmark'
+
+
+def seed_database(restaurants, npos, foods, orders):
+    """Seed the current app's database; return the users and food ids."""
+    password = generate_password_hash(PASSWORD, current_app.config['PASSWORD_HASH_METHOD'])
+    connection = db.session.connection()
+    seed(connection, restaurants, npos, foods, orders, password=password)
+    # Keep /order measuring successful orders rather than sold out food.
+    connection.execute(Food.__table__.update().values(quantity=10 ** 6))
+    db.session.commit()
+    users = [dict(id=user.id, username=user.username, user_type=user.user_type)
+             for user in User.query.order_by(User.id)]
+    return ([user for user in users if user['user_type'] == 'restaurant'],
+            [user for user in users if user['user_type'] == 'npo'],
+            [food_id for food_id, in db.session.query(Food.id)])
+
+
+class QuietHandler(WSGIRequestHandler):
+    """Keep-alive request handler that does not log every request."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle's algorithm
+    # on, every keep-alive response would wait for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_request(self, *args, **kwargs):
+        """Skip the access log line."""
+
+
+class TestClient(object):
+    """Issues requests in-process through Flask's test client."""
+
+    def __init__(self, app):
+        """Create a client with its own cookie jar."""
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, payload=None):
+        """Send one request and return the status code."""
+        response = self.client.open(path, method=method, data=data, json=payload)
+        status = response.status_code
+        response.close()
+        return status
+
+
+class HTTPClient(object):
+    """Issues requests over a keep-alive connection to a local server."""
+
+    def __init__(self, host, port):
+        """Create a client with its own connection and session cookie."""
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookies = http.cookies.SimpleCookie()
+
+    def request(self, method, path, data=None, payload=None):
+        """Send one request and return the status code."""
+        headers = dict()
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                '{}={}'.format(name, morsel.value) for name, morsel in self.cookies.items())
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(header)
+        return response.status
+
+
+def login(client, user):
+    """Log a client in as user."""
+    status = client.request('POST', '/login', data=dict(
+        username=user['username'], password=PASSWORD))
+    if status != 302:
+        raise RuntimeError('Could not log in {}: {}'.format(user['username'], status))
+    return client
+
+
+def scenarios(make_client, restaurants, npos, food_ids):
+    """Return (route, setup, step) triples driving each route.
+
+    setup runs once per worker thread and returns its state; step sends
+    one request with that state and an iteration number.
+    """
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def unique():
+        with lock:
+            return next(counter)
+
+    def restaurant():
+        user = random.choice(restaurants)
+        return login(make_client(), user), user
+
+    def npo():
+        user = random.choice(npos)
+        return login(make_client(), user), user
+
+    def signup(state, i):
+        n = unique()
+        return make_client().request('POST', '/signup', data=dict(
+            username='signup{}'.format(n), password=PASSWORD, confirm=PASSWORD,
+            businessname='Signup {}'.format(n), location=random.choice(LOCATIONS),
+            user_type='npo'))
+
+    def log_in(state, i):
+        user = random.choice(npos)
+        return make_client().request('POST', '/login', data=dict(
+            username=user['username'], password=PASSWORD))
+
+    def dashboard(state, i):
+        client, user = state
+        return client.request('GET', '/' + user['username'])
+
+    def search(state, i):
+        client, _ = state
+        return client.request('GET', '/search?tag=' + random.choice(FOODS))
+
+    def order(state, i):
+        client, _ = state
+        items = [dict(id=food_id, quantity=1) for food_id in random.sample(food_ids, 2)]
+        return client.request('POST', '/order', payload=items)
+
+    # /insight itself is a static shell; its charts load these.
+    def insight_foods(state, i):
+        client, _ = state
+        return client.request('GET', '/api/insight/foods')
+
+    def insight_saved(state, i):
+        client, _ = state
+        bucket = sorted(BUCKETS)[i % len(BUCKETS)]
+        return client.request('GET', '/api/insight/saved?bucket=' + bucket)
+
+    return [
+        ('signup', lambda: None, signup),
+        ('login', lambda: None, log_in),
+        ('restaurant dashboard', restaurant, dashboard),
+        ('npo dashboard', npo, dashboard),
+        ('search', npo, search),
+        ('order', npo, order),
+        ('insight foods', restaurant, insight_foods),
+        ('insight saved', restaurant, insight_saved),
+    ]
+
+
+def percentile(samples, fraction):
+    """Return the nearest-rank percentile of sorted samples."""
+    if not samples:
+        return 0.0
+    rank = max(math.ceil(fraction * len(samples)), 1)
+    return samples[rank - 1]
+
+
+def drive(setup, step, requests, concurrency):
+    """Run step requests times over concurrency threads; return stats."""
+    latencies = []
+    statuses = dict()
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (i < requests % concurrency)
+                  for i in range(concurrency)]
+    states = [setup() for _ in range(concurrency)]
+
+    def worker(state, count):
+        mine = []
+        codes = dict()
+        for i in range(count):
+            start = time.perf_counter()
+            status = step(state, i)
+            mine.append(time.perf_counter() - start)
+            codes[status] = codes.get(status, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for status, seen in codes.items():
+                statuses[status] = statuses.get(status, 0) + seen
+
+    threads = [threading.Thread(target=worker, args=(state, count))
+               for state, count in zip(states, per_thread)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return dict(
+        requests=len(latencies),
+        throughput=len(latencies) / elapsed if elapsed else 0.0,
+        p50=percentile(latencies, 0.50) * 1000,
+        p95=percentile(latencies, 0.95) * 1000,
+        p99=percentile(latencies, 0.99) * 1000,
+        statuses={str(status): seen for status, seen in sorted(statuses.items())})
+
+
+def compare(results, baseline, tolerance):
+    """List the routes whose p95 or throughput regressed past tolerance."""
+    regressions = []
+    for route, stats in results.items():
+        previous = baseline.get(route)
+        if previous is None:
+            continue
+        if stats['p95'] > previous['p95'] * (1 + tolerance):
+            regressions.append('{}: p95 {:.1f}ms, baseline {:.1f}ms'.format(
+                route, stats['p95'], previous['p95']))
+        if stats['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append('{}: {:.1f} req/s, baseline {:.1f} req/s'.format(
+                route, stats['throughput'], previous['throughput']))
+    return regressions
+
+
+def benchmark_settings(environment, database):
+    """Return a settings class for environment using a scratch database."""
+    # The runner logs in and orders far faster than any real client would.
+    return type('BenchmarkSettings', (SETTINGS[environment],), dict(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + database,
+        SECRET_KEY='benchmark',
+        TESTING=False,
+        DEBUG=False,
+        RATE_LIMITING=False))
+
+
+def run(options):
+    """Seed a scratch database, drive every route and return the stats."""
+    folder = tempfile.mkdtemp()
+    app = create_app(benchmark_settings(options.settings, os.path.join(folder, 'load.db')))
+    server = None
+    try:
+        with app.app_context():
+            upgrade(db.engine)
+            restaurants, npos, food_ids = seed_database(
+                options.restaurants, options.npos, options.foods, options.orders)
+            db.session.remove()
+
+        if options.server:
+            server = make_server('127.0.0.1', 0, app, threaded=True,
+                                 request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+            def make_client():
+                return HTTPClient('127.0.0.1', server.server_port)
+        else:
+            def make_client():
+                return TestClient(app)
+
+        results = dict()
+        for route, setup, step in scenarios(make_client, restaurants, npos, food_ids):
+            if options.routes and route not in options.routes:
+                continue
+            results[route] = drive(setup, step, options.requests, options.concurrency)
+        return results
+    finally:
+        if server is not None:
+            server.shutdown()
+        with app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(folder)
+
+
+def report(results):
+    """Print one line of stats per route."""
+    print('{:<22}{:>8}{:>10}{:>10}{:>10}{:>10}  {}'.format(
+        'route', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'statuses'))
+    for route, stats in results.items():
+        print('{:<22}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}  {}'.format(
+            route, stats['requests'], stats['throughput'], stats['p50'],
+            stats['p95'], stats['p99'],
+            ' '.join('{}x{}'.format(status, seen) for status, seen in stats['statuses'].items())))
+
+
+def parse_args(argv):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', action='store_true',
+                        help='drive a local HTTP server instead of the test client')
+    parser.add_argument('--settings', choices=sorted(SETTINGS), default='production')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--restaurants', type=int, default=100)
+    parser.add_argument('--npos', type=int, default=100)
+    parser.add_argument('--foods', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--route', dest='routes', action='append',
+                        help='only run this route; may be repeated')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before a route counts as regressed')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and return the process exit status."""
+    options = parse_args(argv)
+    results = run(options)
+    report(results)
+
+    mode = 'server' if options.server else 'in-process'
+    baselines = dict()
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as handle:
+            baselines = json.load(handle)
+
+    if options.save_baseline:
+        baselines[mode] = results
+        with open(options.baseline, 'w') as handle:
+            json.dump(baselines, handle, indent=2, sort_keys=True)
+        print('Saved {} baseline to {}'.format(mode, options.baseline))
+        return 0
+
+    regressions = compare(results, baselines.get(mode, {}), options.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Benchmark the NPO dashboard against the old nested-loop rendering.
+
+Run from the project root:
+
+    python -m benchmarks.npo_dashboard [foods] [users]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from flask import render_template, render_template_string
+from website import create_test_app, db
+from website.inventory import available_food, order_history
+from website.models import Food, Order, OrderDetails, User
+
+
+# The food table and order history as npo.html rendered them before
+# foods were joined to their restaurant.
+LEGACY_TEMPLATE = """
+{% for food in food %}
+  {% if food.quantity > 0 %}
+    <tr id={{food.id}}>
+      <td>{{ food.food_name }}</td>
+      <td>{{ food.description }}</td>
+      {% for user in users %}
+        {% if user.id == food.users_id %}
+        <td>{{ user.businessname }}</td>
+        <td>{{ user.location }}</td>
+        {% endif %}
+      {% endfor %}
+      <td>{{ food.quantity }}</td>
+    </tr>
+  {% endif %}
+{% endfor %}
+{% for order in orders %}
+  {% for ordered in order.details %}
+    {% for food in food %}
+      {% if ordered.food_id == food.id %}
+      <span>{{ food.food_name }} {{ ordered.quantity }}Kg</span>
+      {% endif %}
+    {% endfor %}
+  {% endfor %}
+{% endfor %}
+"""
+
+
+def seed(foods, users, orders=100, lines=5):
+    """Fill the database with restaurants, foods and one NPO's orders."""
+    rng = random.Random(0)
+    db.session.execute(User.__table__.insert(), [
+        dict(id=i, username='user%d' % i, password='x',
+             businessname='business%d' % i, location='city%d' % (i % 50),
+             user_type='restaurant' if i > 1 else 'npo')
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(Food.__table__.insert(), [
+        dict(id=i, food_name='food%d' % i, description='desc',
+             quantity=rng.randint(0, 20), users_id=rng.randint(2, users))
+        for i in range(1, foods + 1)
+    ])
+    now = datetime.datetime.now()
+    db.session.execute(Order.__table__.insert(), [
+        dict(id=i, user_id=1, date=now) for i in range(1, orders + 1)
+    ])
+    db.session.execute(OrderDetails.__table__.insert(), [
+        dict(order_id=order_id, food_id=food_id, quantity=1)
+        for order_id in range(1, orders + 1)
+        for food_id in rng.sample(range(1, foods + 1), lines)
+    ])
+    db.session.commit()
+
+
+def render_legacy(npo):
+    """Query and render the dashboard the way the old view did."""
+    food = Food.query.order_by(Food.food_name)
+    users = User.query.all()
+    orders = Order.query.filter_by(user_id=npo.id)
+    return render_template_string(
+        LEGACY_TEMPLATE, food=food, users=users, orders=orders)
+
+
+def render_current(npo):
+    """Query and render the dashboard the way the view does now."""
+    return render_template(
+        'npo.html',
+        businessname=npo.businessname,
+        food=available_food().all(),
+        orders=order_history(npo.id),
+        user=npo)
+
+
+def timed(func, *args):
+    """Return the wall time of one call in milliseconds."""
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main(foods=10000, users=1000):
+    """Seed a scratch database and print both render times."""
+    handle, database = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    app = create_test_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(foods, users)
+            npo = User.query.get(1)
+            with app.test_request_context():
+                current = timed(render_current, npo)
+                legacy = timed(render_legacy, npo)
+            db.session.remove()
+    finally:
+        os.remove(database)
+
+    print('foods=%d users=%d' % (foods, users))
+    print('legacy:  %10.1f ms' % legacy)
+    print('current: %10.1f ms' % current)
+    print('speedup: %10.1fx' % (legacy / current))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,109 @@
+"""Food API tests."""
+import time
+from tests.base_test import BaseTestCase
+from website.api import last_modified
+from website.catalogue import catalogue_version
+from website.models import Food, User
+from werkzeug.http import http_date
+from werkzeug.security import generate_password_hash
+from website import db
+
+
+class TestFoodApi(BaseTestCase):
+    """GET /api/food tests."""
+
+    def setUp(self):
+        """Create two restaurants with food and log an NPO in."""
+        with self.app.app_context() as context:
+            self.context = context
+            self.client = self.app.test_client()
+            db.create_all()
+            db.session.add_all([
+                User(id=1, username='one', password='x', businessname='One',
+                     location='Lund', user_type='restaurant'),
+                User(id=2, username='two', password='x', businessname='Two',
+                     location='Malmo', user_type='restaurant'),
+                User(id=3, username='npo',
+                     password=generate_password_hash('password', 'sha256'),
+                     businessname='Npo', location='Lund', user_type='npo'),
+            ])
+            db.session.add_all([
+                Food(id=i, food_name='food%d' % i, description='desc',
+                     quantity=i % 3, users_id=1 + i % 2)
+                for i in range(1, 10)
+            ])
+            db.session.commit()
+            self.client.post('/login', data=dict(username='npo', password='password'))
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def test_keyset_pages(self):
+        """Pages follow on from the previous page's last id."""
+        response = self.client.get('/api/food?limit=2')
+        body = response.get_json()
+        self.assertEqual([item['id'] for item in body['items']], [1, 2])
+        self.assertIn('after=2', body['next'])
+
+        body = self.client.get(body['next']).get_json()
+        self.assertEqual([item['id'] for item in body['items']], [4, 5])
+
+    def test_filters(self):
+        """Results can be limited to a restaurant or a location."""
+        body = self.client.get('/api/food?restaurant=1').get_json()
+        self.assertEqual([item['id'] for item in body['items']], [2, 4, 8])
+        self.assertIsNone(body['next'])
+
+        body = self.client.get('/api/food?location=Malmo').get_json()
+        self.assertEqual([item['id'] for item in body['items']], [1, 5, 7])
+
+    def backdate(self, seconds):
+        """Pretend the catalogue last changed seconds ago."""
+        with self.context:
+            db.session.execute(catalogue_version.update().values(
+                modified=catalogue_version.c.modified - seconds))
+            db.session.commit()
+
+    def test_conditional_get(self):
+        """Unchanged catalogue answers 304 until food changes."""
+        self.backdate(10)
+        response = self.client.get('/api/food')
+        etag = response.headers['ETag']
+        modified = response.headers['Last-Modified']
+
+        response = self.client.get('/api/food', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(
+            '/api/food',
+            headers={'If-Modified-Since': modified})
+        self.assertEqual(response.status_code, 304)
+
+        with self.context:
+            Food.query.get(1).quantity = 5
+            db.session.commit()
+
+        response = self.client.get('/api/food', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        # A stale ETag is not overruled by a recent enough date.
+        response = self.client.get('/api/food', headers={
+            'If-None-Match': etag, 'If-Modified-Since': http_date(time.time() + 60)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_in_the_same_second(self):
+        """A change in the second a list was sent still invalidates it."""
+        self.assertEqual(last_modified(100, now=100.5), 99)
+        self.assertEqual(last_modified(100, now=101.0), 100)
+
+        response = self.client.get('/api/food')
+        modified = response.headers['Last-Modified']
+        with self.context:
+            Food.query.get(1).quantity = 5
+            db.session.commit()
+        response = self.client.get('/api/food', headers={'If-Modified-Since': modified})
+        self.assertEqual(response.status_code, 200)
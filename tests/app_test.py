@@ -1,6 +1,13 @@
 """Application testing module."""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 from website import create_app
+from website.config import ProductionSettings
 from flask import Flask
 
 
@@ -33,3 +40,63 @@ class TestApp(unittest.TestCase):
         self.assertEqual(secret, 's3cr3t')
         self.assertTrue(debug)
         self.assertFalse(track)
+
+    def test_production_needs_secret_key(self):
+        """Production refuses to start without a SECRET_KEY."""
+        settings = type('Settings', (ProductionSettings,), dict(SECRET_KEY=None))
+        with self.assertRaises(RuntimeError):
+            create_app(settings)
+
+
+STARTUP = """
+import sys
+from website.config import DevSettings
+
+class Settings(DevSettings):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + sys.argv[1]
+    ASSET_BUILD_DIR = sys.argv[2]
+
+from website import create_app
+create_app(Settings)
+"""
+
+# Everything the app imports from outside this package.
+THIRD_PARTY = 'import click, flask, flask_login, flask_sqlalchemy, jinja2, sqlalchemy, werkzeug'
+
+
+class TestStartup(unittest.TestCase):
+    """Cold start budget test."""
+
+    def setUp(self):
+        """Create a scratch folder for the database and built assets."""
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the scratch folder."""
+        shutil.rmtree(self.folder)
+
+    def run_python(self, *args):
+        """Run a fresh interpreter and return its wall time, start to exit."""
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], check=True, capture_output=True)
+        return time.perf_counter() - start
+
+    def start(self):
+        """Start the app in a fresh interpreter and return the time taken."""
+        return self.run_python('-c', STARTUP, os.path.join(self.folder, 'app.db'),
+                               os.path.join(self.folder, 'assets'))
+
+    def test_startup_budget(self):
+        """A restart against a current database takes under 200ms of our own time.
+
+        Both runs are timed from interpreter start to exit. The time to
+        import Flask, SQLAlchemy and friends in a bare interpreter is
+        taken off, as no change to this package can make it smaller.
+        """
+        self.start()
+        # Alternating the runs evens out other load on the machine.
+        runs = [(self.start(), self.run_python('-c', THIRD_PARTY)) for _ in range(10)]
+        startup = min(run[0] for run in runs)
+        baseline = min(run[1] for run in runs)
+        self.assertLess(startup - baseline, 0.2,
+                        'startup {:.3f}s, third-party imports {:.3f}s'.format(startup, baseline))
@@ -0,0 +1,85 @@
+"""Static asset pipeline tests."""
+import os
+import shutil
+import tempfile
+import unittest
+from flask import url_for
+from website import create_test_app
+from website.assets import Image, init_assets
+
+
+class TestAssets(unittest.TestCase):
+    """Fingerprinting and variant negotiation tests."""
+
+    def setUp(self):
+        """Create an app serving a small temporary static folder."""
+        self.static = tempfile.mkdtemp()
+        self.build = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.static, 'images'))
+        with open(os.path.join(self.static, 'site.css'), 'w') as css:
+            css.write("body { background: url('images/bg.png'); }\n" * 20)
+        if Image is not None:
+            Image.new('RGB', (64, 32), 'green').save(os.path.join(self.static, 'images', 'bg.png'))
+        else:
+            with open(os.path.join(self.static, 'images', 'bg.png'), 'wb') as png:
+                png.write(b'not really a png')
+        shutil.copy(os.path.join(self.static, 'images', 'bg.png'),
+                    os.path.join(self.static, 'copy.png'))
+
+        self.app = create_test_app()
+        self.app.static_folder = self.static
+        self.app.config.update(ASSET_PIPELINE=True, ASSET_BUILD_DIR=self.build,
+                               ASSET_IMAGE_MAX_WIDTH=32)
+        self.manifest = init_assets(self.app, images=True)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Remove the temporary folders."""
+        shutil.rmtree(self.static)
+        shutil.rmtree(self.build)
+
+    def test_fingerprinted_urls(self):
+        """url_for returns content-hashed URLs; duplicates share one."""
+        with self.app.test_request_context():
+            css = url_for('static', filename='site.css')
+            image = url_for('static', filename='images/bg.png')
+            copy = url_for('static', filename='copy.png')
+        self.assertRegex(css, r'^/static/site\.[0-9a-f]{12}\.css$')
+        self.assertEqual(image, copy)
+
+    def test_immutable_gzip_response(self):
+        """Fingerprinted text is served gzipped with a long cache lifetime."""
+        with self.app.test_request_context():
+            css = url_for('static', filename='site.css')
+        response = self.client.get(css, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        response.close()
+
+        response = self.client.get(css)
+        self.assertNotIn('Content-Encoding', response.headers)
+        # The stylesheet points at the fingerprinted image.
+        asset = self.manifest.assets['images/bg.png']
+        self.assertIn(asset.url.split('/')[-1].encode(), response.data)
+        response.close()
+
+    @unittest.skipIf(Image is None, 'Pillow is not installed')
+    def test_webp_negotiation(self):
+        """Clients accepting WebP get the WebP derivative."""
+        with self.app.test_request_context():
+            image = url_for('static', filename='images/bg.png')
+        response = self.client.get(image, headers={'Accept': 'image/webp,*/*'})
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('Accept', response.headers['Vary'])
+        response.close()
+
+        response = self.client.get(image, headers={'Accept': '*/*'})
+        self.assertEqual(response.mimetype, 'image/png')
+        response.close()
+
+    def test_unfingerprinted_fallback(self):
+        """Plain static URLs keep working."""
+        response = self.client.get('/static/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+        response.close()
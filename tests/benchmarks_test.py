@@ -0,0 +1,47 @@
+"""Load test harness tests."""
+import unittest
+from benchmarks import load
+
+
+class TestLoad(unittest.TestCase):
+    """Benchmark runner and baseline comparison tests."""
+
+    def test_every_route_succeeds(self):
+        """A tiny in-process run drives every route without errors."""
+        options = load.parse_args([
+            '--settings', 'testing', '--requests', '4', '--concurrency', '2',
+            '--restaurants', '3', '--npos', '3', '--foods', '50', '--orders', '10'])
+        results = load.run(options)
+        self.assertEqual(len(results), 8)
+        for route, stats in results.items():
+            self.assertEqual(stats['requests'], 4, route)
+            for status in stats['statuses']:
+                self.assertLess(int(status), 400, route)
+
+    def test_production_settings(self):
+        """The default production settings run without errors as well."""
+        # More logins to the one NPO than its account's login limit allows.
+        options = load.parse_args([
+            '--requests', '12', '--concurrency', '2',
+            '--restaurants', '1', '--npos', '1', '--foods', '20', '--orders', '5'])
+        self.assertEqual(options.settings, 'production')
+        results = load.run(options)
+        for route, stats in results.items():
+            for status in stats['statuses']:
+                self.assertLess(int(status), 400, route)
+
+    def test_compare(self):
+        """Slower p95 or lower throughput past the tolerance is a regression."""
+        baseline = {'search': dict(p95=10.0, throughput=100.0)}
+        steady = {'search': dict(p95=11.0, throughput=90.0)}
+        slower = {'search': dict(p95=20.0, throughput=50.0)}
+        self.assertEqual(load.compare(steady, baseline, 0.25), [])
+        self.assertEqual(len(load.compare(slower, baseline, 0.25)), 2)
+        self.assertEqual(load.compare(slower, {}, 0.25), [])
+
+    def test_percentile(self):
+        """Percentiles use the nearest rank."""
+        samples = list(range(1, 101))
+        self.assertEqual(load.percentile(samples, 0.5), 50)
+        self.assertEqual(load.percentile(samples, 0.99), 99)
+        self.assertEqual(load.percentile([], 0.5), 0.0)
@@ -0,0 +1,171 @@
+"""Bulk inventory import and change set tests."""
+import io
+import json
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.models import Food, User
+
+
+class TestImport(BaseTestCase):
+    """POST /api/food/import tests."""
+
+    def setUp(self):
+        """Create two restaurants, one with food, and an NPO."""
+        self.app.config['IMPORT_BATCH_SIZE'] = 2
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='other', password=password,
+                     businessname='Cafe', location='Lund', user_type='restaurant'),
+                User(id=3, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+            ])
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=1, users_id=1),
+                Food(id=2, food_name='cake', description='carrot', quantity=1, users_id=2),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        self.app.config['IMPORT_BATCH_SIZE'] = 1000
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def login(self, username):
+        """Return a client logged in as username."""
+        client = self.app.test_client()
+        client.post('/login', data=dict(username=username, password='password'))
+        return client
+
+    def food(self):
+        """Return {food_name: (quantity, description)} of restaurant 1."""
+        return {food.food_name: (food.quantity, food.description)
+                for food in Food.query.filter_by(users_id=1)}
+
+    def test_csv_upserts_and_reports_bad_rows(self):
+        """Rows add or update food by name or id; bad rows are reported by line."""
+        body = '\n'.join([
+            'food_name,description,quantity,id',
+            'soup,tomato,5,',
+            'bread,rye,3,',
+            ',nameless,1,',
+            'pie,apple,-1,',
+            'bread,sourdough,4,',
+            'stolen,cake,9,2',
+            'soup,lentil,6,1',
+        ])
+        with self.context:
+            response = self.login('restaurant').post(
+                '/api/food/import', data=body, content_type='text/csv')
+            result = response.get_json()
+            self.assertEqual(result['status'], 'partial')
+            self.assertEqual((result['inserted'], result['updated'], result['failed']),
+                             (1, 3, 3))
+            self.assertEqual([error['line'] for error in result['errors']], [4, 5, 7])
+            self.assertEqual(self.food(), {'soup': (6, 'lentil'), 'bread': (4, 'sourdough')})
+            self.assertEqual(Food.query.get(2).food_name, 'cake')
+
+    def test_ndjson_upload(self):
+        """A multipart NDJSON upload is read by its extension."""
+        rows = [dict(food_name='rice', description='white', quantity=2),
+                dict(food_name='beans', description='black', quantity=7)]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\n\n{broken\n'
+        with self.context:
+            response = self.login('restaurant').post('/api/food/import', data=dict(
+                file=(io.BytesIO(body.encode()), 'stock.ndjson')))
+            result = response.get_json()
+            self.assertEqual((result['inserted'], result['failed']), (2, 1))
+            self.assertEqual(result['errors'], [dict(line=4, error='Not valid JSON')])
+            self.assertEqual(self.food()['beans'], (7, 'black'))
+
+    def test_rejected_imports(self):
+        """Unknown formats, bad headers and non-restaurants are refused."""
+        with self.context:
+            client = self.login('restaurant')
+            self.assertEqual(client.post('/api/food/import', data='x').status_code, 400)
+            response = client.post('/api/food/import?format=csv', data='name,qty\nsoup,1')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('header', response.get_json()['error'])
+            response = self.login('npo').post(
+                '/api/food/import', data='', content_type='text/csv')
+            self.assertEqual(response.status_code, 403)
+
+
+class TestBatchChanges(BaseTestCase):
+    """POST /api/food/batch and the single item views built on it."""
+
+    def setUp(self):
+        """Create two restaurants with food."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='other', password=password,
+                     businessname='Cafe', location='Lund', user_type='restaurant'),
+            ])
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=1, users_id=1),
+                Food(id=2, food_name='bread', description='rye', quantity=2, users_id=1),
+                Food(id=3, food_name='pie', description='apple', quantity=3, users_id=1),
+                Food(id=4, food_name='cake', description='carrot', quantity=4, users_id=2),
+            ])
+            db.session.commit()
+            self.client = self.app.test_client()
+            self.client.post('/login', data=dict(username='restaurant', password='password'))
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def food(self):
+        """Return {id: (food_name, description, quantity)} of every food."""
+        return {food.id: (food.food_name, food.description, food.quantity)
+                for food in Food.query}
+
+    def test_changes_apply_together(self):
+        """Partial updates and deletes are applied in one request."""
+        with self.context:
+            response = self.client.post('/api/food/batch', json=dict(
+                update=[dict(id=1, quantity=9), dict(id=2, food_name='rolls'),
+                        dict(id=1, description='cold')],
+                delete=[3]))
+            self.assertEqual(response.get_json(),
+                             dict(status='done', updated=2, deleted=1))
+            self.assertEqual(self.food(), {1: ('soup', 'cold', 9), 2: ('rolls', 'rye', 2),
+                                           4: ('cake', 'carrot', 4)})
+
+    def test_other_restaurants_food_fails_everything(self):
+        """Naming food of another restaurant changes nothing at all."""
+        with self.context:
+            before = self.food()
+            response = self.client.post('/api/food/batch', json=dict(
+                update=[dict(id=1, quantity=0), dict(id=4, quantity=0)], delete=[2, 7]))
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.get_json()['items'], [4, 7])
+
+            self.client.post('/update/4', data=dict(id=4, name='mine', description='x',
+                                                    quantity=1))
+            self.client.post('/delete', data=dict(id=4))
+            self.assertEqual(self.food(), before)
+
+    def test_invalid_changes(self):
+        """Malformed change sets are refused."""
+        with self.context:
+            for payload in ([], dict(), dict(update=[dict(quantity=1)]),
+                            dict(update=[dict(id=1, quantity=-1)]),
+                            dict(update=[dict(id=1, quantity=1)], delete=[1]),
+                            dict(delete=['x'])):
+                response = self.client.post('/api/food/batch', json=payload)
+                self.assertEqual(response.status_code, 400, payload)
@@ -0,0 +1,138 @@
+"""Cart hold tests."""
+import time
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import bulk, cart, db
+from website.catalogue import current_version
+from website.inventory import available_food
+from website.models import Food, Order, Reservation, SavedTotal, User
+from website.orders import OrderError, place_order
+
+
+class TestCart(BaseTestCase):
+    """Reservation hold, sweep and checkout tests."""
+
+    def setUp(self):
+        """Create a restaurant with food and two NPOs."""
+        with self.app.app_context() as context:
+            self.context = context
+            self.client = self.app.test_client()
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+                User(id=3, username='other', password=password,
+                     businessname='Pantry', location='Lund', user_type='npo'),
+            ])
+            db.session.commit()
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=10, users_id=1),
+                Food(id=2, food_name='bread', description='rye', quantity=5, users_id=1),
+                Food(id=3, food_name='pie', description='apple', quantity=5, users_id=1),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def available(self):
+        """Return {food id: quantity} as the dashboard shows it."""
+        return {row.id: row.quantity for row in available_food()}
+
+    def test_hold_reduces_available_stock(self):
+        """Held stock is left out of the dashboard, not out of Food.quantity."""
+        with self.context:
+            version = current_version()[0]
+            cart.hold(2, {1: 4, 2: 5}, 60)
+            cart.hold(2, {1: 1}, 60)
+
+            self.assertEqual(self.available(), {1: 5, 3: 5})
+            self.assertEqual(Food.query.get(1).quantity, 10)
+            self.assertEqual(Reservation.query.get((2, 1)).quantity, 5)
+            self.assertGreater(current_version()[0], version)
+
+    def test_hold_cannot_exceed_free_stock(self):
+        """Stock held by another user cannot be held or ordered again."""
+        with self.context:
+            cart.hold(3, {1: 8}, 60)
+            with self.assertRaises(OrderError) as raised:
+                cart.hold(2, {2: 1, 1: 3}, 60)
+            self.assertEqual(raised.exception.items, [1])
+            self.assertEqual(Reservation.query.filter_by(user_id=2).count(), 0)
+
+            with self.assertRaises(OrderError):
+                place_order(2, {1: 3})
+            place_order(2, {1: 2})
+            self.assertEqual(Food.query.get(1).quantity, 8)
+
+    def test_checkout_converts_holds(self):
+        """Checkout orders the held stock and clears the cart."""
+        with self.context:
+            cart.hold(2, {1: 4, 2: 2}, 60)
+            cart.hold(3, {1: 6}, 60)
+
+            order = cart.checkout(2)
+
+            self.assertEqual({d.food_id: d.quantity for d in order.details}, {1: 4, 2: 2})
+            self.assertEqual(Food.query.get(1).quantity, 6)
+            self.assertEqual(Reservation.query.filter_by(user_id=2).count(), 0)
+            self.assertEqual(SavedTotal.query.get((1, 1)).quantity, 4)
+            self.assertEqual(self.available(), {2: 3, 3: 5})
+            with self.assertRaises(OrderError) as raised:
+                cart.checkout(2)
+            self.assertEqual(raised.exception.status, 400)
+
+    def test_deleted_food_leaves_the_cart(self):
+        """Deleting held food releases its holds; stale holds don't block checkout."""
+        with self.context:
+            cart.hold(2, {1: 4, 2: 2, 3: 1}, 60)
+            bulk.apply_changes(1, dict(), [2])
+            self.assertIsNone(Reservation.query.get((2, 2)))
+
+            # A hold left behind before deletes released them.
+            db.session.execute(text('DELETE FROM food WHERE id = 3'))
+            db.session.commit()
+
+            order = cart.checkout(2)
+            self.assertEqual({d.food_id: d.quantity for d in order.details}, {1: 4})
+            self.assertEqual(Reservation.query.count(), 0)
+
+    def test_sweep_releases_expired_holds_in_batches(self):
+        """Only expired holds are swept, over as many batches as needed."""
+        with self.context:
+            cart.hold(2, {1: 1, 2: 1, 3: 1}, 60)
+            cart.hold(3, {1: 1, 2: 1}, 600)
+
+            self.assertEqual(cart.sweep(db.engine, 2), set())
+            self.assertEqual(cart.sweep(db.engine, 2, now=int(time.time()) + 120), {1, 2, 3})
+            self.assertEqual(
+                [(r.user_id, r.food_id) for r in Reservation.query.order_by('food_id')],
+                [(3, 1), (3, 2)])
+
+    def test_cart_routes(self):
+        """The cart can be filled, emptied and checked out over HTTP."""
+        with self.context, self.client as client:
+            client.post('/login', data=dict(username='npo', password='password'))
+
+            response = client.post('/cart', json=[{'id': 1, 'quantity': 3},
+                                                  {'id': 2, 'quantity': 1}])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item['id'] for item in response.get_json()['items']], [2, 1])
+            self.assertEqual(client.post('/cart', json=[{'id': 9, 'quantity': 1}]).status_code,
+                             409)
+
+            self.assertEqual(client.delete('/cart/2').status_code, 200)
+            self.assertEqual(client.delete('/cart/2').status_code, 404)
+            self.assertEqual(len(client.get('/cart').get_json()['items']), 1)
+
+            response = client.post('/cart/checkout')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(Order.query.get(response.get_json()['order_id']).user_id, 2)
+            self.assertEqual(Food.query.get(1).quantity, 7)
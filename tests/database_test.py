@@ -0,0 +1,53 @@
+"""SQLite connection tuning tests."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+from website import db
+from website.config import DevSettings, ProductionSettings, settings_from_env
+from website.database import configure_engine, effective_settings, pragma_statements
+
+
+class TestDatabase(unittest.TestCase):
+    """Production settings and PRAGMA hook tests."""
+
+    def setUp(self):
+        """Create an app using the production settings on a scratch file."""
+        self.folder = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.from_object(ProductionSettings)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.folder, 'p.db')
+        db.init_app(self.app)
+        self.engine = configure_engine(self.app)
+
+    def tearDown(self):
+        """Release the engine and remove the scratch file."""
+        self.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def test_pragmas_applied(self):
+        """New connections run in WAL mode with the configured tuning."""
+        settings = effective_settings(self.engine)
+        self.assertEqual(settings['journal_mode'], 'wal')
+        self.assertEqual(settings['synchronous'], 1)
+        self.assertEqual(settings['busy_timeout'], 5000)
+        self.assertEqual(settings['cache_size'], -64000)
+        self.assertIn('QueuePool', settings['pool'])
+
+    def test_invalid_pragmas(self):
+        """Unknown PRAGMAs and values are refused."""
+        with self.assertRaises(ValueError):
+            pragma_statements({'writable_schema': 'ON'})
+        with self.assertRaises(ValueError):
+            pragma_statements({'journal_mode': 'WAL; DROP TABLE user'})
+        self.assertEqual(pragma_statements({'synchronous': 'normal'}),
+                         ['PRAGMA synchronous = NORMAL'])
+
+    def test_settings_from_env(self):
+        """FLASK_ENV picks the settings class."""
+        with mock.patch.dict(os.environ, {'FLASK_ENV': 'production'}):
+            self.assertIs(settings_from_env(), ProductionSettings)
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertIs(settings_from_env(), DevSettings)
@@ -0,0 +1,96 @@
+"""Streaming export tests."""
+import datetime
+import gzip
+import json
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.models import Food, Order, OrderDetails, SavedDaily, User
+
+
+class TestExport(BaseTestCase):
+    """GET /api/export/* tests."""
+
+    def setUp(self):
+        """Create a restaurant, two NPOs and their orders."""
+        self.app.config['EXPORT_CHUNK_ROWS'] = 2
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+                User(id=3, username='other', password=password,
+                     businessname='Pantry', location='Lund', user_type='npo'),
+            ])
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=0, users_id=1),
+                Food(id=2, food_name='bread', description='rye', quantity=0, users_id=1),
+            ])
+            db.session.add_all([
+                Order(id=1, user_id=2, date=datetime.datetime(2021, 3, 1, 12)),
+                Order(id=2, user_id=3, date=datetime.datetime(2021, 3, 2, 12)),
+                Order(id=3, user_id=2, date=datetime.datetime(2021, 3, 3, 12)),
+            ])
+            db.session.add_all([
+                OrderDetails(order_id=1, food_id=1, quantity=4),
+                OrderDetails(order_id=1, food_id=2, quantity=1),
+                OrderDetails(order_id=2, food_id=1, quantity=2),
+                OrderDetails(order_id=3, food_id=2, quantity=3),
+                SavedDaily(user_id=1, day=datetime.date(2021, 3, 1), quantity=5),
+                SavedDaily(user_id=1, day=datetime.date(2021, 3, 2), quantity=2),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        self.app.config['EXPORT_CHUNK_ROWS'] = 1000
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def login(self, username):
+        """Return a client logged in as username."""
+        client = self.app.test_client()
+        client.post('/login', data=dict(username=username, password='password'))
+        return client
+
+    def test_npo_orders_csv(self):
+        """An NPO gets its own order lines, streamed a chunk at a time."""
+        with self.context:
+            response = self.login('npo').get('/api/export/orders', buffered=False)
+            self.assertEqual(response.mimetype, 'text/csv')
+            self.assertIn('filename=orders.csv', response.headers['Content-Disposition'])
+            parts = list(response.response)
+            self.assertEqual(len(parts), 2)
+            lines = b''.join(parts).decode().splitlines()
+            self.assertEqual(lines, [
+                'order_id,date,food_id,food_name,quantity,restaurant,npo',
+                '1,2021-03-01T12:00:00,1,soup,4,Bistro,Shelter',
+                '1,2021-03-01T12:00:00,2,bread,1,Bistro,Shelter',
+                '3,2021-03-03T12:00:00,2,bread,3,Bistro,Shelter',
+            ])
+
+    def test_restaurant_orders_ndjson_gzip(self):
+        """A restaurant gets the lines of its food, gzipped when accepted."""
+        with self.context:
+            response = self.login('restaurant').get(
+                '/api/export/orders?format=ndjson', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            rows = [json.loads(line) for line in
+                    gzip.decompress(response.data).decode().splitlines()]
+            self.assertEqual([(row['order_id'], row['npo']) for row in rows],
+                             [(1, 'Shelter'), (1, 'Shelter'), (2, 'Pantry'), (3, 'Shelter')])
+
+    def test_saved_report(self):
+        """Restaurants download saved food per day; NPOs are refused."""
+        with self.context:
+            response = self.login('restaurant').get('/api/export/saved')
+            self.assertEqual(response.data.decode().splitlines(),
+                             ['day,quantity', '2021-03-01,5', '2021-03-02,2'])
+            self.assertEqual(self.login('npo').get('/api/export/saved').status_code, 403)
+            response = self.login('restaurant').get('/api/export/saved?format=xml')
+            self.assertEqual(response.status_code, 400)
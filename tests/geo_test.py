@@ -0,0 +1,107 @@
+"""Geocoding and proximity search tests."""
+import unittest
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.geo import distance_km, geocode, nearby_food
+from website.models import Food, User
+
+
+class TestGeocode(unittest.TestCase):
+    """Offline gazetteer tests."""
+
+    def test_names_are_normalised(self):
+        """Case, diacritics and a trailing country do not matter."""
+        self.assertEqual(geocode('Malmo'), geocode('Malmö'))
+        self.assertEqual(geocode('  LUND, Sweden'), geocode('lund'))
+        self.assertIsNone(geocode('Atlantis'))
+        self.assertIsNone(geocode(None))
+
+    def test_distance(self):
+        """Lund to Malmo is about 16 km as the crow flies."""
+        self.assertAlmostEqual(distance_km(*geocode('Lund') + geocode('Malmo')), 16, delta=1)
+
+
+class TestNearby(BaseTestCase):
+    """Nearest-first food search tests."""
+
+    def setUp(self):
+        """Create restaurants in three towns and an NPO in Lund."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='lund', password=password,
+                     businessname='Lund Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='malmo', password=password,
+                     businessname='Malmo Cafe', location='Malmö', user_type='restaurant'),
+                User(id=3, username='ystad', password=password,
+                     businessname='Ystad Deli', location='Ystad', user_type='restaurant'),
+                User(id=4, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+            ])
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=3, users_id=3),
+                Food(id=2, food_name='bread', description='rye', quantity=2, users_id=2),
+                Food(id=3, food_name='pie', description='apple', quantity=1, users_id=1),
+                Food(id=4, food_name='stew', description='gone', quantity=0, users_id=1),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def indexed(self):
+        """Return the restaurant ids in the R-tree."""
+        return [user_id for user_id, in db.session.execute(
+            text('SELECT id FROM user_location ORDER BY id'))]
+
+    def test_index_follows_users(self):
+        """Restaurants are indexed as they are created, moved and deleted."""
+        with self.context:
+            self.assertEqual(self.indexed(), [1, 2, 3])
+            user = User.query.get(3)
+            user.location = 'Atlantis'
+            db.session.commit()
+            self.assertIsNone(user.latitude)
+            self.assertEqual(self.indexed(), [1, 2])
+            db.session.delete(User.query.get(2))
+            db.session.commit()
+            self.assertEqual(self.indexed(), [1])
+
+    def test_nearest_first_within_radius(self):
+        """Food in stock comes nearest first and only within the radius."""
+        with self.context:
+            lat, lon = geocode('Lund')
+            self.assertEqual([row['id'] for row in nearby_food(lat, lon, 100, 10)], [3, 2, 1])
+            self.assertEqual([row['id'] for row in nearby_food(lat, lon, 20, 10)], [3, 2])
+            self.assertEqual([row['id'] for row in nearby_food(lat, lon, 100, 2)], [3, 2])
+
+    def test_radius_that_cannot_grow(self):
+        """A NaN radius ends the search instead of looping."""
+        with self.context:
+            self.assertEqual(nearby_food(55.6, 13.0, float('nan'), 10), [])
+
+    def test_api(self):
+        """The endpoint defaults to the user's location and checks its input."""
+        with self.context:
+            client = self.app.test_client()
+            client.post('/login', data=dict(username='npo', password='password'))
+
+            body = client.get('/api/food/nearby?km=20').get_json()
+            self.assertEqual([item['id'] for item in body['items']], [3, 2])
+            self.assertEqual(body['items'][0]['distance_km'], 0.0)
+            self.assertEqual(body['items'][1]['restaurant']['businessname'], 'Malmo Cafe')
+
+            body = client.get('/api/food/nearby?near=Ystad&km=5').get_json()
+            self.assertEqual([item['id'] for item in body['items']], [1])
+
+            for query in ('near=Atlantis', 'lat=55.7', 'lat=95&lon=13', 'km=nan', 'km=inf',
+                          'lat=nan&lon=13', 'lat=55.6&lon=inf'):
+                response = client.get('/api/food/nearby?' + query)
+                self.assertEqual(response.status_code, 400, query)
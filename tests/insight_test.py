@@ -0,0 +1,107 @@
+"""Insight analytics tests."""
+import datetime
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.insight import downsample, saved_series
+from website.migrations import backfill_saved_daily
+from website.models import Food, Order, OrderDetails, SavedDaily, User
+from website.orders import place_order
+from website.pagecache import page_cache
+
+
+def day(text):
+    """Parse a YYYY-MM-DD date."""
+    return datetime.date.fromisoformat(text)
+
+
+class TestInsight(BaseTestCase):
+    """Time-bucketed saved food tests."""
+
+    def setUp(self):
+        """Create a restaurant with orders on a few days."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+            ])
+            db.session.add(Food(id=1, food_name='soup', description='hot',
+                                quantity=100, users_id=1))
+            for order_id, (date, quantity) in enumerate([
+                    ('2021-03-01', 2), ('2021-03-01', 3), ('2021-03-07', 4),
+                    ('2021-03-08', 5), ('2021-05-20', 6)], start=1):
+                db.session.add(Order(id=order_id, user_id=2,
+                                     date=datetime.datetime.fromisoformat(date)))
+                db.session.add(OrderDetails(order_id=order_id, food_id=1, quantity=quantity))
+            db.session.commit()
+            backfill_saved_daily(db.session.connection())
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def test_buckets(self):
+        """Days group into Monday weeks and calendar months, gaps as zeros."""
+        with self.context:
+            self.assertEqual(saved_series(1, 'day', end=day('2021-03-08'))[:2],
+                             [(day('2021-03-01'), 5), (day('2021-03-02'), 0)])
+            weeks = saved_series(1, 'week')
+            self.assertEqual(weeks[:3], [(day('2021-03-01'), 9), (day('2021-03-08'), 5),
+                                         (day('2021-03-15'), 0)])
+            self.assertEqual(weeks[-1], (day('2021-05-17'), 6))
+            self.assertEqual(saved_series(1, 'month'), [
+                (day('2021-03-01'), 14), (day('2021-04-01'), 0), (day('2021-05-01'), 6)])
+            self.assertEqual(saved_series(1, 'month', start=day('2021-03-05')),
+                             [(day('2021-03-01'), 9), (day('2021-04-01'), 0),
+                              (day('2021-05-01'), 6)])
+            self.assertEqual(saved_series(2, 'day'), [])
+
+    def test_downsample_keeps_totals(self):
+        """Neighbouring buckets are summed down to the requested points."""
+        series = [(n, n) for n in range(10)]
+        self.assertEqual(downsample(series, 20), (series, 1))
+        merged, step = downsample(series, 4)
+        self.assertEqual(step, 3)
+        self.assertEqual(merged, [(0, 3), (3, 12), (6, 21), (9, 9)])
+
+    def test_orders_update_daily_rollup(self):
+        """Placing an order adds to today's row."""
+        with self.context:
+            place_order(2, {1: 7})
+            today = SavedDaily.query.get((1, datetime.date.today()))
+            self.assertEqual(today.quantity, 7)
+
+    def test_saved_api(self):
+        """The API validates its parameters and caches per restaurant."""
+        with self.context:
+            client = self.app.test_client()
+            client.post('/login', data=dict(username='restaurant', password='password'))
+            client.get('/insight')  # Shows the login flash; flashes skip the cache.
+
+            response = client.get('/api/insight/saved?bucket=day&points=10')
+            data = response.get_json()
+            self.assertEqual((data['step'], data['total']), (9, 20))
+            self.assertEqual(data['labels'][0], '2021-03-01')
+            self.assertEqual(len(data['values']), 9)
+
+            hits = page_cache.stats()['hits']
+            self.assertEqual(client.get('/api/insight/saved?bucket=day&points=10').get_json(),
+                             data)
+            self.assertEqual(page_cache.stats()['hits'], hits + 1)
+            self.assertEqual(client.get('/api/insight/saved?bucket=month').get_json()['values'],
+                             [14, 0, 6])
+
+            self.assertEqual(client.get('/api/insight/saved?bucket=year').status_code, 400)
+            self.assertEqual(client.get('/api/insight/saved?start=May').status_code, 400)
+
+            npo = self.app.test_client()
+            npo.post('/login', data=dict(username='npo', password='password'))
+            self.assertEqual(npo.get('/api/insight/saved').status_code, 403)
@@ -0,0 +1,130 @@
+"""Live inventory event tests."""
+from sqlalchemy import create_engine, text
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.live import broker, publish_deleted, publish_food
+from website.models import Food, FoodEvent, User
+
+
+class TestBroker(BaseTestCase):
+    """Event log tests."""
+
+    def setUp(self):
+        """Create food in two places and a small log."""
+        broker.configure(dict(LIVE_LOG_SIZE=3, LIVE_POLL_SECONDS=5))
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            db.session.add_all([
+                User(id=1, username='lund', password='x', businessname='Bistro',
+                     location='Lund', user_type='restaurant'),
+                User(id=2, username='ystad', password='x', businessname='Cafe',
+                     location='Ystad', user_type='restaurant'),
+            ])
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=5, users_id=1),
+                Food(id=2, food_name='bread', description='rye', quantity=5, users_id=2),
+            ])
+            db.session.commit()
+            _, self.start = broker.since(None)
+
+    def tearDown(self):
+        """Restore the log size and clean up the database."""
+        broker.configure(self.app.config)
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def test_locations(self):
+        """Clients hear about their location; deletes reach everyone."""
+        with self.context:
+            publish_food('add', [1, 2])
+            db.session.execute(text('DELETE FROM food WHERE id = 2'))
+            db.session.commit()
+            publish_deleted([2])
+
+            lund, cursor = broker.since(self.start, 'Lund')
+            self.assertEqual([(event['type'], event['id']) for event in lund],
+                             [('add', 1), ('delete', 2)])
+            ystad, _ = broker.since(self.start, 'Ystad')
+            self.assertEqual([event['id'] for event in ystad], [2])
+            self.assertEqual(broker.since(cursor, 'Lund'), ([], cursor))
+
+    def test_bursts_coalesce(self):
+        """Each food is returned once, in its current state."""
+        with self.context:
+            for quantity in (4, 3):
+                Food.query.get(1).quantity = quantity
+                db.session.commit()
+                publish_food('quantity', [1])
+            events, _ = broker.since(self.start)
+            self.assertEqual([(event['id'], event['quantity']) for event in events], [(1, 3)])
+
+    def test_events_of_other_processes(self):
+        """Events written through another connection are seen too."""
+        with self.context:
+            engine = create_engine(db.engine.url)
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "INSERT INTO food_event (food_id, kind) VALUES (2, 'quantity')"))
+            engine.dispose()
+            events, _ = broker.since(self.start)
+            self.assertEqual([event['id'] for event in events], [2])
+
+    def test_old_and_unknown_cursors(self):
+        """Cursors older than the log reset; unknown ones start over."""
+        with self.context:
+            publish_food('quantity', [1, 2, 1, 2])
+            self.assertEqual(broker.since(self.start)[0], [dict(type='reset')])
+            self.assertEqual(broker.since('99'), ([], '4'))
+            self.assertEqual(broker.since('x'), ([], '4'))
+            self.assertEqual(FoodEvent.query.count(), 3)
+
+
+class TestEventPolling(BaseTestCase):
+    """GET /api/events tests."""
+
+    def setUp(self):
+        """Create a restaurant with food and an NPO."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+            ])
+            db.session.add(Food(id=1, food_name='soup', description='hot',
+                                quantity=10, users_id=1))
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def login(self, username):
+        """Return a client logged in as username."""
+        client = self.app.test_client()
+        client.post('/login', data=dict(username=username, password='password'))
+        return client
+
+    def test_order_is_polled(self):
+        """Stock taken by an order is returned by the next poll."""
+        with self.context:
+            client = self.login('npo')
+            body = client.get('/api/events?location=Lund').get_json()
+            self.assertEqual((body['events'], body['poll']), ([], 5))
+
+            self.login('npo').post('/order', json=[{'id': 1, 'quantity': 4}])
+
+            response = client.get('/api/events?location=Lund&after=' + body['cursor'])
+            self.assertEqual(response.headers['Cache-Control'], 'no-store')
+            events = response.get_json()['events']
+            self.assertEqual([(event['type'], event['id'], event['quantity'])
+                              for event in events], [('quantity', 1, 6)])
+            self.assertNotEqual(response.get_json()['cursor'], body['cursor'])
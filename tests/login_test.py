@@ -1,7 +1,9 @@
 """Login test module."""
+from unittest import mock
 from flask.globals import request
 from website import db
 from website.models import User
+from website.passwords import HashingBusy, hasher
 from flask_login import current_user
 from werkzeug.security import generate_password_hash
 from tests.base_test import BaseTestCase
@@ -159,3 +161,35 @@ class TestLogin(BaseTestCase):
                 client.get('/logout', follow_redirects=True)
 
                 self.assertFalse(current_user.is_authenticated)
+
+    def test_login_rehashes_legacy_password(self):
+        """Legacy password hash is upgraded on successful login."""
+        with self.context:
+            db.session.add(self.test_user)
+            db.session.commit()
+
+            self.client.post('/login',
+                             follow_redirects=True,
+                             data=dict(
+                                 username=self.test_user.username,
+                                 password='password')
+                             )
+
+            user = User.query.filter_by(username='username').first()
+            method = self.app.config['PASSWORD_HASH_METHOD']
+            self.assertTrue(user.password.startswith(method + '$'))
+
+    def test_login_when_rehash_is_busy(self):
+        """A verified login goes ahead with the old hash when rehashing is busy."""
+        with self.context:
+            db.session.add(self.test_user)
+            db.session.commit()
+            legacy = self.test_user.password
+
+            with mock.patch.object(hasher, 'hash', side_effect=HashingBusy()):
+                with self.client as client:
+                    client.post('/login', data=dict(username='username', password='password'))
+                    self.assertTrue(current_user.is_authenticated)
+
+            self.assertEqual(User.query.filter_by(username='username').first().password,
+                             legacy)
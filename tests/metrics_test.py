@@ -0,0 +1,126 @@
+"""Prometheus metrics tests."""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from website import create_app, db
+from website.config import TestSettings
+from website.metrics import DURATION, IN_FLIGHT, REQUESTS, metrics
+from website.passwords import hasher
+
+
+class TestMetrics(unittest.TestCase):
+    """Request instrumentation and /metrics tests."""
+
+    def setUp(self):
+        """Create an app with the tables in place."""
+        self.app = create_app(TestSettings)
+        self.client = self.app.test_client()
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def scrape(self):
+        """Return the /metrics lines."""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        return response.get_data(as_text=True).splitlines()
+
+    def test_request_metrics(self):
+        """Requests are counted and timed per endpoint and status."""
+        self.client.get('/about')
+        self.client.get('/about')
+        self.client.get('/no/such/page')
+        lines = self.scrape()
+
+        self.assertIn('http_requests_total{endpoint="views.about",method="GET",status="200"} 2',
+                      lines)
+        self.assertIn('http_requests_total{endpoint="unmatched",method="GET",status="404"} 1',
+                      lines)
+        self.assertIn('http_request_duration_seconds_bucket'
+                      '{endpoint="views.about",status="200",le="+Inf"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count'
+                      '{endpoint="views.about",status="200"} 2', lines)
+        self.assertIn('http_requests_in_flight{endpoint="metrics.export"} 1', lines)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('cache_hit_ratio{cache="page"} 0.5', lines)
+
+    def test_password_hashing(self):
+        """Hashing time, queue wait and pending hashes are exported."""
+        with self.app.app_context():
+            hasher.verify(hasher.hash('secret'), 'secret')
+            stats = hasher.stats()
+        values = dict(line.split() for line in self.scrape() if line.startswith('password_'))
+
+        self.assertEqual(float(values['password_hash_operations_total{operation="hash"}']),
+                         stats['hash']['count'])
+        self.assertEqual(float(values['password_hash_seconds_total{operation="verify"}']),
+                         stats['verify']['total'])
+        self.assertEqual(float(values['password_hash_wait_seconds_total{operation="verify"}']),
+                         stats['verify']['wait'])
+        self.assertGreaterEqual(stats['verify']['wait_max'], 0)
+        self.assertEqual(values['password_hash_pending'], '0')
+
+    def test_striped_counts_add_up(self):
+        """Counts from many threads are all kept."""
+        def work():
+            for _ in range(1000):
+                metrics.add(REQUESTS, ('x',))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self.app.app_context():
+            self.assertEqual(metrics.snapshot()['counters'][REQUESTS][('x',)], 8000)
+
+    def test_threads_use_different_stripes(self):
+        """Threads are spread over the stripes."""
+        stripes = []
+        threads = [threading.Thread(target=lambda: stripes.append(metrics.stripe()))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertIsNot(stripes[0], stripes[1])
+
+    def test_overhead(self):
+        """Recording a request costs a few microseconds."""
+        start = time.perf_counter()
+        for _ in range(10000):
+            metrics.request_started('views.about')
+            metrics.request_finished('views.about', 'GET', 200, 0.01)
+        self.assertLess((time.perf_counter() - start) / 10000, 20e-6)
+
+    def test_aggregates_worker_snapshots(self):
+        """Snapshots of other workers are summed; dead workers' gauges are not."""
+        folder = tempfile.mkdtemp()
+        try:
+            self.app.config['METRICS_DIR'] = folder
+            metrics.configure(self.app.config)
+            dead = dict(counters={REQUESTS: [[['views.about', 'GET', 200], 5]]},
+                        histograms={DURATION: []},
+                        gauges={IN_FLIGHT: [[['views.about'], 3]]})
+            with open(os.path.join(folder, '999999999.json'), 'w') as output:
+                json.dump(dead, output)
+
+            self.client.get('/about')
+            lines = self.scrape()
+            self.assertIn('http_requests_total{endpoint="views.about",method="GET",status="200"} 6',
+                          lines)
+            self.assertIn('http_requests_in_flight{endpoint="views.about"} 0', lines)
+            self.assertIn('{}.json'.format(os.getpid()), os.listdir(folder))
+        finally:
+            metrics.configure(dict())
+            shutil.rmtree(folder)
@@ -0,0 +1,93 @@
+"""Schema migration tests."""
+import os
+import tempfile
+from sqlalchemy import create_engine, inspect
+from tests.base_test import BaseTestCase
+from website import migrations
+
+
+LEGACY_SCHEMA = [
+    """CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(25),
+        password VARCHAR(30), businessname VARCHAR(45), location VARCHAR(30),
+        user_type VARCHAR(30))""",
+    """CREATE TABLE food (id INTEGER PRIMARY KEY, food_name VARCHAR(25),
+        description VARCHAR(25), quantity INTEGER, users_id INTEGER)""",
+    """CREATE TABLE "order" (id INTEGER PRIMARY KEY, user_id INTEGER,
+        date DATETIME NOT NULL)""",
+    """CREATE TABLE order_details (food_id INTEGER, order_id INTEGER,
+        quantity INTEGER NOT NULL, PRIMARY KEY (food_id, order_id))""",
+    "INSERT INTO user VALUES (1, 'r', 'x', 'R', 'Lund', 'restaurant')",
+    "INSERT INTO food VALUES (1, 'soup', 'hot', 3, 1)",
+    """INSERT INTO "order" VALUES (1, 2, '2021-01-01 00:00:00')""",
+    """INSERT INTO "order" VALUES (2, 2, '2021-01-02 00:00:00')""",
+    "INSERT INTO order_details VALUES (1, 1, 4)",
+    "INSERT INTO order_details VALUES (1, 2, 5)",
+]
+
+
+class TestMigrations(BaseTestCase):
+    """Migration runner tests."""
+
+    def setUp(self):
+        """Create an empty database file."""
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = create_engine('sqlite:///' + self.path)
+
+    def tearDown(self):
+        """Remove the database file."""
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def version(self):
+        """Return the stamped schema version."""
+        with self.engine.connect() as connection:
+            return migrations.current_version(connection)
+
+    def test_fresh_database_is_stamped(self):
+        """A new database is created at head without running migrations."""
+        self.assertEqual(migrations.upgrade(self.engine), [])
+        self.assertEqual(self.version(), migrations.head())
+
+        indexes = [index['name'] for index in inspect(self.engine).get_indexes('food')]
+        self.assertIn('ix_food_users_id', indexes)
+
+    def test_existing_database_is_migrated(self):
+        """Pending migrations run once against an existing database."""
+        with self.engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.exec_driver_sql(statement)
+
+        applied = migrations.upgrade(self.engine)
+
+        self.assertEqual([number for number, _ in applied], [1, 2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(migrations.upgrade(self.engine), [])
+        with self.engine.connect() as connection:
+            saved = connection.exec_driver_sql(
+                'SELECT user_id, food_id, quantity FROM saved_total').all()
+        self.assertEqual(saved, [(1, 1, 9)])
+        indexes = [index['name'] for index in inspect(self.engine).get_indexes('order')]
+        self.assertIn('ix_order_date', indexes)
+        with self.engine.connect() as connection:
+            located = connection.exec_driver_sql(
+                'SELECT id, round(min_lat, 1), round(min_lon, 1) FROM user_location').all()
+        self.assertEqual(located, [(1, 55.7, 13.2)])
+
+    def test_failed_migration_rolls_back(self):
+        """A failing migration leaves the database as it was."""
+        with self.engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.exec_driver_sql(statement)
+
+        def broken(connection):
+            raise RuntimeError('broken')
+
+        migrations.MIGRATIONS.append((999, 'broken', broken))
+        try:
+            with self.assertRaises(RuntimeError):
+                migrations.upgrade(self.engine)
+        finally:
+            migrations.MIGRATIONS.pop()
+
+        self.assertEqual(self.version(), 0)
+        self.assertFalse(inspect(self.engine).has_table('saved_total'))
@@ -0,0 +1,91 @@
+"""Order queue tests."""
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.models import Food, Order, QueuedOrder, SavedTotal, User
+from website.orderqueue import enqueue, process_batch
+
+
+class TestOrderQueue(BaseTestCase):
+    """Queued order and worker batch tests."""
+
+    def setUp(self):
+        """Create a restaurant with food and two NPOs."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            password = generate_password_hash('password', 'sha256')
+            db.session.add_all([
+                User(id=1, username='restaurant', password=password,
+                     businessname='Bistro', location='Lund', user_type='restaurant'),
+                User(id=2, username='npo', password=password,
+                     businessname='Shelter', location='Lund', user_type='npo'),
+                User(id=3, username='other', password=password,
+                     businessname='Pantry', location='Lund', user_type='npo'),
+            ])
+            db.session.add_all([
+                Food(id=1, food_name='soup', description='hot', quantity=10, users_id=1),
+                Food(id=2, food_name='bread', description='rye', quantity=5, users_id=1),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        self.app.config['ORDER_QUEUE'] = False
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def login(self, username):
+        """Return a client logged in as username."""
+        client = self.app.test_client()
+        client.post('/login', data=dict(username=username, password='password'))
+        return client
+
+    def test_order_is_queued_and_polled(self):
+        """/order answers 202 and the status URL follows the worker."""
+        self.app.config['ORDER_QUEUE'] = True
+        with self.context:
+            client = self.login('npo')
+            response = client.post('/order', json=[{'id': 1, 'quantity': 4}])
+            self.assertEqual(response.status_code, 202)
+            url = response.get_json()['status_url']
+            self.assertTrue(response.headers['Location'].endswith(url))
+            self.assertEqual(client.get(url).get_json()['status'], 'queued')
+            self.assertEqual(Food.query.get(1).quantity, 10)
+            self.assertEqual(self.login('other').get(url).status_code, 404)
+
+            self.assertEqual(process_batch(10), 1)
+            self.assertEqual(process_batch(10), 0)
+
+            status = client.get(url).get_json()
+            self.assertEqual(status['status'], 'done')
+            self.assertEqual(Order.query.get(status['order_id']).user_id, 2)
+            self.assertEqual(Food.query.get(1).quantity, 6)
+
+    def test_failed_order_does_not_undo_its_batch(self):
+        """Orders short of stock fail on their own within a batch."""
+        with self.context:
+            first = enqueue(2, {1: 6}).id
+            short = enqueue(3, {1: 6, 2: 1}).id
+            unknown = enqueue(3, {9: 1}).id
+            last = enqueue(3, {2: 5}).id
+
+            self.assertEqual(process_batch(10), 4)
+
+            statuses = {entry.id: entry.status for entry in QueuedOrder.query}
+            self.assertEqual(statuses, {first: 'done', short: 'failed',
+                                        unknown: 'failed', last: 'done'})
+            self.assertIn('Not enough stock', QueuedOrder.query.get(short).error)
+            self.assertEqual(Order.query.count(), 2)
+            self.assertEqual([Food.query.get(1).quantity, Food.query.get(2).quantity], [4, 0])
+            self.assertEqual(SavedTotal.query.get((1, 2)).quantity, 5)
+
+    def test_batches_are_oldest_first(self):
+        """A worker takes at most a batch, oldest orders first."""
+        with self.context:
+            ids = [enqueue(2, {1: 1}).id for _ in range(3)]
+            self.assertEqual(process_batch(2), 2)
+            self.assertEqual(
+                [entry.id for entry in QueuedOrder.query.filter_by(status='queued')],
+                ids[2:])
@@ -0,0 +1,66 @@
+"""Rendered page cache tests."""
+from tests.base_test import BaseTestCase
+from website.models import User
+from website.pagecache import PageCache, page_cache
+from werkzeug.security import generate_password_hash
+from website import db
+
+
+class TestPageCache(BaseTestCase):
+    """Page cache tests."""
+
+    def setUp(self):
+        """Create a restaurant and an empty cache."""
+        with self.app.app_context() as context:
+            self.context = context
+            self.client = self.app.test_client()
+            db.create_all()
+            db.session.add(User(username='username',
+                                password=generate_password_hash('password', 'sha256'),
+                                businessname='testbusiness',
+                                location='Sweden',
+                                user_type='restaurant'))
+            db.session.commit()
+            page_cache.clear()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def test_public_page_cached_with_etag(self):
+        """Public pages are rendered once and revalidate with 304."""
+        first = self.client.get('/about')
+        second = self.client.get('/about')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(page_cache.stats()['hits'], 1)
+
+        response = self.client.get(
+            '/about', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_dashboard_invalidated_by_add(self):
+        """Adding food re-renders the restaurant dashboard."""
+        with self.context:
+            self.client.post('/login', follow_redirects=True,
+                             data=dict(username='username', password='password'))
+            self.client.get('/username')
+            self.client.get('/username')
+            self.assertEqual(page_cache.stats()['hits'], 1)
+
+            self.client.post('/username', data=dict(
+                food_name='fresh soup', description='desc', quantity=3))
+            response = self.client.get('/username')
+            self.assertTrue(b'fresh soup' in response.data)
+
+    def test_size_cap_evicts_least_recent(self):
+        """Least recently used pages are evicted past the byte cap."""
+        cache = PageCache(max_bytes=10)
+        cache.put('a', 'public', b'12345', 'text/html')
+        cache.put('b', 'public', b'12345', 'text/html')
+        cache.get('a')
+        cache.put('c', 'public', b'12345', 'text/html')
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['bytes'], 10)
@@ -0,0 +1,78 @@
+"""Password hashing service tests."""
+import threading
+from tests.base_test import BaseTestCase
+from website.passwords import HashingBusy, PasswordHasher
+
+
+class TestPasswordHasher(BaseTestCase):
+    """Password hasher tests."""
+
+    def setUp(self):
+        """Create a hasher with a single worker and no queue."""
+        self.hasher = PasswordHasher()
+        self.hasher.configure(dict(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0))
+
+    def test_hash_and_verify(self):
+        """Hashes use the configured method and verify."""
+        with self.app.app_context():
+            pwhash = self.hasher.hash('secret')
+            self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+            self.assertTrue(self.hasher.verify(pwhash, 'secret'))
+            self.assertFalse(self.hasher.verify(pwhash, 'wrong'))
+            self.assertFalse(self.hasher.needs_rehash(pwhash))
+            self.assertTrue(self.hasher.needs_rehash('sha256$salt$hash'))
+            self.assertEqual(self.hasher.stats()['verify']['count'], 2)
+
+    def test_busy_pool(self):
+        """Work is refused when every slot is taken."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def wait():
+            started.set()
+            release.wait()
+
+        def block():
+            # Giving up waiting does not free the slot until wait() returns.
+            with self.app.app_context():
+                with self.assertRaises(HashingBusy):
+                    self.hasher._run('block', wait)
+
+        timeout = self.app.config['PASSWORD_HASH_TIMEOUT']
+        self.app.config['PASSWORD_HASH_TIMEOUT'] = 0.05
+        blocker = threading.Thread(target=block)
+        blocker.start()
+        started.wait()
+        try:
+            with self.app.app_context():
+                with self.assertRaises(HashingBusy):
+                    self.hasher.hash('secret')
+        finally:
+            self.app.config['PASSWORD_HASH_TIMEOUT'] = timeout
+            release.set()
+            blocker.join()
+
+    def test_configure_while_busy(self):
+        """Work running during a reconfigure gives its slot back to its own pool."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def wait():
+            started.set()
+            release.wait()
+
+        def block():
+            with self.app.app_context():
+                self.hasher._run('block', wait)
+
+        blocker = threading.Thread(target=block)
+        blocker.start()
+        started.wait()
+        self.assertTrue(self.hasher.saturated())
+        self.hasher.configure(dict(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0))
+        self.assertFalse(self.hasher.saturated())
+        release.set()
+        blocker.join()
+        self.assertFalse(self.hasher.saturated())
+        with self.app.app_context():
+            self.assertTrue(self.hasher.verify(self.hasher.hash('secret'), 'secret'))
@@ -0,0 +1,79 @@
+"""SQL profiling middleware tests."""
+import os
+import shutil
+import tempfile
+import unittest
+from website import create_app, db
+from website.config import TestSettings
+from website.models import Food, User
+from website.profiling import statement_shape
+
+
+class ProfilingSettings(TestSettings):
+    """Test settings with profiling on and every request sampled."""
+
+    SQL_PROFILING = True
+    SQL_PROFILE_REPEATS = 3
+    SQL_PROFILE_SAMPLE_RATE = 1.0
+
+
+class TestProfiling(unittest.TestCase):
+    """Query recording, N+1 detection and cProfile sampling tests."""
+
+    def setUp(self):
+        """Create a profiled app with a restaurant offering a few foods."""
+        self.folder = tempfile.mkdtemp()
+        self.app = create_app(ProfilingSettings)
+        self.app.config['SQL_PROFILE_DIR'] = self.folder
+
+        @self.app.route('/lazy')
+        def lazy():
+            # Loads each food's restaurant with its own query.
+            return ','.join(food.user.businessname for food in Food.query.all())
+
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            for n in range(3):
+                user = User(username='user%d' % n, password='x',
+                            businessname='business%d' % n, location='Lund',
+                            user_type='restaurant')
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(Food(food_name='soup', description='hot',
+                                    quantity=1, users_id=user.id))
+            db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Clean up the database and the profiles."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+        shutil.rmtree(self.folder)
+
+    def test_statement_shape(self):
+        """Values and IN lists do not change a statement's shape."""
+        self.assertEqual(
+            statement_shape("SELECT *\n FROM t WHERE id IN (?, ?, ?) AND n = 'a' AND m = 5"),
+            'SELECT * FROM t WHERE id IN (?) AND n = ? AND m = ?')
+
+    def test_server_timing_and_n_plus_one(self):
+        """Each response reports its queries; repeated shapes are flagged."""
+        with self.assertLogs(self.app.logger, 'INFO') as logs:
+            response = self.client.get('/lazy')
+        timing = response.headers.getlist('Server-Timing')
+        self.assertRegex(timing[0], r'^db;dur=[0-9.]+;desc="4 queries"$')
+        self.assertTrue(timing[1].startswith('app;dur='))
+
+        findings = self.app.extensions['sql_profiling'].n_plus_one['lazy']
+        self.assertEqual(list(findings.values()), [3])
+        self.assertTrue(any('Possible N+1' in line for line in logs.output))
+        self.assertTrue(any('"queries": 4' in line for line in logs.output))
+
+    def test_sampled_cprofile(self):
+        """Sampled requests leave a cProfile dump behind."""
+        self.client.get('/about')
+        profiles = os.listdir(self.folder)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].startswith('views-about-'))
@@ -0,0 +1,118 @@
+"""Rate limiting and load shedding tests."""
+import unittest
+from werkzeug.security import generate_password_hash
+from tests.base_test import BaseTestCase
+from website import db
+from website.models import User
+from website.ratelimit import BucketTable, RateLimiter, limiter
+
+
+class TestBuckets(unittest.TestCase):
+    """Token bucket tests."""
+
+    def test_tokens_refill(self):
+        """A bucket allows its burst, then one request per refill."""
+        buckets = BucketTable()
+        self.assertEqual([buckets.take('a', 2, 0.5, now=0) for _ in range(3)], [0, 0, 2.0])
+        self.assertEqual(buckets.take('b', 2, 0.5, now=0), 0)
+        self.assertEqual(buckets.take('a', 2, 0.5, now=1), 1.0)
+        self.assertEqual(buckets.take('a', 2, 0.5, now=2), 0)
+        self.assertEqual(buckets.take('a', 2, 0.5, now=100), 0)
+        self.assertEqual(buckets.take('a', 2, 0.5, now=100), 0)
+
+    def test_size_is_bounded(self):
+        """Least recently used buckets are forgotten beyond the limit."""
+        buckets = BucketTable(max_keys=32)
+        for key in range(1000):
+            buckets.take(key, 1, 1, now=0)
+        self.assertLessEqual(len(buckets), 32)
+
+    def test_limits_per_kind(self):
+        """A request waits for the emptiest of its buckets."""
+        limiter = RateLimiter()
+        limiter.configure(dict(RATE_LIMITING=True, RATE_LIMITS={
+            'login': dict(ip=(10, 10), user=(1, 10))}))
+        self.assertEqual(limiter.check('login', dict(ip='a', user='u'), now=0), 0)
+        self.assertEqual(limiter.check('login', dict(ip='a', user='u'), now=0), 10)
+        self.assertEqual(limiter.check('login', dict(ip='a', user='v'), now=0), 0)
+        self.assertEqual(limiter.check('login', dict(ip='a', user=None), now=0), 0)
+        self.assertEqual(limiter.check('other', dict(ip='a', user='u'), now=0), 0)
+
+    def test_refusal_spends_nothing(self):
+        """A request refused by one bucket leaves its other buckets alone."""
+        limiter = RateLimiter()
+        limiter.configure(dict(RATE_LIMITING=True, RATE_LIMITS={
+            'login': dict(ip=(2, 10), user=(1, 10))}))
+        self.assertEqual(limiter.check('login', dict(ip='a', user='u'), now=0), 0)
+        for _ in range(5):
+            self.assertEqual(limiter.check('login', dict(ip='a', user='u'), now=0), 10)
+        self.assertEqual(limiter.check('login', dict(ip='a', user='v'), now=0), 0)
+        self.assertEqual(limiter.check('login', dict(ip='a', user='w'), now=0), 5)
+
+    def test_inflight_cap(self):
+        """Only max_inflight requests are admitted at once."""
+        limiter = RateLimiter()
+        limiter.configure(dict(RATE_LIMIT_MAX_INFLIGHT=1))
+        self.assertTrue(limiter.admit())
+        self.assertFalse(limiter.admit())
+        limiter.release()
+        self.assertTrue(limiter.admit())
+
+
+class TestAdmission(BaseTestCase):
+    """Limits applied to requests."""
+
+    def setUp(self):
+        """Turn limiting on and create a user."""
+        self.app.config['RATE_LIMITING'] = True
+        self.app.config['RATE_LIMITS'] = {
+            'auth.login_post': dict(ip=(100, 60), user=(2, 60)),
+            'views.create_order': dict(user=(1, 60)),
+        }
+        limiter.configure(self.app.config)
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            db.session.add(User(id=1, username='npo',
+                                password=generate_password_hash('password', 'sha256'),
+                                businessname='Shelter', location='Lund', user_type='npo'))
+            db.session.commit()
+
+    def tearDown(self):
+        """Turn limiting off again and clean up the database."""
+        self.app.config['RATE_LIMITING'] = False
+        limiter.configure(self.app.config)
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def test_login_attempts_per_account(self):
+        """Guessing one account's password is cut off with 429."""
+        with self.context:
+            client = self.app.test_client()
+            for _ in range(2):
+                response = client.post('/login', data=dict(username='npo', password='guess'))
+                self.assertEqual(response.status_code, 302)
+            response = client.post('/login', data=dict(username='NPO', password='password'))
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '30')
+            response = client.post('/login', data=dict(username='other', password='x'))
+            self.assertEqual(response.status_code, 302)
+
+    def test_orders_per_user_and_shedding(self):
+        """Orders are limited per user and shed when too many are running."""
+        with self.context:
+            client = self.app.test_client()
+            client.post('/login', data=dict(username='npo', password='password'))
+            self.assertEqual(client.post('/order', json=[]).status_code, 400)
+            response = client.post('/order', json=[])
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.get_json()['status'], 'error')
+
+            limiter.configure(dict(self.app.config, RATE_LIMIT_MAX_INFLIGHT=1))
+            limiter.admit()
+            response = client.post('/order', json=[])
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            limiter.release()
+            self.assertEqual(limiter.inflight, 0)
@@ -0,0 +1,82 @@
+"""Food search index tests."""
+from tests.base_test import BaseTestCase
+from website.models import Food, User
+from website.search import match_expression, search_food
+from website import db
+
+
+class TestSearch(BaseTestCase):
+    """Full-text food search tests."""
+
+    def setUp(self):
+        """Create a restaurant with a few foods."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            self.restaurant = User(username='username',
+                                   password='password',
+                                   businessname='Green Bistro',
+                                   location='Stockholm',
+                                   user_type='restaurant')
+            db.session.add(self.restaurant)
+            db.session.commit()
+            db.session.add_all([
+                Food(food_name='Tomato soup', description='vegan',
+                     quantity=5, users_id=self.restaurant.id),
+                Food(food_name='Bread', description='tomato bread',
+                     quantity=5, users_id=self.restaurant.id),
+                Food(food_name='Tomato salad', description='fresh',
+                     quantity=0, users_id=self.restaurant.id),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+
+    def names(self, tag, **kwargs):
+        """Return the food names found for tag."""
+        rows, _ = search_food(tag, **kwargs)
+        return [row.food_name for row in rows]
+
+    def test_match_expression(self):
+        """User input becomes quoted prefix terms."""
+        self.assertEqual(match_expression('tom "x'), '"tom"* """x"*')
+        self.assertEqual(match_expression('   '), '')
+
+    def test_ranked_available_results(self):
+        """Name matches rank first and sold-out food is left out."""
+        with self.context:
+            self.assertEqual(self.names('tomato'), ['Tomato soup', 'Bread'])
+
+    def test_search_by_restaurant_and_location(self):
+        """Business name and location are searchable."""
+        with self.context:
+            self.assertEqual(len(self.names('bistro')), 2)
+            self.assertEqual(len(self.names('stock')), 2)
+
+    def test_index_follows_changes(self):
+        """Updates and deletes are reflected in the index."""
+        with self.context:
+            soup = Food.query.filter_by(food_name='Tomato soup').first()
+            soup.food_name = 'Pea soup'
+            restaurant = User.query.filter_by(username='username').first()
+            restaurant.location = 'Uppsala'
+            db.session.commit()
+            self.assertEqual(self.names('pea uppsala'), ['Pea soup'])
+
+            db.session.delete(soup)
+            db.session.commit()
+            self.assertEqual(self.names('soup'), [])
+
+    def test_pagination(self):
+        """Results are split into pages."""
+        with self.context:
+            rows, has_next = search_food('bistro', per_page=1)
+            self.assertEqual(len(rows), 1)
+            self.assertTrue(has_next)
+            rows, has_next = search_food('bistro', page=2, per_page=1)
+            self.assertEqual(len(rows), 1)
+            self.assertFalse(has_next)
@@ -0,0 +1,76 @@
+"""User loader cache tests."""
+from unittest import mock
+from tests.base_test import BaseTestCase
+from website.models import User
+from website.usercache import UserCache, user_cache
+from website import db
+
+
+class TestUserCache(BaseTestCase):
+    """Cached Flask-Login user loader tests."""
+
+    def setUp(self):
+        """Create two users and an empty cache."""
+        with self.app.app_context() as context:
+            self.context = context
+            db.create_all()
+            db.session.add_all([
+                User(id=1, username='one', password='x', businessname='One',
+                     location='Lund', user_type='restaurant'),
+                User(id=2, username='two', password='x', businessname='Two',
+                     location='Malmo', user_type='npo'),
+            ])
+            db.session.commit()
+            user_cache.clear()
+
+    def tearDown(self):
+        """Clean up the database."""
+        with self.context:
+            db.drop_all()
+            db.session.remove()
+            user_cache.clear()
+
+    def test_hits_and_misses(self):
+        """Repeated loads are served from the cache."""
+        with self.context:
+            self.assertEqual(user_cache.get(1).username, 'one')
+            self.assertEqual(user_cache.get(1).username, 'one')
+            self.assertIsNone(user_cache.get(3))
+            self.assertEqual(user_cache.stats(), dict(hits=1, misses=2, size=1))
+
+    def test_commit_invalidates(self):
+        """Committing a change to a user drops the cached record."""
+        with self.context:
+            user_cache.get(1)
+            User.query.get(1).location = 'Uppsala'
+            db.session.commit()
+            self.assertEqual(user_cache.get(1).location, 'Uppsala')
+
+    def test_rollback_keeps_entry(self):
+        """Rolled back changes do not invalidate."""
+        with self.context:
+            user_cache.get(1)
+            User.query.get(1).location = 'Uppsala'
+            db.session.flush()
+            db.session.rollback()
+            user_cache.get(1)
+            self.assertEqual(user_cache.stats()['hits'], 1)
+
+    def test_lru_eviction(self):
+        """Least recently used users are evicted past maxsize."""
+        cache = UserCache(maxsize=1)
+        with self.context:
+            cache.get(1)
+            cache.get(2)
+            cache.get(1)
+            self.assertEqual(cache.stats(), dict(hits=0, misses=3, size=1))
+
+    def test_ttl_expiry(self):
+        """Entries are reloaded once their time to live has passed."""
+        cache = UserCache(ttl=10)
+        with self.context:
+            with mock.patch('website.usercache.time.monotonic', return_value=0):
+                cache.get(1)
+            with mock.patch('website.usercache.time.monotonic', return_value=11):
+                cache.get(1)
+            self.assertEqual(cache.stats()['misses'], 2)
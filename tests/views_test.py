@@ -1,7 +1,7 @@
 """View routes."""
 from flask.globals import request
 from tests.base_test import BaseTestCase
-from website.models import Food, Order, OrderDetails, User
+from website.models import Food, Order, OrderDetails, SavedTotal, User
 from flask_login import current_user
 from werkzeug.security import generate_password_hash
 from website import db
@@ -79,6 +79,8 @@ class TestViewRoutes(BaseTestCase):
         """Food item can be deleted from restaurant page."""
         with self.context:
             db.session.add(self.test_user)
+            db.session.commit()
+            self.test_food.users_id = self.test_user.id
             db.session.add(self.test_food)
             db.session.commit()
             with self.client as client:
@@ -231,6 +233,8 @@ class TestViewRoutes(BaseTestCase):
         """Correct flash message displayed on update."""
         with self.context:
             db.session.add(self.test_user)
+            db.session.commit()
+            self.test_food.users_id = self.test_user.id
             db.session.add(self.test_food)
             db.session.commit()
             with self.client as client:
@@ -389,6 +393,29 @@ class TestViewRoutes(BaseTestCase):
                 )
                 self.assertTrue(b"Not found" in response.data)
 
+    def test_npo_search_not_found_lists_food(self):
+        """The catalogue is still listed when a search finds nothing."""
+        with self.context:
+            db.session.add(self.test_user)
+            db.session.add(self.npo_user)
+            db.session.commit()
+            self.test_food.users_id = self.test_user.id
+            db.session.add(self.test_food)
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.npo_user.username,
+                        password='password'
+                    )
+                )
+                response = client.get('/search?tag=nothing&page=0')
+
+                self.assertTrue(b"Not found" in response.data)
+                self.assertTrue(b"<td>desc</td>" in response.data)
+
     def test_npo_search_no_tag(self):
         """Check message is displayed when tag is none."""
         with self.context:
@@ -441,3 +468,169 @@ class TestViewRoutes(BaseTestCase):
                 )
 
             self.assertEqual(response.status_code, 200)
+
+    def test_create_order_updates_saved_total(self):
+        """Ordering food adds to the restaurant's saved total."""
+        with self.context:
+            db.session.add(self.test_user)
+            db.session.add(self.npo_user)
+            db.session.commit()
+            self.test_food.users_id = self.test_user.id
+            db.session.add(self.test_food)
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.npo_user.username,
+                        password='password'
+                    )
+                )
+
+                for quantity in (2, 3):
+                    client.post(
+                        '/order',
+                        data=json.dumps([{"id": 1, "quantity": quantity}]),
+                        content_type='application/json'
+                    )
+
+                saved = SavedTotal.query.filter_by(
+                    user_id=self.test_user.id, food_id=1).first()
+                self.assertEqual(saved.quantity, 5)
+
+    def test_insight_shows_saved_totals(self):
+        """Insight page loads the totals saved per food name from the API."""
+        with self.context:
+            db.session.add(self.test_user)
+            db.session.commit()
+            self.test_food.users_id = self.test_user.id
+            db.session.add(self.test_food)
+            db.session.add(SavedTotal(user_id=self.test_user.id, food_id=1, quantity=7))
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.test_user.username,
+                        password='password'
+                    )
+                )
+
+                response = client.get('/insight')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(b"/api/insight/foods" in response.data)
+                response = client.get('/api/insight/foods')
+                self.assertEqual(response.get_json(), dict(labels=['name'], values=[7]))
+
+    def test_create_order_returns_order_id(self):
+        """Order endpoint responds with the id of the new order."""
+        with self.context:
+            db.session.add(self.npo_user)
+            db.session.add(self.test_food)
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.npo_user.username,
+                        password='password'
+                    )
+                )
+
+                response = client.post(
+                    '/order',
+                    data=json.dumps([{"id": 1, "quantity": 4}]),
+                    content_type='application/json'
+                )
+
+                order = Order.query.filter_by(user_id=self.npo_user.id).first()
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(response.get_json()['order_id'], order.id)
+                self.assertEqual(Food.query.get(1).quantity, 6)
+
+    def test_create_order_cannot_oversell(self):
+        """Order for more than the stock is refused and nothing is written."""
+        with self.context:
+            db.session.add(self.npo_user)
+            db.session.add(self.test_food)
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.npo_user.username,
+                        password='password'
+                    )
+                )
+
+                response = client.post(
+                    '/order',
+                    data=json.dumps([{"id": 1, "quantity": 11}]),
+                    content_type='application/json'
+                )
+
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.get_json()['items'], [1])
+                self.assertEqual(Order.query.count(), 0)
+                self.assertEqual(OrderDetails.query.count(), 0)
+                self.assertEqual(Food.query.get(1).quantity, 10)
+
+    def test_create_order_invalid_payload(self):
+        """Malformed order payload is rejected."""
+        with self.context:
+            db.session.add(self.npo_user)
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.npo_user.username,
+                        password='password'
+                    )
+                )
+
+                response = client.post(
+                    '/order',
+                    data=json.dumps([{"id": "x"}]),
+                    content_type='application/json'
+                )
+
+                self.assertEqual(response.status_code, 400)
+
+    def test_npo_dashboard_lists_food_and_history(self):
+        """NPO dashboard shows owner details and resolved order history."""
+        with self.context:
+            db.session.add(self.test_user)
+            db.session.add(self.npo_user)
+            db.session.commit()
+            self.test_food.users_id = self.test_user.id
+            db.session.add(self.test_food)
+            db.session.add(Food(food_name='gone', description='desc',
+                                quantity=0, users_id=self.test_user.id))
+            db.session.commit()
+            with self.client as client:
+                client.post(
+                    '/login',
+                    follow_redirects=True,
+                    data=dict(
+                        username=self.npo_user.username,
+                        password='password'
+                    )
+                )
+                client.post(
+                    '/order',
+                    data=json.dumps([{"id": 1, "quantity": 3}]),
+                    content_type='application/json'
+                )
+
+                response = client.get(f'/{self.npo_user.username}')
+
+                self.assertTrue(b'<td>testbusiness</td>' in response.data)
+                self.assertFalse(b'<td>gone</td>' in response.data)
+                self.assertTrue(b'3Kg' in response.data)
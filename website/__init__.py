@@ -1,70 +1,114 @@
 """Application initialisation module."""
-from flask import Flask
-from website.config import DevSettings, TestSettings
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
-from os import path
 
 
-db = SQLAlchemy()
+def __getattr__(name):
+    """Create the SQLAlchemy extension, ``db``, when it is first imported.
 
+    Picking settings from website.config then imports no third-party code.
+    """
+    if name != 'db':
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    global db
+    from flask_sqlalchemy import SQLAlchemy
+    db = SQLAlchemy()
+    return db
 
-def create_app():
-    """Create Application object instance."""
+
+def create_app(settings=None):
+    """Create Application object instance.
+
+    settings is a configuration object; by default the one FLASK_ENV
+    names. Extensions and blueprints are imported here rather than at
+    module level so importing the package stays cheap.
+    """
+    from flask import Flask
+    from . import db
+    from .config import settings_from_env
     app = Flask(__name__)
-    app.config.from_object(DevSettings)
+    app.config.from_object(settings or settings_from_env())
+    # Without one, logins would only fail once the first user signs in.
+    if app.config.get('FLASK_ENV') == 'production' and not app.config.get('SECRET_KEY'):
+        raise RuntimeError('SECRET_KEY must be set in the environment in production.')
 
     db.init_app(app)
 
+    from .database import configure_engine, report_settings
+    configure_engine(app)
+
+    from .profiling import init_profiling
+    init_profiling(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
+    from flask_login import LoginManager
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
-    from .models import User
+    from .usercache import user_cache
+    user_cache.configure(app.config)
+
+    from .passwords import hasher
+    hasher.configure(app.config)
+
+    from .ratelimit import init_ratelimit
+    init_ratelimit(app)
+
+    from .pagecache import page_cache
+    page_cache.configure(app.config)
+
+    from .assets import init_assets
+    init_assets(app)
+
+    from .cart import init_cart
+    init_cart(app)
+
+    from .live import broker
+    broker.configure(app.config)
+
+    from .orderqueue import init_queue
+    init_queue(app)
 
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(int(id))
+        return user_cache.get(int(id))
 
     from website.auth import auth
     from website.views import views
+    from website.api import api
 
     app.register_blueprint(auth, url_prefix='/')
     app.register_blueprint(views, url_prefix='/')
+    app.register_blueprint(api, url_prefix='/api')
 
-    create_table(app)
+    from website.migrations import migrate_command
+    from website.assets import assets_command
+    from website.seed import seed_command
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(assets_command)
+    app.cli.add_command(seed_command)
+
+    # Tests build and drop their own tables.
+    if not app.config.get('TESTING'):
+        create_table(app)
+        report_settings(app)
 
     return app
 
 
 def create_table(app):
-    """Create database tables."""
-    if not path.exists('website/' + DevSettings.SQLALCHEMY_DATABASE_URI):
-        db.create_all(app=app)
-        print('Created Database!')
+    """Create or migrate the database unless its schema stamp is current."""
+    from . import db
+    from .migrations import needs_upgrade, upgrade
+    with app.app_context():
+        if not needs_upgrade(db.engine):
+            return
+        upgrade(db.engine)
+    print('Created Database!')
 
 
 def create_test_app():
     """Create test application instance."""
-    app = Flask(__name__)
-    app.config.from_object(TestSettings)
-
-    db.init_app(app)
-
-    login_manager = LoginManager()
-    login_manager.login_view = 'auth.login'
-    login_manager.init_app(app)
-
-    from .models import User
-
-    @login_manager.user_loader
-    def load_user(id):
-        return User.query.get(int(id))
-
-    from website.auth import auth
-    from website.views import views
-
-    app.register_blueprint(auth, url_prefix='/')
-    app.register_blueprint(views, url_prefix='/')
-
-    return app
+    from .config import TestSettings
+    return create_app(TestSettings)
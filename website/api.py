@@ -0,0 +1,311 @@
+"""JSON API routes module."""
+import datetime
+import math
+import os
+import time
+from calendar import timegm
+from flask import Blueprint, current_app, request, jsonify, url_for
+from flask_login import current_user, login_required
+from werkzeug.http import http_date
+from . import db
+from .bulk import READERS, ChangeError, RowError, apply_changes, import_food, parse_changes
+from .catalogue import current_version
+from .export import FORMATS, ORDER_COLUMNS, SAVED_COLUMNS, export, order_lines, saved_days
+from .geo import geocode, nearby_food
+from .insight import BUCKETS, downsample, saved_series, saved_totals
+from .inventory import available_food
+from .live import broker
+from .models import Food, User
+from .pagecache import cached_page, restaurant_page
+
+
+api = Blueprint('api', __name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+DEFAULT_POINTS = 120
+MAX_POINTS = 1000
+DEFAULT_KM = 10.0
+MAX_KM = 500.0
+IMPORT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson',
+                'application/jsonl': 'ndjson'}
+
+
+def not_modified(etag, modified):
+    """Check the request's validators against the catalogue version.
+
+    If-None-Match, when sent, is the only validator checked.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return timegm(request.if_modified_since.utctimetuple()) >= modified
+    return False
+
+
+def last_modified(modified, now=None):
+    """Return the Last-Modified to send for a catalogue changed at modified.
+
+    Whole seconds cannot tell a change later in the current second from
+    one before this response. Until that second is over, the previous
+    one is sent instead, so the next If-Modified-Since gets a full reply.
+    """
+    now = time.time() if now is None else now
+    return min(modified, int(now) - 1)
+
+
+def add_validators(response, etag, modified):
+    """Attach the caching headers every food API response carries."""
+    response.set_etag(etag)
+    response.headers['Last-Modified'] = http_date(last_modified(modified))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@api.route('/food')
+@login_required
+def food():
+    """List available food, one keyset page at a time.
+
+    Query parameters: after (last id of the previous page), limit,
+    restaurant (user id) and location (exact match).
+    """
+    version, modified = current_version()
+    etag = 'v{}'.format(version)
+    if not_modified(etag, modified):
+        return add_validators(current_app.response_class(status=304), etag, modified)
+
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    restaurant = request.args.get('restaurant', type=int)
+    location = request.args.get('location')
+
+    query = available_food().order_by(None).filter(Food.id > after)
+    if restaurant is not None:
+        query = query.filter(Food.users_id == restaurant)
+    if location:
+        query = query.filter(User.location == location)
+    rows = query.order_by(Food.id).limit(limit + 1).all()
+
+    items = [
+        dict(id=row.id,
+             food_name=row.food_name,
+             description=row.description,
+             quantity=row.quantity,
+             restaurant=dict(id=row.users_id,
+                             businessname=row.businessname,
+                             location=row.location))
+        for row in rows[:limit]
+    ]
+
+    next_url = None
+    if len(rows) > limit:
+        args = request.args.to_dict()
+        args['after'] = items[-1]['id']
+        next_url = url_for('api.food', **args)
+
+    response = jsonify(items=items, next=next_url, version=version)
+    return add_validators(response, etag, modified)
+
+
+@api.route('/food/import', methods=['POST'])
+@login_required
+def food_import():
+    """Add or update the current restaurant's food from a CSV or NDJSON file.
+
+    The file is the request body, or a multipart upload named file. Its
+    format comes from the format query parameter (csv or ndjson), else
+    the file name's extension, else the content type.
+    """
+    if current_user.user_type != 'restaurant':
+        return error('Only restaurants have inventory', 403)
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        kind = os.path.splitext(upload.filename or '')[1].lstrip('.').lower()
+        kind = kind if kind in READERS else IMPORT_TYPES.get(upload.mimetype)
+    else:
+        stream = request.stream
+        kind = IMPORT_TYPES.get(request.mimetype)
+    kind = request.args.get('format', kind)
+    if kind not in READERS:
+        return error('Upload CSV or NDJSON, or name it with format=csv or format=ndjson', 400)
+    try:
+        outcome = import_food(current_user.id, stream, kind,
+                              current_app.config['IMPORT_BATCH_SIZE'])
+    except RowError as failure:
+        return error(str(failure), 400)
+    return jsonify(outcome.to_dict())
+
+
+@api.route('/food/batch', methods=['POST'])
+@login_required
+def food_batch():
+    """Update and delete many of the current restaurant's food at once.
+
+    The JSON body is {"update": [{"id", "food_name", "description",
+    "quantity"}, ...], "delete": [id, ...]}; updates may leave fields
+    out. Either everything is applied or, on any error, nothing is.
+    """
+    if current_user.user_type != 'restaurant':
+        return error('Only restaurants have inventory', 403)
+    try:
+        changes, deletes = parse_changes(request.get_json(silent=True))
+        apply_changes(current_user.id, changes, deletes)
+    except ChangeError as failure:
+        return jsonify(failure.to_dict()), failure.status
+    return jsonify(status='done', updated=len(changes), deleted=len(deletes))
+
+
+def export_response(name, query, columns):
+    """Stream query's rows as the download name, in the requested format.
+
+    Query parameter: format, csv (the default) or ndjson. The body is
+    gzip-compressed when the client accepts it.
+    """
+    kind = request.args.get('format', 'csv')
+    if kind not in FORMATS:
+        return error('format must be one of {}'.format(', '.join(FORMATS)), 400)
+    compress = bool(request.accept_encodings['gzip'])
+    body = export(db.engine, query, columns, kind,
+                  current_app.config['EXPORT_CHUNK_ROWS'], gzip=compress)
+    response = current_app.response_class(body, mimetype=FORMATS[kind])
+    response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(name, kind)
+    response.headers['Cache-Control'] = 'private, no-store'
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@api.route('/export/orders')
+@login_required
+def export_orders():
+    """Download every order line the current user placed or received."""
+    return export_response('orders', order_lines(current_user), ORDER_COLUMNS)
+
+
+@api.route('/export/saved')
+@login_required
+def export_saved():
+    """Download the food the current restaurant saved, day by day."""
+    if current_user.user_type != 'restaurant':
+        return error('Only restaurants have saved food reports', 403)
+    return export_response('saved', saved_days(current_user.id), SAVED_COLUMNS)
+
+
+@api.route('/food/nearby')
+@login_required
+def food_nearby():
+    """List available food within a radius, nearest first.
+
+    Query parameters: lat and lon, or near (a place name), for the origin,
+    which defaults to the current user's location; km, the radius; and
+    limit.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    near = request.args.get('near')
+    if lat is not None and lon is not None:
+        origin = (lat, lon)
+    elif 'lat' in request.args or 'lon' in request.args:
+        return error('lat and lon must both be numbers', 400)
+    elif near:
+        origin = geocode(near)
+        if origin is None:
+            return error('Unknown place: {}'.format(near), 400)
+    elif current_user.latitude is not None:
+        origin = (current_user.latitude, current_user.longitude)
+    else:
+        return error('Give lat and lon or near; your location is unknown', 400)
+    if not (-90 <= origin[0] <= 90 and -180 <= origin[1] <= 180):
+        return error('lat and lon are out of range', 400)
+    km = request.args.get('km', DEFAULT_KM, type=float)
+    if km is None or not math.isfinite(km):
+        return error('km must be a number', 400)
+    km = min(max(km, 0.0), MAX_KM)
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+
+    items = [
+        dict(id=row['id'],
+             food_name=row['food_name'],
+             description=row['description'],
+             quantity=row['quantity'],
+             distance_km=row['distance_km'],
+             restaurant=dict(id=row['users_id'],
+                             businessname=row['businessname'],
+                             location=row['location']))
+        for row in nearby_food(origin[0], origin[1], km, limit)
+    ]
+    return jsonify(items=items, origin=dict(lat=origin[0], lon=origin[1]), km=km)
+
+
+@api.route('/events')
+@login_required
+def events():
+    """Return food changes after a cursor, for polling.
+
+    Query parameters: after, the cursor of the last poll, and location,
+    to only hear about food offered there. Deletes are sent regardless
+    of location. Without a cursor only the current one is returned.
+    """
+    changes, cursor = broker.since(request.args.get('after'),
+                                   request.args.get('location') or None)
+    response = jsonify(events=changes, cursor=cursor, poll=broker.poll_seconds)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def error(message, status):
+    """Return a JSON error response."""
+    response = jsonify(status='error', error=message)
+    response.status_code = status
+    return response
+
+
+def date_arg(name):
+    """Parse an optional YYYY-MM-DD query parameter; raise ValueError if bad."""
+    value = request.args.get(name)
+    return datetime.date.fromisoformat(value) if value else None
+
+
+@api.route('/insight/foods')
+@login_required
+@cached_page(restaurant_page)
+def insight_foods():
+    """Total food saved per food name for the current restaurant."""
+    if current_user.user_type != 'restaurant':
+        return error('Only restaurants have insight', 403)
+    data = saved_totals(current_user.id)
+    return jsonify(labels=[name for name, _ in data],
+                   values=[quantity for _, quantity in data])
+
+
+@api.route('/insight/saved')
+@login_required
+@cached_page(restaurant_page)
+def insight_saved():
+    """Food saved by the current restaurant over time.
+
+    Query parameters: bucket (day, week or month), start and end
+    (inclusive YYYY-MM-DD dates) and points, the most points to return;
+    longer series are downsampled by summing neighbouring buckets.
+    """
+    if current_user.user_type != 'restaurant':
+        return error('Only restaurants have insight', 403)
+    bucket = request.args.get('bucket', 'week')
+    if bucket not in BUCKETS:
+        return error('bucket must be one of {}'.format(', '.join(BUCKETS)), 400)
+    try:
+        start, end = date_arg('start'), date_arg('end')
+    except ValueError:
+        return error('start and end must be YYYY-MM-DD dates', 400)
+    points = min(max(request.args.get('points', DEFAULT_POINTS, type=int), 1), MAX_POINTS)
+
+    series, step = downsample(saved_series(current_user.id, bucket, start, end), points)
+    return jsonify(
+        bucket=bucket,
+        step=step,
+        labels=[day.isoformat() for day, _ in series],
+        values=[quantity for _, quantity in series],
+        total=sum(quantity for _, quantity in series))
@@ -0,0 +1,240 @@
+"""Static asset pipeline.
+
+At startup every file under the static folder is content-hashed and
+``url_for('static', ...)`` starts returning fingerprinted URLs such as
+``/static/main.1a2b3c4d5e6f.css``. Those URLs never change content, so
+they are served with a one year ``immutable`` cache lifetime. Files with
+identical content share one URL.
+
+Text assets get a precompressed gzip variant at startup. ``flask assets``
+additionally writes downscaled and WebP versions of large images when
+Pillow is installed. Variants are chosen per request from the
+Accept-Encoding and Accept headers.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import click
+from flask import current_app, request, send_file
+from flask.cli import with_appcontext
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; images are then served as they are.
+    Image = None
+
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+RESIZABLE = {'.png', '.jpg', '.jpeg'}
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+class Asset(object):
+    """One distinct static file and its prebuilt variants."""
+
+    def __init__(self, logical, source, digest):
+        """Describe the file at source, served under a fingerprinted URL."""
+        stem, ext = posixpath.splitext(logical)
+        self.source = source
+        self.digest = digest
+        self.ext = ext.lower()
+        self.url = '{}.{}{}'.format(stem, digest, ext)
+        self.variants = dict()
+
+
+class Manifest(object):
+    """Maps logical static filenames and fingerprinted URLs to assets."""
+
+    def __init__(self):
+        """Create an empty manifest."""
+        self.assets = dict()
+        self.urls = dict()
+
+    def add(self, logical, asset):
+        """Register logical as a name for asset."""
+        self.assets[logical] = asset
+        self.urls[asset.url] = asset
+
+
+def static_files(static_folder):
+    """List static files as posix paths relative to the folder, CSS last."""
+    files = []
+    for root, _, names in os.walk(static_folder):
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), static_folder)
+            files.append(path.replace(os.sep, '/'))
+    # Stylesheets refer to other assets, which must be fingerprinted first.
+    return sorted(files, key=lambda name: (name.endswith('.css'), name))
+
+
+def rewrite_css(data, logical, manifest):
+    """Point url() references in a stylesheet at fingerprinted files."""
+    base = posixpath.dirname(logical)
+
+    def replace(match):
+        target = match.group(2)
+        if ':' in target or target.startswith('/'):
+            return match.group(0)
+        asset = manifest.assets.get(posixpath.normpath(posixpath.join(base, target)))
+        if asset is None:
+            return match.group(0)
+        return "url('{}')".format(posixpath.relpath(asset.url, base or '.'))
+
+    return CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def write_gzip(asset, data, build_dir):
+    """Write a gzip variant of a text asset unless it does not help."""
+    path = os.path.join(build_dir, asset.digest + asset.ext + '.gz')
+    if not os.path.exists(path):
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) >= len(data):
+            return
+        with open(path, 'wb') as output:
+            output.write(compressed)
+    asset.variants['gzip'] = path
+
+
+def write_images(asset, build_dir, max_width, quality, create):
+    """Record, and with create also write, resized and WebP variants."""
+    resized = os.path.join(build_dir, '{}.w{}{}'.format(asset.digest, max_width, asset.ext))
+    webp = os.path.join(build_dir, '{}.w{}.webp'.format(asset.digest, max_width))
+    if create and Image is not None and not os.path.exists(webp):
+        with Image.open(asset.source) as image:
+            if image.mode == 'P':
+                image = image.convert('RGBA')
+            if image.width > max_width:
+                height = round(image.height * max_width / image.width)
+                image = image.resize((max_width, height), Image.LANCZOS)
+                save_format = 'JPEG' if asset.ext in ('.jpg', '.jpeg') else 'PNG'
+                image.save(resized, save_format, quality=quality, optimize=True)
+            image.save(webp, 'WEBP', quality=quality, method=6)
+
+    original = os.path.getsize(asset.source)
+    if os.path.exists(resized) and os.path.getsize(resized) < original:
+        asset.variants['resized'] = resized
+        original = os.path.getsize(resized)
+    if os.path.exists(webp) and os.path.getsize(webp) < original:
+        asset.variants['webp'] = webp
+
+
+def build_manifest(static_folder, build_dir, max_width=1280, quality=80, images=False):
+    """Fingerprint the static folder and attach the prebuilt variants."""
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = Manifest()
+    by_digest = dict()
+    for logical in static_files(static_folder):
+        source = os.path.join(static_folder, *logical.split('/'))
+        with open(source, 'rb') as handle:
+            data = handle.read()
+        if logical.endswith('.css'):
+            data = rewrite_css(data, logical, manifest)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+
+        if digest in by_digest:
+            manifest.add(logical, by_digest[digest])
+            continue
+
+        asset = Asset(logical, source, digest)
+        if logical.endswith('.css'):
+            asset.source = os.path.join(build_dir, digest + '.css')
+            if not os.path.exists(asset.source):
+                with open(asset.source, 'wb') as output:
+                    output.write(data)
+        if asset.ext in COMPRESSIBLE:
+            write_gzip(asset, data, build_dir)
+        if asset.ext in RESIZABLE:
+            write_images(asset, build_dir, max_width, quality, images)
+
+        by_digest[digest] = asset
+        manifest.add(logical, asset)
+    return manifest
+
+
+def accepts_webp():
+    """Tell whether the client explicitly lists WebP as acceptable."""
+    return any(value == 'image/webp' and quality > 0
+               for value, quality in request.accept_mimetypes)
+
+
+def serve_static(filename):
+    """Serve a fingerprinted asset, or fall back to the plain static view."""
+    asset = current_app.extensions['assets'].urls.get(filename)
+    if asset is None:
+        return current_app.send_static_file(filename)
+
+    path = asset.source
+    mimetype = None
+    encoding = None
+    if 'webp' in asset.variants and accepts_webp():
+        path = asset.variants['webp']
+        mimetype = 'image/webp'
+    elif 'resized' in asset.variants:
+        path = asset.variants['resized']
+    if 'gzip' in asset.variants and request.accept_encodings['gzip']:
+        path = asset.variants['gzip']
+        encoding = 'gzip'
+
+    response = send_file(
+        path,
+        mimetype=mimetype or mimetypes.guess_type(filename)[0],
+        conditional=True,
+        cache_timeout=ONE_YEAR)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if 'gzip' in asset.variants:
+        response.vary.add('Accept-Encoding')
+    if 'webp' in asset.variants:
+        response.vary.add('Accept')
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(ONE_YEAR)
+    return response
+
+
+def fingerprint_url(endpoint, values):
+    """Swap static filenames for their fingerprinted URLs in url_for."""
+    if endpoint == 'static' and 'filename' in values:
+        asset = current_app.extensions['assets'].assets.get(values['filename'])
+        if asset is not None:
+            values['filename'] = asset.url
+
+
+def build_dir(app):
+    """Return where built variants are kept."""
+    return app.config.get('ASSET_BUILD_DIR') or os.path.join(app.instance_path, 'assets')
+
+
+def init_assets(app, images=False):
+    """Fingerprint static files and serve them through the pipeline."""
+    if not app.config.get('ASSET_PIPELINE'):
+        return None
+    manifest = build_manifest(
+        app.static_folder,
+        build_dir(app),
+        max_width=app.config.get('ASSET_IMAGE_MAX_WIDTH', 1280),
+        quality=app.config.get('ASSET_IMAGE_QUALITY', 80),
+        images=images)
+    if 'assets' not in app.extensions:
+        app.url_defaults(fingerprint_url)
+        app.view_functions['static'] = serve_static
+    app.extensions['assets'] = manifest
+    return manifest
+
+
+@click.command('assets')
+@with_appcontext
+def assets_command():
+    """Build gzip, resized and WebP variants of the static files."""
+    if Image is None:
+        click.echo('Pillow is not installed; skipping image variants.')
+    manifest = init_assets(current_app, images=True)
+    if manifest is None:
+        click.echo('ASSET_PIPELINE is disabled.')
+        return
+    distinct = set(manifest.urls.values())
+    variants = sum(len(asset.variants) for asset in distinct)
+    click.echo('Fingerprinted {} files ({} distinct), {} variants in {}.'.format(
+        len(manifest.assets), len(distinct), variants, build_dir(current_app)))
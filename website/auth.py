@@ -1,9 +1,9 @@
 """Auth routes module."""
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
 from .models import User
+from .passwords import HashingBusy, hasher
 
 
 auth = Blueprint('auth', __name__)
@@ -50,12 +50,31 @@ def login_post():
     # If no user was found or the password was incorrect create error message
     # and redirect to the login page to display it.
     # status_code 401: Unauthorized
-    if not user or not check_password_hash(user.password, password):
+    try:
+        verified = user is not None and hasher.verify(user.password, password)
+    except HashingBusy:
+        flash('Too many login attempts, please try again shortly!', category='error')
+        return redirect(
+            url_for('auth.login',
+                    user=current_user))
+
+    if not verified:
         flash('Incorrect username or password!', category='error')
         return redirect(
             url_for('auth.login',
                     user=current_user))
 
+    # Upgrade hashes made with older or cheaper settings while the
+    # plain text password is at hand. A busy pool just leaves it for the
+    # next login.
+    if hasher.needs_rehash(user.password):
+        try:
+            user.password = hasher.hash(password)
+        except HashingBusy:
+            pass
+        else:
+            db.session.commit()
+
     # If the above block didnt run, there is a user with the correct
     # credentials. Log the user in and create success message.
 
@@ -97,8 +116,15 @@ def signup_post():
         else:
             msg = 'Account created!'
             # Create the new user object
+            try:
+                pwhash = hasher.hash(password)
+            except HashingBusy:
+                flash('Too many sign ups, please try again shortly!', category='error')
+                return redirect(
+                    url_for('auth.signup',
+                            user=current_user))
             user = User(username=username,
-                        password=generate_password_hash(password, method='sha256'),
+                        password=pwhash,
                         businessname=businessname,
                         location=location,
                         user_type=user_type)
@@ -0,0 +1,295 @@
+"""Bulk changes to a restaurant's inventory.
+
+An import reads CSV or NDJSON rows with food_name, description, quantity
+and an optional id, validating each row as it is read. Rows with an id
+update that food; rows without one update the restaurant's food of the
+same name, or add it. Valid rows are written IMPORT_BATCH_SIZE at a time,
+each batch in its own transaction, so an import holds one batch in
+memory however long the file is, and a bad row is reported by line
+without holding up the rest.
+
+Each batch is written with one INSERT and one UPDATE reading the rows
+from a JSON array parameter. The search and catalogue triggers then run
+inside a single statement per batch, which SQLite does several times
+faster than one statement per row.
+
+A change set edits and deletes many of a restaurant's food at once, all
+or nothing, in the same set-based way. Food of other restaurants is
+never touched; naming it fails the whole change set.
+"""
+import codecs
+import csv
+import json
+from sqlalchemy import func, text
+from . import db, live
+from .catalogue import BUMP
+from .models import Food
+from .pagecache import page_cache, restaurant_scope
+
+
+FIELDS = ('food_name', 'description', 'quantity')
+NAME_LENGTH = Food.__table__.c.food_name.type.length
+DESCRIPTION_LENGTH = Food.__table__.c.description.type.length
+MAX_ERRORS = 100
+
+# :rows is a JSON array of [id, food_name, description, quantity] arrays.
+INCOMING = """SELECT json_extract(value, '$[0]') AS id,
+        json_extract(value, '$[1]') AS food_name,
+        json_extract(value, '$[2]') AS description,
+        json_extract(value, '$[3]') AS quantity
+    FROM json_each(:rows)"""
+
+INSERT = text("""INSERT INTO food (id, food_name, description, quantity, users_id)
+    SELECT id, food_name, description, quantity, :user_id FROM ({})""".format(INCOMING))
+
+UPDATE = text("""UPDATE food SET food_name = incoming.food_name,
+        description = incoming.description, quantity = incoming.quantity
+    FROM ({}) AS incoming WHERE food.id = incoming.id""".format(INCOMING))
+
+
+# Fields a change leaves out are NULL and keep their value.
+CHANGE = text("""UPDATE food SET food_name = coalesce(changes.food_name, food.food_name),
+        description = coalesce(changes.description, food.description),
+        quantity = coalesce(changes.quantity, food.quantity)
+    FROM ({}) AS changes
+    WHERE food.id = changes.id AND food.users_id = :user_id""".format(INCOMING))
+
+# Holds go first, so no cart is left holding food that is gone.
+RELEASE = text("""DELETE FROM reservation
+    WHERE food_id IN (SELECT value FROM json_each(:ids))""")
+
+DELETE = text("""DELETE FROM food
+    WHERE users_id = :user_id AND id IN (SELECT value FROM json_each(:ids))""")
+
+
+class RowError(ValueError):
+    """Raised for a row that cannot be imported."""
+
+
+class ChangeError(Exception):
+    """Raised when a change set cannot be applied."""
+
+    def __init__(self, message, status=400, items=None):
+        """Keep the HTTP status and the offending food ids."""
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.items = items or []
+
+    def to_dict(self):
+        """Format the error as a JSON response body."""
+        return dict(status='error', error=self.message, items=self.items)
+
+
+def validate(row, partial=False):
+    """Return a clean {id, food_name, description, quantity} from a parsed row.
+
+    With partial, fields missing from the row are None instead of an error.
+    """
+    if not isinstance(row, dict):
+        raise RowError('Row must be an object')
+    clean = dict(id=None, food_name=None, description=None, quantity=None)
+    if not partial or row.get('food_name') is not None:
+        clean['food_name'] = str(row.get('food_name') or '').strip()
+        if not clean['food_name']:
+            raise RowError('food_name is required')
+        if len(clean['food_name']) > NAME_LENGTH:
+            raise RowError('food_name is longer than {} characters'.format(NAME_LENGTH))
+    if not partial or row.get('description') is not None:
+        clean['description'] = str(row.get('description') or '').strip()
+        if len(clean['description']) > DESCRIPTION_LENGTH:
+            raise RowError(
+                'description is longer than {} characters'.format(DESCRIPTION_LENGTH))
+    try:
+        if not partial or row.get('quantity') not in (None, ''):
+            clean['quantity'] = int(row.get('quantity'))
+        if row.get('id') not in (None, ''):
+            clean['id'] = int(row['id'])
+    except (TypeError, ValueError):
+        raise RowError('quantity and id must be integers')
+    if clean['quantity'] is not None and clean['quantity'] < 0:
+        raise RowError('quantity must not be negative')
+    return clean
+
+
+def read_csv(stream):
+    """Yield (line number, parsed row or RowError) from a CSV byte stream."""
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    if reader.fieldnames is None or not set(FIELDS) <= set(reader.fieldnames):
+        raise RowError('CSV header must name {}'.format(', '.join(FIELDS)))
+    for row in reader:
+        yield reader.line_num, (RowError('Too many fields') if None in row else row)
+
+
+def read_ndjson(stream):
+    """Yield (line number, parsed row or RowError) from an NDJSON byte stream."""
+    for number, line in enumerate(codecs.iterdecode(stream, 'utf-8-sig'), 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, RowError('Not valid JSON')
+
+
+READERS = dict(csv=read_csv, ndjson=read_ndjson)
+
+
+class Import(object):
+    """Counts and the first MAX_ERRORS row errors of one import."""
+
+    def __init__(self):
+        """Start with nothing imported."""
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, line, message):
+        """Record a row that was not imported."""
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(dict(line=line, error=message))
+
+    def to_dict(self):
+        """Format the outcome as a JSON response body."""
+        return dict(status='done' if not self.failed else 'partial',
+                    inserted=self.inserted, updated=self.updated, failed=self.failed,
+                    errors=self.errors, more_errors=self.failed > len(self.errors))
+
+
+def write_batch(user_id, batch, outcome):
+    """Upsert one batch of (line, row) pairs for the restaurant and commit."""
+    # Bumping first takes the write lock, so the ids handed out below and
+    # the names looked up stay the restaurant's until the commit.
+    db.session.execute(text(BUMP))
+    owned = {food_id for food_id, in db.session.query(Food.id).filter(
+        Food.users_id == user_id,
+        Food.id.in_({row['id'] for _, row in batch if row['id'] is not None}))}
+    named = dict(db.session.query(Food.food_name, func.min(Food.id)).filter(
+        Food.users_id == user_id,
+        Food.food_name.in_({row['food_name'] for _, row in batch if row['id'] is None}))
+        .group_by(Food.food_name))
+    next_id = first_new = (db.session.query(func.max(Food.id)).scalar() or 0) + 1
+
+    updates, inserts = dict(), dict()
+    for line, row in batch:
+        if row['id'] is not None and row['id'] not in owned:
+            outcome.fail(line, 'No food {} of yours'.format(row['id']))
+            continue
+        food_id = row['id'] or named.get(row['food_name'])
+        if food_id is None:
+            # The name's next row in this batch updates the food just added.
+            food_id = named[row['food_name']] = next_id
+            next_id += 1
+        values = [food_id, row['food_name'], row['description'], row['quantity']]
+        if food_id >= first_new:
+            inserts[food_id] = values
+        else:
+            updates[food_id] = values
+
+    if updates:
+        db.session.execute(UPDATE, dict(rows=json.dumps(list(updates.values()))))
+    if inserts:
+        db.session.execute(INSERT, dict(rows=json.dumps(list(inserts.values())),
+                                        user_id=user_id))
+    db.session.commit()
+    outcome.inserted += len(inserts)
+    outcome.updated += len(updates)
+    page_cache.invalidate(restaurant_scope(user_id), 'catalogue')
+    live.publish_food(live.ADD, list(inserts))
+    live.publish_food(live.UPDATE, list(updates))
+
+
+def import_food(user_id, stream, kind, batch_size):
+    """Import the food in a CSV or NDJSON byte stream for the restaurant.
+
+    Returns the Import outcome. Raises RowError if the file as a whole
+    cannot be read; batches written before then stay written.
+    """
+    outcome = Import()
+    batch = []
+    try:
+        for line, row in READERS[kind](stream):
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                batch.append((line, validate(row)))
+            except RowError as error:
+                outcome.fail(line, str(error))
+                continue
+            if len(batch) >= batch_size:
+                write_batch(user_id, batch, outcome)
+                batch = []
+    except UnicodeDecodeError:
+        if batch:
+            write_batch(user_id, batch, outcome)
+        raise RowError('File is not UTF-8 text; {} rows were imported before it'.format(
+            outcome.inserted + outcome.updated))
+    if batch:
+        write_batch(user_id, batch, outcome)
+    return outcome
+
+
+def parse_changes(payload):
+    """Validate a change set into ({food_id: fields}, [food_id to delete]).
+
+    The payload is {"update": [{"id": ..., "quantity": ...}, ...],
+    "delete": [id, ...]}; an update may give any of food_name,
+    description and quantity.
+    """
+    if not isinstance(payload, dict):
+        raise ChangeError('Changes must be an object with update and delete lists')
+    updates, deletes = payload.get('update') or [], payload.get('delete') or []
+    if not isinstance(updates, list) or not isinstance(deletes, list) \
+            or not (updates or deletes):
+        raise ChangeError('Give a non-empty update or delete list')
+
+    changes = dict()
+    for item in updates:
+        try:
+            fields = validate(item, partial=True)
+        except RowError as error:
+            food_id = item.get('id') if isinstance(item, dict) else None
+            raise ChangeError(str(error), items=[food_id] if food_id is not None else [])
+        if fields['id'] is None:
+            raise ChangeError('Each update needs an id')
+        merged = changes.setdefault(fields['id'], dict(food_name=None, description=None,
+                                                       quantity=None))
+        merged.update((key, value) for key, value in fields.items()
+                      if key != 'id' and value is not None)
+    try:
+        deleted = sorted({int(food_id) for food_id in deletes})
+    except (TypeError, ValueError):
+        raise ChangeError('Deletes must be a list of integer ids')
+    both = sorted(set(changes) & set(deleted))
+    if both:
+        raise ChangeError('Food cannot be both updated and deleted', items=both)
+    return changes, deleted
+
+
+def apply_changes(user_id, changes, deletes):
+    """Apply updates and deletes to the restaurant's food in one transaction.
+
+    Raises ChangeError with status 404 listing food the restaurant does
+    not have; nothing changes in that case.
+    """
+    db.session.execute(text(BUMP))
+    wanted = set(changes) | set(deletes)
+    owned = {food_id for food_id, in db.session.query(Food.id).filter(
+        Food.users_id == user_id, Food.id.in_(wanted))}
+    missing = sorted(wanted - owned)
+    if missing:
+        db.session.rollback()
+        raise ChangeError('No such food of yours', status=404, items=missing)
+
+    if changes:
+        db.session.execute(CHANGE, dict(user_id=user_id, rows=json.dumps([
+            [food_id, fields['food_name'], fields['description'], fields['quantity']]
+            for food_id, fields in changes.items()])))
+    if deletes:
+        db.session.execute(RELEASE, dict(ids=json.dumps(deletes)))
+        db.session.execute(DELETE, dict(user_id=user_id, ids=json.dumps(deletes)))
+    db.session.commit()
+    page_cache.invalidate(restaurant_scope(user_id), 'catalogue')
+    live.publish_food(live.UPDATE, list(changes))
+    live.publish_deleted(deletes)
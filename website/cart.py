@@ -0,0 +1,225 @@
+"""Server-side carts holding stock for NPO users.
+
+Adding food to a cart places a hold: a reservation row that stops other
+users from ordering or holding that stock, without touching
+``Food.quantity``. Dashboards show the quantity left after all holds.
+Every change to a cart renews all of its holds for CART_HOLD_SECONDS.
+
+A background sweeper deletes expired holds in batches. Holds count until
+they are swept, so what a cached page shows never drifts from what can
+be ordered. Checkout turns the user's holds into an order; their stock
+is already set aside, so it does not race other buyers for it.
+"""
+import logging
+import threading
+import time
+from sqlalchemy import column, text
+from . import db, live
+from .catalogue import BUMP
+from .models import Food, Reservation, User
+from .orders import OrderError, write_order
+from .pagecache import page_cache, restaurant_scope
+
+
+logger = logging.getLogger(__name__)
+
+reservation = Reservation.__table__
+
+# Inserts a hold, or adds to an existing one, only if that much stock is
+# neither ordered nor held yet. Matches no row when it is not.
+HOLD = text("""INSERT INTO reservation (user_id, food_id, quantity, expires)
+    SELECT :user_id, food.id, :quantity, :expires FROM food
+    WHERE food.id = :food_id
+      AND food.quantity - COALESCE(
+          (SELECT SUM(quantity) FROM reservation WHERE food_id = food.id), 0) >= :quantity
+    ON CONFLICT (user_id, food_id) DO UPDATE
+    SET quantity = quantity + excluded.quantity, expires = excluded.expires""")
+
+RENEW = text('UPDATE reservation SET expires = :expires WHERE user_id = :user_id')
+
+# Holds on food that has since been deleted hold nothing.
+ORPHANED = text("""DELETE FROM reservation WHERE user_id = :user_id
+    AND NOT EXISTS (SELECT 1 FROM food WHERE food.id = reservation.food_id)""")
+
+EXPIRED = text('SELECT rowid, food_id FROM reservation WHERE expires <= :now LIMIT :batch')
+
+
+def hold(user_id, lines, seconds):
+    """Hold {food_id: quantity} for the user and renew the cart.
+
+    Raises OrderError with status 409 listing the food that is unknown
+    or short of stock; nothing is held in that case.
+    """
+    expires = int(time.time()) + seconds
+    failed = [
+        food_id for food_id, quantity in lines.items()
+        if not db.session.execute(HOLD, dict(
+            user_id=user_id, food_id=food_id, quantity=quantity, expires=expires)).rowcount
+    ]
+    if failed:
+        db.session.rollback()
+        known = {food_id for food_id, in
+                 db.session.query(Food.id).filter(Food.id.in_(failed))}
+        missing = [food_id for food_id in failed if food_id not in known]
+        if missing:
+            raise OrderError('Unknown food items', status=409, items=missing)
+        raise OrderError('Not enough stock', status=409, items=failed)
+
+    db.session.execute(RENEW, dict(user_id=user_id, expires=expires))
+    db.session.execute(text(BUMP))
+    db.session.commit()
+    page_cache.invalidate('catalogue')
+
+
+def release(user_id, food_id):
+    """Give back the user's hold on one food; tell whether there was one."""
+    deleted = (
+        Reservation.query
+        .filter_by(user_id=user_id, food_id=food_id)
+        .delete(synchronize_session=False)
+    )
+    if deleted:
+        db.session.execute(text(BUMP))
+    db.session.commit()
+    if deleted:
+        page_cache.invalidate('catalogue')
+    return bool(deleted)
+
+
+def cart_lines(user_id):
+    """Return the user's holds with the food they are for, by food name."""
+    return (
+        db.session.query(
+            Food.id,
+            Food.food_name,
+            Food.description,
+            Reservation.quantity,
+            Reservation.expires,
+            User.businessname,
+            User.location)
+        .join(Food, Food.id == Reservation.food_id)
+        .outerjoin(User, User.id == Food.users_id)
+        .filter(Reservation.user_id == user_id)
+        .order_by(Food.food_name)
+        .all()
+    )
+
+
+def checkout(user_id):
+    """Turn all of the user's holds into one order and return it.
+
+    Raises OrderError with status 400 for an empty cart and 409 when a
+    hold was swept meanwhile or the restaurant cut the stock below it.
+    """
+    db.session.execute(ORPHANED, dict(user_id=user_id))
+    holds = (
+        db.session.query(Reservation.food_id, Reservation.quantity.label('held'),
+                         Food.users_id, Food.quantity)
+        .join(Food, Food.id == Reservation.food_id)
+        .filter(Reservation.user_id == user_id)
+        .all()
+    )
+    if not holds:
+        db.session.commit()
+        raise OrderError('Cart is empty')
+
+    # Deleting first takes the write lock, so a concurrent checkout of the
+    # same cart or the sweeper shows up as a smaller count.
+    deleted = (
+        Reservation.query
+        .filter_by(user_id=user_id)
+        .delete(synchronize_session=False)
+    )
+    if deleted != len(holds):
+        db.session.rollback()
+        raise OrderError('Cart changed, please review it', status=409)
+
+    foods = {row.food_id: row for row in holds}
+    lines = {row.food_id: row.held for row in holds}
+    try:
+        order = write_order(user_id, lines, foods)
+    except OrderError:
+        db.session.rollback()
+        raise
+    db.session.commit()
+    page_cache.invalidate('catalogue', *{
+        restaurant_scope(row.users_id) for row in holds})
+    return order
+
+
+def sweep(engine, batch_size, now=None):
+    """Delete expired holds, batch_size per transaction.
+
+    Returns the ids of the food whose stock was released.
+    """
+    now = int(time.time()) if now is None else now
+    released = set()
+    while True:
+        with engine.begin() as connection:
+            expired = connection.execute(EXPIRED, dict(now=now, batch=batch_size)).all()
+            if expired:
+                # Re-checking expiry skips holds renewed since the select.
+                connection.execute(
+                    reservation.delete()
+                    .where(column('rowid').in_([rowid for rowid, _ in expired]))
+                    .where(reservation.c.expires <= now))
+                connection.execute(text(BUMP))
+        released.update(food_id for _, food_id in expired)
+        if len(expired) < batch_size:
+            break
+    if released:
+        page_cache.invalidate('catalogue')
+    return released
+
+
+class HoldSweeper(object):
+    """Background thread releasing expired holds."""
+
+    def __init__(self):
+        """Create a sweeper that is not running."""
+        self._thread = None
+        self._stop = None
+
+    def start(self, app, interval, batch_size):
+        """Sweep app's database every interval seconds, replacing any running sweeper."""
+        self.stop()
+        self._stop = stop = threading.Event()
+        with app.app_context():
+            engine = db.engine
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    released = sweep(engine, batch_size)
+                    if released:
+                        with app.app_context():
+                            live.publish_food(live.QUANTITY, released)
+                except Exception:
+                    logger.exception('Sweeping expired cart holds failed')
+
+        self._thread = threading.Thread(target=run, name='cart-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the running sweeper, if any."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self):
+        """Tell whether the sweeper thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+
+sweeper = HoldSweeper()
+
+
+def init_cart(app):
+    """Start sweeping the app's database unless testing or turned off."""
+    interval = app.config.get('CART_SWEEP_SECONDS')
+    if app.config.get('TESTING') or not interval:
+        sweeper.stop()
+        return
+    sweeper.start(app, interval, app.config.get('CART_SWEEP_BATCH', 500))
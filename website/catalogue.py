@@ -0,0 +1,71 @@
+"""Catalogue version counters for conditional requests and caching.
+
+A single-row table is bumped by triggers whenever food is added, changed
+or removed, or a restaurant's details change. Pollers compare against it
+to find out whether anything they have already seen is stale. A second
+table keeps one counter per restaurant, bumped only when that
+restaurant's own food changes.
+"""
+from sqlalchemy import event, select, text
+from . import db
+
+
+catalogue_version = db.Table(
+    'catalogue_version',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0),
+    db.Column('modified', db.Integer, nullable=False, default=0),
+)
+
+restaurant_version = db.Table(
+    'restaurant_version',
+    db.Column('user_id', db.Integer, primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0),
+)
+
+BUMP = """UPDATE catalogue_version
+        SET version = version + 1, modified = CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE id = 1;"""
+
+BUMP_RESTAURANT = """INSERT INTO restaurant_version (user_id, version)
+        SELECT {row}.users_id, 1 WHERE {row}.users_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;"""
+
+TRIGGER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS catalogue_food_insert AFTER INSERT ON food
+    BEGIN {} {} END""".format(BUMP, BUMP_RESTAURANT.format(row='new')),
+    """CREATE TRIGGER IF NOT EXISTS catalogue_food_update AFTER UPDATE ON food
+    BEGIN {} {} {} END""".format(
+        BUMP, BUMP_RESTAURANT.format(row='new'), BUMP_RESTAURANT.format(row='old')),
+    """CREATE TRIGGER IF NOT EXISTS catalogue_food_delete AFTER DELETE ON food
+    BEGIN {} {} END""".format(BUMP, BUMP_RESTAURANT.format(row='old')),
+    """CREATE TRIGGER IF NOT EXISTS catalogue_user_update
+    AFTER UPDATE OF businessname, location ON "user"
+    BEGIN {} END""".format(BUMP),
+]
+
+
+@event.listens_for(db.Model.metadata, 'after_create')
+def create_version_triggers(target, connection, **kw):
+    """Seed the counter row and install the triggers that bump it."""
+    connection.execute(text(
+        "INSERT OR IGNORE INTO catalogue_version (id, version, modified) "
+        "VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER))"))
+    for statement in TRIGGER_DDL:
+        connection.execute(text(statement))
+
+
+def current_version():
+    """Return (version, modified epoch seconds) without using the ORM."""
+    query = select(catalogue_version.c.version, catalogue_version.c.modified)
+    with db.engine.connect() as connection:
+        row = connection.execute(query.where(catalogue_version.c.id == 1)).first()
+    return tuple(row) if row else (0, 0)
+
+
+def current_restaurant_version(user_id):
+    """Return the version of one restaurant's food list."""
+    query = select(restaurant_version.c.version).where(
+        restaurant_version.c.user_id == user_id)
+    with db.engine.connect() as connection:
+        return connection.execute(query).scalar() or 0
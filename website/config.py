@@ -1,4 +1,5 @@
 """Configuration objects for Flask app."""
+import os
 
 
 class BaseSettings(object):
@@ -6,6 +7,46 @@ class BaseSettings(object):
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = "s3cr3t"
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 300
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:260000'
+    PASSWORD_HASH_WORKERS = 4
+    PASSWORD_HASH_QUEUE = 32
+    PASSWORD_HASH_TIMEOUT = 10
+    PAGE_CACHE_BYTES = 16 * 1024 * 1024
+    ASSET_PIPELINE = True
+    ASSET_BUILD_DIR = None
+    ASSET_IMAGE_MAX_WIDTH = 1280
+    ASSET_IMAGE_QUALITY = 80
+    SQLITE_PRAGMAS = {}
+    SQL_PROFILING = False
+    SQL_PROFILE_SLOWEST = 3
+    SQL_PROFILE_REPEATS = 5
+    SQL_PROFILE_SAMPLE_RATE = 0.0
+    SQL_PROFILE_DIR = None
+    METRICS_ENABLED = True
+    METRICS_DIR = None
+    METRICS_FLUSH_SECONDS = 1.0
+    CART_HOLD_SECONDS = 15 * 60
+    CART_SWEEP_SECONDS = 30
+    CART_SWEEP_BATCH = 500
+    LIVE_POLL_SECONDS = 5
+    LIVE_LOG_SIZE = 1000
+    ORDER_QUEUE = False
+    ORDER_QUEUE_WORKERS = 2
+    ORDER_QUEUE_BATCH = 50
+    ORDER_QUEUE_POLL_SECONDS = 1.0
+    IMPORT_BATCH_SIZE = 1000
+    EXPORT_CHUNK_ROWS = 1000
+    RATE_LIMITING = True
+    # endpoint: {'ip' or 'user': (requests, seconds)}
+    RATE_LIMITS = {
+        'auth.login_post': dict(ip=(30, 60), user=(10, 60)),
+        'auth.signup_post': dict(ip=(10, 600)),
+        'views.create_order': dict(ip=(120, 60), user=(30, 60)),
+    }
+    RATE_LIMIT_MAX_KEYS = 100000
+    RATE_LIMIT_MAX_INFLIGHT = 32
 
 
 class DevSettings(BaseSettings):
@@ -22,3 +63,51 @@ class TestSettings(BaseSettings):
 
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
     TESTING = True
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    ASSET_PIPELINE = False
+    RATE_LIMITING = False
+
+
+class ProductionSettings(BaseSettings):
+    """App production settings, read from the environment where secret."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///sqlite.db')
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    SQL_PROFILING = os.environ.get('SQL_PROFILING') == '1'
+    SQL_PROFILE_SAMPLE_RATE = float(os.environ.get('SQL_PROFILE_SAMPLE_RATE', 0))
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    ORDER_QUEUE = os.environ.get('ORDER_QUEUE') == '1'
+    FLASK_ENV = 'production'
+    DEBUG = False
+    # WAL lets readers run alongside the single writer, and busy_timeout
+    # makes concurrent writers wait for the lock instead of failing with
+    # "database is locked". NORMAL is durable in WAL mode except for the
+    # last transactions before a power loss.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        # By name, so importing the settings imports no SQLAlchemy.
+        'poolclass': 'QueuePool',
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 30,
+        # No driver timeout: the busy_timeout PRAGMA above is the one in effect.
+        'connect_args': {'check_same_thread': False},
+    }
+
+
+SETTINGS = {
+    'development': DevSettings,
+    'production': ProductionSettings,
+    'testing': TestSettings,
+}
+
+
+def settings_from_env():
+    """Pick the settings class named by FLASK_ENV, development by default."""
+    return SETTINGS[os.environ.get('FLASK_ENV', 'development')]
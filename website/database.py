@@ -0,0 +1,83 @@
+"""SQLite connection tuning.
+
+Every new pooled connection runs the PRAGMAs in SQLITE_PRAGMAS before it
+is handed out. journal_mode is stored in the database file, the rest only
+last as long as the connection, which is why they go in a connect hook.
+"""
+from sqlalchemy import event, pool
+from . import db
+
+
+# Only these PRAGMAs may be set from configuration, with the values each
+# one accepts, so a typo cannot turn into arbitrary SQL.
+PRAGMAS = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'busy_timeout': int,
+    'cache_size': int,
+    'mmap_size': int,
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+    'foreign_keys': {'ON', 'OFF'},
+}
+
+
+def pragma_statements(pragmas):
+    """Validate configured PRAGMAs and return the statements setting them."""
+    statements = []
+    for name, value in pragmas.items():
+        allowed = PRAGMAS.get(name)
+        if allowed is None:
+            raise ValueError('Unsupported SQLite PRAGMA {!r}'.format(name))
+        if allowed is int:
+            value = int(value)
+        else:
+            value = str(value).upper()
+            if value not in allowed:
+                raise ValueError('Invalid value {!r} for PRAGMA {}'.format(value, name))
+        statements.append('PRAGMA {} = {}'.format(name, value))
+    return statements
+
+
+def effective_settings(engine):
+    """Read back the PRAGMAs and pool sizing the engine actually uses."""
+    with engine.connect() as connection:
+        settings = {name: connection.exec_driver_sql('PRAGMA ' + name).scalar()
+                    for name in PRAGMAS}
+    settings['pool'] = '{} ({})'.format(type(engine.pool).__name__, engine.pool.status())
+    return settings
+
+
+def configure_engine(app):
+    """Install the PRAGMA connect hook on the app's engine.
+
+    A poolclass named in SQLALCHEMY_ENGINE_OPTIONS is looked up in
+    sqlalchemy.pool first.
+    """
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    if isinstance(options.get('poolclass'), str):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+            options, poolclass=getattr(pool, options['poolclass']))
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return engine
+    statements = pragma_statements(app.config.get('SQLITE_PRAGMAS', {}))
+    if statements:
+        @event.listens_for(engine, 'connect')
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.close()
+    return engine
+
+
+def report_settings(app):
+    """Print the database settings in effect, as the server starts."""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or app.config.get('TESTING'):
+        return
+    report = ', '.join('{}={}'.format(name, value)
+                       for name, value in effective_settings(engine).items())
+    print('Database {}: {}'.format(engine.url, report))
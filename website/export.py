@@ -0,0 +1,98 @@
+"""Streaming downloads of order history and saved food.
+
+An export reads its query through a streaming result, EXPORT_CHUNK_ROWS
+rows at a time, and encodes each chunk as CSV or NDJSON as it goes,
+compressing it with gzip when the client accepts that. Nothing holds
+more than one chunk, so an export of ten million rows needs no more
+memory than one of a hundred.
+"""
+import csv
+import io
+import json
+import zlib
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from .models import Food, Order, OrderDetails, SavedDaily, User
+
+
+FORMATS = dict(csv='text/csv', ndjson='application/x-ndjson')
+
+ORDER_COLUMNS = ['order_id', 'date', 'food_id', 'food_name', 'quantity', 'restaurant',
+                 'npo']
+SAVED_COLUMNS = ['day', 'quantity']
+
+
+def order_lines(user):
+    """Select the order lines a user placed, or received as a restaurant."""
+    restaurant, npo = aliased(User), aliased(User)
+    query = (
+        select(Order.id, Order.date, Food.id, Food.food_name, OrderDetails.quantity,
+               restaurant.businessname, npo.businessname)
+        .join(OrderDetails, OrderDetails.order_id == Order.id)
+        .join(Food, Food.id == OrderDetails.food_id)
+        .outerjoin(restaurant, restaurant.id == Food.users_id)
+        .outerjoin(npo, npo.id == Order.user_id)
+    )
+    if user.user_type == 'restaurant':
+        query = query.where(Food.users_id == user.id)
+    else:
+        query = query.where(Order.user_id == user.id)
+    return query.order_by(Order.id, Food.id)
+
+
+def saved_days(user_id):
+    """Select the food a restaurant saved per day, oldest first."""
+    return (
+        select(SavedDaily.day, SavedDaily.quantity)
+        .where(SavedDaily.user_id == user_id)
+        .order_by(SavedDaily.day)
+    )
+
+
+def chunks(engine, query, size):
+    """Yield the query's rows in lists of at most size, reading as it goes."""
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query)
+        for partition in result.partitions(size):
+            yield [[value.isoformat() if hasattr(value, 'isoformat') else value
+                    for value in row] for row in partition]
+
+
+def encode_csv(columns, parts):
+    """Yield CSV text: a header line, then one string per chunk of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in parts:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header is left when there were no rows.
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_ndjson(columns, parts):
+    """Yield NDJSON text, one string per chunk of rows."""
+    for rows in parts:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+ENCODERS = dict(csv=encode_csv, ndjson=encode_ndjson)
+
+
+def gzipped(texts):
+    """Compress a stream of text into a stream of gzip bytes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for text in texts:
+        data = compressor.compress(text.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(engine, query, columns, kind, size, gzip=False):
+    """Return an iterator of the encoded export, bytes if gzip else text."""
+    texts = ENCODERS[kind](columns, chunks(engine, query, size))
+    return gzipped(texts) if gzip else texts
@@ -0,0 +1,189 @@
+"""Coordinates for user locations and nearest-first food search.
+
+Locations are geocoded offline from ``gazetteer.csv``, a bundled list of
+place names and their coordinates. Names match regardless of case and
+diacritics, and "Lund, Sweden" falls back to "Lund". Users get their
+coordinates whenever they are saved with a new location.
+
+Restaurants with coordinates are indexed in the ``user_location`` SQLite
+R-tree, kept in sync by triggers. A proximity search looks at a small
+box around the origin first and doubles it until enough food is found
+or the radius is reached, so dense areas do not load every restaurant
+within the radius.
+"""
+import csv
+import math
+import os
+import unicodedata
+from functools import lru_cache
+from sqlalchemy import event, inspect, text
+from . import db
+from .inventory import available_food
+from .models import Food, User
+
+
+GAZETTEER = os.path.join(os.path.dirname(__file__), 'gazetteer.csv')
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+FIRST_RING_KM = 0.25
+CHUNK = 500
+
+INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_location USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon)""",
+]
+
+TRIGGER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS user_location_insert AFTER INSERT ON "user"
+    WHEN new.user_type = 'restaurant' AND new.latitude IS NOT NULL
+    BEGIN
+        INSERT INTO user_location VALUES
+            (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_location_update
+    AFTER UPDATE OF latitude, longitude, user_type ON "user"
+    BEGIN
+        DELETE FROM user_location WHERE id = old.id;
+        INSERT INTO user_location
+        SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.user_type = 'restaurant' AND new.latitude IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_location_delete AFTER DELETE ON "user"
+    BEGIN
+        DELETE FROM user_location WHERE id = old.id;
+    END""",
+]
+
+# R-tree coordinates are 32-bit floats rounded outwards, so the box query
+# may return a few extra rows; distances use the exact user columns.
+IN_BOX = text("""SELECT "user".id, "user".latitude, "user".longitude
+    FROM user_location JOIN "user" ON "user".id = user_location.id
+    WHERE user_location.max_lat >= :south AND user_location.min_lat <= :north
+      AND user_location.max_lon >= :west AND user_location.min_lon <= :east""")
+
+
+def normalise(name):
+    """Fold case and strip diacritics, so Malmo matches Malmö."""
+    decomposed = unicodedata.normalize('NFKD', name.strip().casefold())
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    """Return {normalised place name: (latitude, longitude)}."""
+    with open(GAZETTEER, encoding='utf-8', newline='') as handle:
+        return {normalise(row['name']): (float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(handle)}
+
+
+def geocode(location):
+    """Return (latitude, longitude) for a place name, or None if unknown."""
+    if not location:
+        return None
+    places = gazetteer()
+    name = normalise(location)
+    return places.get(name) or places.get(name.split(',')[0].strip())
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points by the haversine formula."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def bounding_box(lat, lon, km):
+    """Return (south, north, west, east) enclosing a circle of km around a point."""
+    dlat = km / KM_PER_DEGREE
+    # Near the poles every longitude is within reach.
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+    dlon = 180.0 if cos_lat < 1e-6 else min(km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def restaurants_within(lat, lon, km):
+    """Return (distance, restaurant id) pairs within km, nearest first."""
+    south, north, west, east = bounding_box(lat, lon, km)
+    rows = db.session.execute(IN_BOX, dict(south=south, north=north, west=west, east=east))
+    found = ((distance_km(lat, lon, row_lat, row_lon), user_id)
+             for user_id, row_lat, row_lon in rows)
+    return sorted(pair for pair in found if pair[0] <= km)
+
+
+def nearby_food(lat, lon, km, limit):
+    """Return up to limit available food rows within km, nearest first.
+
+    Rows are dicts with the available_food() columns plus distance_km.
+    """
+    results = []
+    searched = -1.0
+    radius = min(FIRST_RING_KM, km)
+    # Restaurants are asked for their food nearest first, a few at a time.
+    size = min(limit, CHUNK)
+    while True:
+        ring = [pair for pair in restaurants_within(lat, lon, radius) if pair[0] > searched]
+        start = 0
+        while start < len(ring):
+            chunk = dict((user_id, distance) for distance, user_id in ring[start:start + size])
+            start, size = start + size, min(size * 2, CHUNK)
+            rows = available_food().order_by(None).filter(Food.users_id.in_(chunk)).all()
+            rows.sort(key=lambda row: (chunk[row.users_id], row.food_name, row.id))
+            results.extend(dict(row._asdict(), distance_km=round(chunk[row.users_id], 2))
+                           for row in rows[:limit - len(results)])
+            if len(results) >= limit:
+                return results
+        # Written so that a NaN km, which compares false, stops here too.
+        if not radius < km:
+            return results
+        searched, radius = radius, min(radius * 2, km)
+
+
+def locate_user(user):
+    """Give a user the coordinates of their location."""
+    point = geocode(user.location)
+    user.latitude, user.longitude = point if point else (None, None)
+
+
+@event.listens_for(User, 'before_insert')
+def geocode_new_user(mapper, connection, target):
+    """Geocode users as they sign up."""
+    if target.latitude is None:
+        locate_user(target)
+
+
+@event.listens_for(User, 'before_update')
+def geocode_moved_user(mapper, connection, target):
+    """Geocode users whose location changed."""
+    if inspect(target).attrs.location.history.has_changes():
+        locate_user(target)
+
+
+def install_location_index(connection):
+    """Create the R-tree, filling it from existing restaurants the first time."""
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'user_location'")).first()
+    for statement in INDEX_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(
+            """INSERT INTO user_location
+            SELECT id, latitude, latitude, longitude, longitude FROM "user"
+            WHERE user_type = 'restaurant' AND latitude IS NOT NULL"""))
+    for statement in TRIGGER_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(db.Model.metadata, 'after_create')
+def create_location_index(target, connection, **kw):
+    """Install the R-tree once the user table has coordinates."""
+    # Older databases get their columns, and then the index, from a migration.
+    columns = [column['name'] for column in inspect(connection).get_columns('user')]
+    if 'latitude' in columns:
+        install_location_index(connection)
+
+
+@event.listens_for(db.Model.metadata, 'before_drop')
+def drop_location_index(target, connection, **kw):
+    """Drop the R-tree along with the users it mirrors."""
+    connection.execute(text('DROP TABLE IF EXISTS user_location'))
@@ -0,0 +1,127 @@
+"""Saved food totals backing the restaurant insight page.
+
+Two rollups are kept up to date by every order: totals per food, and
+totals per order day. Day, week and month series are grouped from the
+daily rollup, so a restaurant with years of orders reads a few hundred
+rows per chart at most.
+"""
+import datetime
+import math
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from . import db
+from .models import Food, SavedDaily, SavedTotal
+
+
+# Bucket name: SQL for the first day of a day's bucket. Weeks start on
+# Monday: move on to Sunday, then back six days.
+BUCKETS = {
+    'day': lambda day: day,
+    'week': lambda day: func.date(day, 'weekday 0', '-6 days'),
+    'month': lambda day: func.date(day, 'start of month'),
+}
+
+
+def saved_totals(restaurant_id):
+    """Return (food_name, quantity) pairs read from the rollup table."""
+    return (
+        db.session.query(Food.food_name, func.sum(SavedTotal.quantity))
+        .join(SavedTotal, SavedTotal.food_id == Food.id)
+        .filter(SavedTotal.user_id == restaurant_id)
+        .group_by(Food.food_name)
+        .order_by(Food.food_name)
+        .all()
+    )
+
+
+def record_saved(rows, day=None):
+    """Add order quantities to the rollups, in the caller's transaction.
+
+    Each row is a dict with user_id, food_id and quantity; day is the
+    order's date, today by default.
+    """
+    # Foods without an owning restaurant have no rollup row.
+    rows = [row for row in rows if row['user_id'] is not None]
+    if not rows:
+        return
+    stmt = insert(SavedTotal)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SavedTotal.user_id, SavedTotal.food_id],
+        set_=dict(quantity=SavedTotal.quantity + stmt.excluded.quantity))
+    db.session.execute(stmt, rows)
+
+    daily = dict()
+    for row in rows:
+        daily[row['user_id']] = daily.get(row['user_id'], 0) + row['quantity']
+    day = day or datetime.date.today()
+    stmt = insert(SavedDaily)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SavedDaily.user_id, SavedDaily.day],
+        set_=dict(quantity=SavedDaily.quantity + stmt.excluded.quantity))
+    db.session.execute(stmt, [dict(user_id=user_id, day=day, quantity=quantity)
+                              for user_id, quantity in daily.items()])
+
+
+def bucket_starts(bucket, first, last):
+    """Yield the first day of every bucket from first's to last's."""
+    day = first
+    while day <= last:
+        yield day
+        if bucket == 'day':
+            day += datetime.timedelta(days=1)
+        elif bucket == 'week':
+            day += datetime.timedelta(days=7)
+        else:
+            day = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def bucket_start(bucket, day):
+    """Return the first day of day's bucket."""
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def saved_series(restaurant_id, bucket, start=None, end=None):
+    """Return (bucket start, quantity) pairs, oldest first, without gaps.
+
+    Only days from start to end, both inclusive dates, are counted. The
+    series runs from the first to the last bucket anything was saved in,
+    with zeros for the buckets in between.
+    """
+    grouped = BUCKETS[bucket](SavedDaily.day)
+    query = (
+        db.session.query(grouped, func.sum(SavedDaily.quantity))
+        .filter(SavedDaily.user_id == restaurant_id)
+        .group_by(grouped)
+        .order_by(grouped)
+    )
+    if start is not None:
+        query = query.filter(SavedDaily.day >= start)
+    if end is not None:
+        query = query.filter(SavedDaily.day <= end)
+    # func.date() comes back as text, the plain column as a date.
+    totals = {value if isinstance(value, datetime.date)
+              else datetime.date.fromisoformat(value): quantity
+              for value, quantity in query}
+    if not totals:
+        return []
+    first = bucket_start(bucket, min(totals))
+    last = bucket_start(bucket, max(totals))
+    return [(day, totals.get(day, 0)) for day in bucket_starts(bucket, first, last)]
+
+
+def downsample(series, points):
+    """Merge neighbouring buckets so at most points remain.
+
+    Returns the merged series, labelled by each group's first bucket,
+    and how many buckets went into each point. Sums are kept, so the
+    total saved does not change.
+    """
+    step = max(math.ceil(len(series) / points), 1)
+    if step == 1:
+        return series, 1
+    return [(series[i][0], sum(quantity for _, quantity in series[i:i + step]))
+            for i in range(0, len(series), step)], step
@@ -0,0 +1,62 @@
+"""Read-side queries for the NPO dashboard."""
+from sqlalchemy import func
+from . import db
+from .models import Food, Order, OrderDetails, Reservation, User
+
+
+def available_food(in_stock=True):
+    """Query food in stock joined to the restaurant offering it.
+
+    Rows only carry the columns the dashboard renders, so no User or
+    Food objects are loaded and no relationships are touched. quantity
+    is what is left after the stock held in carts; with in_stock False,
+    sold out food is included too.
+    """
+    held = (
+        db.session.query(
+            Reservation.food_id,
+            func.sum(Reservation.quantity).label('quantity'))
+        .group_by(Reservation.food_id)
+        .subquery()
+    )
+    available = Food.quantity - func.coalesce(held.c.quantity, 0)
+    query = (
+        db.session.query(
+            Food.id,
+            Food.food_name,
+            Food.description,
+            available.label('quantity'),
+            Food.users_id,
+            User.businessname,
+            User.location)
+        .join(User, User.id == Food.users_id)
+        .outerjoin(held, held.c.food_id == Food.id)
+        .order_by(Food.food_name)
+    )
+    return query.filter(available > 0) if in_stock else query
+
+
+def order_history(user_id):
+    """Return the user's orders with the ordered food names resolved.
+
+    Each entry is a dict with the order id, date and a products list of
+    (food_name, quantity) pairs, oldest order first.
+    """
+    rows = (
+        db.session.query(
+            Order.id,
+            Order.date,
+            Food.food_name,
+            OrderDetails.quantity)
+        .join(OrderDetails, OrderDetails.order_id == Order.id)
+        .join(Food, Food.id == OrderDetails.food_id)
+        .filter(Order.user_id == user_id)
+        .order_by(Order.id)
+    )
+
+    history = []
+    for order_id, date, food_name, quantity in rows:
+        if not history or history[-1]['id'] != order_id:
+            history.append(dict(id=order_id, date=date, products=[]))
+        history[-1]['products'].append((food_name, quantity))
+    return history
@@ -0,0 +1,107 @@
+"""Live inventory changes polled by dashboards.
+
+Write paths record which food changed in the ``food_event`` table once
+they have committed, and dashboards ask for the events after the last id
+they saw, every LIVE_POLL_SECONDS. The table is shared by every worker
+process, so it does not matter which one makes a change or answers a
+poll, and a poll is one indexed query, so an open dashboard holds no
+server thread between polls.
+
+Events only name the food; a poll returns each food's state as it is
+now, once, however often it changed since the cursor. The table keeps
+the last LIVE_LOG_SIZE events; a client that asks for older ones gets
+``reset`` and reloads the list instead.
+"""
+import json
+from sqlalchemy import text
+from . import db
+from .inventory import available_food
+from .models import Food
+
+
+ADD = 'add'
+UPDATE = 'update'
+QUANTITY = 'quantity'
+DELETE = 'delete'
+RESET = 'reset'
+
+RECORD = text("""INSERT INTO food_event (food_id, kind)
+    SELECT value, :kind FROM json_each(:ids)""")
+
+# The newest event always stays, so ids are never handed out twice.
+PRUNE = text("""DELETE FROM food_event
+    WHERE id <= (SELECT MAX(id) FROM food_event) - :keep""")
+
+BOUNDS = text('SELECT MIN(id), MAX(id) FROM food_event')
+
+# SQLite takes kind from the row holding MAX(id).
+LATEST = text("""SELECT food_id, kind, MAX(id) AS id FROM food_event
+    WHERE id > :after GROUP BY food_id ORDER BY id""")
+
+
+class Broker(object):
+    """Food event log in the database, read by cursor."""
+
+    def __init__(self):
+        """Use the default LIVE_* settings until configured."""
+        self.poll_seconds = 5
+        self.log_size = 1000
+
+    def configure(self, config):
+        """Apply the LIVE_* settings."""
+        self.poll_seconds = config.get('LIVE_POLL_SECONDS', self.poll_seconds)
+        self.log_size = max(config.get('LIVE_LOG_SIZE', self.log_size), 1)
+
+    def publish(self, kind, food_ids):
+        """Record that the food changed, in a transaction of its own."""
+        ids = json.dumps([int(food_id) for food_id in food_ids])
+        db.session.execute(RECORD, dict(kind=kind, ids=ids))
+        db.session.execute(PRUNE, dict(keep=self.log_size))
+        db.session.commit()
+
+    def since(self, cursor, location=None):
+        """Return (events, cursor) for the food changed after cursor.
+
+        Events carry the food's current state, oldest change first, and
+        with a location only food offered there, or deleted. An unknown
+        cursor returns no events; one older than the log returns a
+        single reset event.
+        """
+        oldest, last = db.session.execute(BOUNDS).first()
+        last = last or 0
+        if cursor is None or not cursor.isdigit() or int(cursor) > last:
+            return [], str(last)
+        after = int(cursor)
+        if oldest is not None and after < oldest - 1:
+            return [dict(type=RESET)], str(last)
+
+        changes = db.session.execute(LATEST, dict(after=after)).all()
+        rows = {row.id: row for row in available_food(in_stock=False).order_by(None)
+                .filter(Food.id.in_([change.food_id for change in changes]))}
+        events = []
+        for change in changes:
+            row = rows.get(change.food_id)
+            if row is None:
+                events.append(dict(type=DELETE, id=change.food_id))
+            elif location is None or row.location == location:
+                events.append(dict(
+                    type=change.kind, id=row.id, food_name=row.food_name,
+                    description=row.description, quantity=max(row.quantity or 0, 0),
+                    restaurant=row.users_id, businessname=row.businessname,
+                    location=row.location))
+        return events, str(max([last] + [change.id for change in changes]))
+
+
+broker = Broker()
+
+
+def publish_food(kind, food_ids):
+    """Publish that the given food changed, after a commit."""
+    if food_ids:
+        broker.publish(kind, food_ids)
+
+
+def publish_deleted(food_ids):
+    """Publish that food was removed."""
+    if food_ids:
+        broker.publish(DELETE, food_ids)
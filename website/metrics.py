@@ -0,0 +1,353 @@
+"""Request metrics in the Prometheus text format.
+
+Request counts, latency histograms and in-flight gauges are kept in
+lock-striped tables. Threads are dealt stripes in turn as they first
+record something, so request threads rarely wait on each other, and ``/metrics`` sums the
+stripes when it is scraped. Series are keyed by tuples of label values
+and only formatted as text at scrape time.
+
+With several worker processes, set METRICS_DIR to a directory shared by
+all of them and emptied when the service starts. Every process writes a
+snapshot of its metrics there at most once every METRICS_FLUSH_SECONDS.
+Whichever process answers a scrape adds all the snapshots together.
+Counters and histograms of workers that have exited still count; their
+gauges do not.
+"""
+import bisect
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import Blueprint, _request_ctx_stack, current_app
+from sqlalchemy import event
+from . import db
+from .pagecache import page_cache
+from .passwords import hasher
+from .usercache import user_cache
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STRIPES = 16
+
+REQUESTS = 'http_requests_total'
+DURATION = 'http_request_duration_seconds'
+IN_FLIGHT = 'http_requests_in_flight'
+
+# name: (type, help text, label names)
+FAMILIES = {
+    REQUESTS: ('counter', 'Requests handled.', ('endpoint', 'method', 'status')),
+    DURATION: ('histogram', 'Time spent handling requests.', ('endpoint', 'status')),
+    IN_FLIGHT: ('gauge', 'Requests being handled right now.', ('endpoint',)),
+    'db_pool_checkouts_total': ('counter', 'Connections checked out of the pool.', ()),
+    'db_pool_size': ('gauge', 'Connections the pool keeps open.', ()),
+    'db_pool_checked_out': ('gauge', 'Connections in use.', ()),
+    'db_pool_overflow': ('gauge', 'Connections open beyond the pool size.', ()),
+    'cache_hits_total': ('counter', 'Cache lookups that found an entry.', ('cache',)),
+    'cache_misses_total': ('counter', 'Cache lookups that found nothing.', ('cache',)),
+    'cache_hit_ratio': ('gauge', 'Share of cache lookups that found an entry.', ('cache',)),
+    'password_hash_operations_total': ('counter', 'Password hashes and checks done.',
+                                       ('operation',)),
+    'password_hash_seconds_total': ('counter', 'Time spent hashing passwords.',
+                                    ('operation',)),
+    'password_hash_wait_seconds_total': ('counter', 'Time password hashes spent queued.',
+                                         ('operation',)),
+    'password_hash_pending': ('gauge', 'Password hashes running or queued.', ()),
+}
+
+
+class Stripe(object):
+    """One lock and the values guarded by it."""
+
+    def __init__(self):
+        """Create an empty stripe."""
+        self.lock = threading.Lock()
+        self.values = dict()
+        self.histograms = dict()
+
+
+class Metrics(object):
+    """Counters, gauges and histograms spread over lock stripes."""
+
+    def __init__(self):
+        """Create empty tables with no snapshot directory."""
+        self.directory = None
+        self.pool = None
+        self.flush_seconds = 1.0
+        self.last_flush = 0.0
+        self._local = threading.local()
+        self._turns = itertools.count()
+        self.reset()
+
+    def configure(self, config):
+        """Apply the METRICS_* settings and start from zero."""
+        self.directory = config.get('METRICS_DIR')
+        self.flush_seconds = config.get('METRICS_FLUSH_SECONDS', 1.0)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self.reset()
+
+    def reset(self):
+        """Forget every value."""
+        self.stripes = [Stripe() for _ in range(STRIPES)]
+
+    def stripe(self):
+        """Return the current thread's stripe."""
+        # Thread idents are page aligned, so their low bits are all zero.
+        try:
+            index = self._local.index
+        except AttributeError:
+            index = self._local.index = next(self._turns) % STRIPES
+        return self.stripes[index]
+
+    def add(self, name, key=(), amount=1):
+        """Add amount to a counter or gauge series."""
+        stripe = self.stripe()
+        with stripe.lock:
+            series = stripe.values.setdefault(name, dict())
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, key, value):
+        """Record one value in a histogram series."""
+        stripe = self.stripe()
+        with stripe.lock:
+            bump(stripe.histograms, name, key, value)
+
+    def request_started(self, endpoint):
+        """Count a request as in flight."""
+        self.add(IN_FLIGHT, (endpoint,))
+
+    def request_finished(self, endpoint, method, status, duration):
+        """Count and time a request, taking the stripe lock once."""
+        stripe = self.stripe()
+        with stripe.lock:
+            values = stripe.values
+            series = values.setdefault(IN_FLIGHT, dict())
+            series[(endpoint,)] = series.get((endpoint,), 0) - 1
+            series = values.setdefault(REQUESTS, dict())
+            key = (endpoint, method, status)
+            series[key] = series.get(key, 0) + 1
+            bump(stripe.histograms, DURATION, (endpoint, status), duration)
+
+    def snapshot(self):
+        """Sum the stripes and add the pool, cache and hashing state.
+
+        Returns {'counters': ..., 'gauges': ..., 'histograms': ...}, each
+        mapping metric names to {label values tuple: value}.
+        """
+        values = dict()
+        histograms = dict()
+        for stripe in self.stripes:
+            with stripe.lock:
+                merge(values, stripe.values)
+                merge_histograms(histograms, stripe.histograms)
+        gauges = {name: values.pop(name) for name in list(values)
+                  if FAMILIES[name][0] == 'gauge'}
+        process_state(self.pool, values, gauges)
+        return dict(counters=values, gauges=gauges, histograms=histograms)
+
+    def flush(self, force=False):
+        """Write this process's snapshot for the other workers to read."""
+        now = time.monotonic()
+        if not self.directory or (not force and now - self.last_flush < self.flush_seconds):
+            return
+        self.last_flush = now
+        data = {kind: {name: [[list(key), value] for key, value in series.items()]
+                       for name, series in families.items()}
+                for kind, families in self.snapshot().items()}
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'w') as output:
+            json.dump(data, output)
+        os.replace(path, os.path.join(self.directory, '{}.json'.format(os.getpid())))
+
+    def collect(self):
+        """Return this process's snapshot, or every worker's when shared."""
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush(force=True)
+        total = dict(counters=dict(), gauges=dict(), histograms=dict())
+        for filename in os.listdir(self.directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as handle:
+                    data = {kind: {name: {tuple(key): value for key, value in series}
+                                   for name, series in families.items()}
+                            for kind, families in json.load(handle).items()}
+            except (OSError, ValueError):
+                continue
+            merge(total['counters'], data['counters'])
+            merge_histograms(total['histograms'], data['histograms'])
+            if alive(int(pid)):
+                merge(total['gauges'], data['gauges'])
+        return total
+
+
+def bump(histograms, name, key, value):
+    """Add value to one histogram series: bucket counts, then the sum."""
+    series = histograms.setdefault(name, dict())
+    entry = series.get(key)
+    if entry is None:
+        entry = series[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+    entry[bisect.bisect_left(BUCKETS, value)] += 1
+    entry[-1] += value
+
+
+def merge(total, values):
+    """Add {name: {key: number}} values into total."""
+    for name, series in values.items():
+        target = total.setdefault(name, dict())
+        for key, value in series.items():
+            target[key] = target.get(key, 0) + value
+
+
+def merge_histograms(total, values):
+    """Add {name: {key: [buckets..., sum]}} values into total."""
+    for name, series in values.items():
+        target = total.setdefault(name, dict())
+        for key, entry in series.items():
+            if key in target:
+                target[key] = [a + b for a, b in zip(target[key], entry)]
+            else:
+                target[key] = list(entry)
+
+
+def alive(pid):
+    """Tell whether a process is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Running, as another user.
+        pass
+    return True
+
+
+def process_state(pool, counters, gauges):
+    """Add this process's pool state, cache and password hashing counters."""
+    if hasattr(pool, 'checkedout'):
+        gauges['db_pool_checked_out'] = {(): pool.checkedout()}
+    if hasattr(pool, 'size') and hasattr(pool, 'overflow'):
+        gauges['db_pool_size'] = {(): pool.size()}
+        gauges['db_pool_overflow'] = {(): max(pool.overflow(), 0)}
+
+    for name, cache in (('user', user_cache), ('page', page_cache)):
+        stats = cache.stats()
+        counters.setdefault('cache_hits_total', dict())[(name,)] = stats['hits']
+        counters.setdefault('cache_misses_total', dict())[(name,)] = stats['misses']
+
+    for operation, stats in hasher.stats().items():
+        for name, value in (('password_hash_operations_total', stats['count']),
+                            ('password_hash_seconds_total', stats['total']),
+                            ('password_hash_wait_seconds_total', stats['wait'])):
+            counters.setdefault(name, dict())[(operation,)] = value
+    gauges['password_hash_pending'] = {(): hasher.pending()}
+
+
+def format_labels(names, key, extra=''):
+    """Format label names and values as they appear between braces."""
+    pairs = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+             for name, value in zip(names, key)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(data):
+    """Format collected metrics in the Prometheus text format."""
+    counters = data['counters']
+    gauges = dict(data['gauges'])
+    misses = counters.get('cache_misses_total', dict())
+    gauges['cache_hit_ratio'] = {
+        key: hits / (hits + misses.get(key, 0))
+        for key, hits in counters.get('cache_hits_total', dict()).items()
+        if hits + misses.get(key, 0)}
+
+    lines = []
+    for family in (counters, gauges, data['histograms']):
+        for name in sorted(family):
+            kind, text, names = FAMILIES[name]
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for key, value in sorted(family[name].items(), key=lambda item: str(item[0])):
+                if kind != 'histogram':
+                    lines.append('{}{} {}'.format(name, format_labels(names, key), value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(
+                        name, format_labels(names, key, 'le="{}"'.format(bound)), cumulative))
+                lines.append('{}_sum{} {}'.format(name, format_labels(names, key), value[-1]))
+                lines.append('{}_count{} {}'.format(name, format_labels(names, key), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics')
+def export():
+    """Expose the metrics for Prometheus to scrape."""
+    return current_app.response_class(
+        render(metrics.collect()), mimetype='text/plain; version=0.0.4')
+
+
+def start_request():
+    """Count the request as in flight under its endpoint."""
+    # One context lookup instead of a proxy access per attribute.
+    flask_request = _request_ctx_stack.top.request
+    endpoint = flask_request.endpoint or 'unmatched'
+    flask_request.environ['metrics.endpoint'] = endpoint
+    metrics.request_started(endpoint)
+
+
+class MetricsMiddleware(object):
+    """WSGI middleware timing every request and counting its status."""
+
+    def __init__(self, wsgi_app):
+        """Wrap the Flask app's WSGI callable."""
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        """Handle one request and record it."""
+        start = time.perf_counter()
+        status = [500]
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[0] = int(status_line[:3])
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, recording_start_response)
+        finally:
+            endpoint = environ.get('metrics.endpoint')
+            if endpoint is not None:
+                metrics.request_finished(endpoint, environ['REQUEST_METHOD'], status[0],
+                                         time.perf_counter() - start)
+                metrics.flush()
+
+
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    """Count a pool checkout."""
+    metrics.add('db_pool_checkouts_total')
+
+
+def init_metrics(app):
+    """Instrument the app's requests and pool, and serve /metrics."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+    metrics.configure(app.config)
+    with app.app_context():
+        metrics.pool = db.engine.pool
+    if not event.contains(metrics.pool, 'checkout', count_checkout):
+        event.listen(metrics.pool, 'checkout', count_checkout)
+    app.before_request(start_request)
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+    app.register_blueprint(metrics_blueprint)
+    return metrics
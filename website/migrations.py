@@ -0,0 +1,192 @@
+"""Versioned schema migrations for SQLite databases.
+
+The schema version is kept in SQLite's own ``PRAGMA user_version``. A
+fresh database is created from the models and stamped with the latest
+version; an existing one has every pending migration applied in order.
+Everything runs inside one ``BEGIN IMMEDIATE`` transaction, which takes
+the database write lock, so several processes starting at once upgrade
+the file exactly once and a failed migration leaves it untouched.
+
+Application startup only reads the stamp and skips all DDL when it is at
+the latest version, so every schema change needs a migration here.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import create_engine, event, inspect
+from . import catalogue, db, geo
+from .models import FoodEvent, QueuedOrder, Reservation
+
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a function taking a connection as a schema migration."""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+def head():
+    """Return the version a fully migrated database is at."""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def add_column(connection, table, name, ddl):
+    """Add a column unless the table already has it."""
+    columns = [column['name'] for column in inspect(connection).get_columns(table)]
+    if name not in columns:
+        connection.exec_driver_sql(
+            'ALTER TABLE "{}" ADD COLUMN {} {}'.format(table, name, ddl))
+
+
+@migration(1, 'Backfill the saved_total rollup from order details')
+def backfill_saved_totals(connection):
+    """Sum existing order lines into the insight rollup."""
+    connection.exec_driver_sql('DELETE FROM saved_total')
+    connection.exec_driver_sql(
+        """INSERT INTO saved_total (user_id, food_id, quantity)
+        SELECT food.users_id, food.id, SUM(order_details.quantity)
+        FROM food JOIN order_details ON order_details.food_id = food.id
+        WHERE food.users_id IS NOT NULL
+        GROUP BY food.users_id, food.id""")
+
+
+@migration(2, 'Index the columns hot paths filter on')
+def add_filter_indexes(connection):
+    """Create the secondary indexes declared on the models."""
+    # order_details.food_id already leads the composite primary key.
+    for name, table, column in [
+            ('ix_food_users_id', 'food', 'users_id'),
+            ('ix_order_user_id', 'order', 'user_id'),
+            ('ix_order_date', 'order', 'date'),
+            ('ix_order_details_order_id', 'order_details', 'order_id'),
+            ('ix_user_location', 'user', 'location')]:
+        connection.exec_driver_sql(
+            'CREATE INDEX IF NOT EXISTS {} ON "{}" ({})'.format(name, table, column))
+
+
+@migration(3, 'Bump per-restaurant versions from the catalogue triggers')
+def replace_catalogue_triggers(connection):
+    """Recreate the catalogue triggers with their current bodies."""
+    for name in ('catalogue_food_insert', 'catalogue_food_update', 'catalogue_food_delete'):
+        connection.exec_driver_sql('DROP TRIGGER IF EXISTS {}'.format(name))
+    for statement in catalogue.TRIGGER_DDL:
+        connection.exec_driver_sql(statement)
+
+
+@migration(4, 'Add the reservation table holding cart stock')
+def add_reservations(connection):
+    """Create the cart holds table and its indexes."""
+    Reservation.__table__.create(connection, checkfirst=True)
+
+
+@migration(5, 'Add the queued_order table behind the order queue')
+def add_order_queue(connection):
+    """Create the order queue table and its indexes."""
+    QueuedOrder.__table__.create(connection, checkfirst=True)
+
+
+@migration(6, 'Backfill the saved_daily rollup from orders')
+def backfill_saved_daily(connection):
+    """Sum existing order lines per restaurant and order day."""
+    connection.exec_driver_sql('DELETE FROM saved_daily')
+    connection.exec_driver_sql(
+        """INSERT INTO saved_daily (user_id, day, quantity)
+        SELECT food.users_id, date("order".date), SUM(order_details.quantity)
+        FROM order_details
+        JOIN food ON food.id = order_details.food_id
+        JOIN "order" ON "order".id = order_details.order_id
+        WHERE food.users_id IS NOT NULL
+        GROUP BY food.users_id, date("order".date)""")
+
+
+@migration(7, 'Geocode user locations and index restaurants in an R-tree')
+def add_coordinates(connection):
+    """Add the coordinate columns, fill them from the gazetteer and index them."""
+    add_column(connection, 'user', 'latitude', 'FLOAT')
+    add_column(connection, 'user', 'longitude', 'FLOAT')
+    locations = [location for location, in connection.exec_driver_sql(
+        'SELECT DISTINCT location FROM "user" WHERE latitude IS NULL')]
+    for location in locations:
+        point = geo.geocode(location)
+        if point:
+            connection.exec_driver_sql(
+                'UPDATE "user" SET latitude = ?, longitude = ? WHERE location = ?',
+                point + (location,))
+    geo.install_location_index(connection)
+
+
+@migration(8, 'Index food by restaurant and name for bulk imports')
+def add_food_name_index(connection):
+    """Create the index imports look food up by."""
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_food_users_id_food_name ON food (users_id, food_name)')
+
+
+@migration(9, 'Add the food_event table read by live dashboards')
+def add_food_events(connection):
+    """Create the live event log table."""
+    FoodEvent.__table__.create(connection, checkfirst=True)
+
+
+def current_version(connection):
+    """Return the schema version stamped on the database."""
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def needs_upgrade(engine):
+    """Tell whether the database is behind the latest migration."""
+    with engine.connect() as connection:
+        return current_version(connection) < head()
+
+
+def locking_engine(url):
+    """Return an engine whose transactions start with BEGIN IMMEDIATE.
+
+    pysqlite normally defers BEGIN until the first DML statement and runs
+    DDL outside any transaction; taking over transaction control makes
+    DDL transactional and takes the write lock up front.
+    """
+    engine = create_engine(url)
+
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_immediate(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    return engine
+
+
+def upgrade(engine):
+    """Create or migrate the database, returning the versions applied."""
+    applied = []
+    migrator = locking_engine(engine.url)
+    try:
+        with migrator.begin() as connection:
+            fresh = not inspect(connection).has_table('user')
+            db.metadata.create_all(bind=connection)
+            version = head() if fresh else current_version(connection)
+            for number, description, func in MIGRATIONS:
+                if number > version:
+                    func(connection)
+                    applied.append((number, description))
+            connection.exec_driver_sql('PRAGMA user_version = {:d}'.format(head()))
+    finally:
+        migrator.dispose()
+    return applied
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Bring the database schema up to date."""
+    applied = upgrade(db.engine)
+    for number, description in applied:
+        click.echo('Applied migration {}: {}'.format(number, description))
+    click.echo('Database is at schema version {}.'.format(head()))
@@ -8,21 +8,26 @@ class User(UserMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(25), unique=True, nullable=False)
-    password = db.Column(db.String(30), nullable=False)
+    password = db.Column(db.String(128), nullable=False)
     businessname = db.Column(db.String(45), unique=True, nullable=False)
-    location = db.Column(db.String(30), nullable=False)
+    location = db.Column(db.String(30), nullable=False, index=True)
     user_type = db.Column(db.String(30), nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     foods = db.relationship('Food', backref=db.backref('user'), lazy=True)
 
 
 class Food(db.Model):
     """Food object model class."""
 
+    # Bulk imports match a restaurant's food by name.
+    __table_args__ = (db.Index('ix_food_users_id_food_name', 'users_id', 'food_name'),)
+
     id = db.Column(db.Integer, primary_key=True)
     food_name = db.Column(db.String(25))
     description = db.Column(db.String(25))
     quantity = db.Column(db.Integer())
-    users_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    users_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
 
     def repr(self):
         """Format the food name output."""
@@ -33,8 +38,8 @@ class Order(db.Model):
     """Order model class."""
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    date = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    date = db.Column(db.DateTime, nullable=False, index=True)
     details = db.relationship('OrderDetails', backref='order', lazy=False)
 
 
@@ -42,5 +47,55 @@ class OrderDetails(db.Model):
     """Order details model class."""
 
     food_id = db.Column(db.Integer, db.ForeignKey('food.id'), primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), primary_key=True, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+
+class SavedTotal(db.Model):
+    """Running total of food saved per restaurant and food item."""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    food_id = db.Column(db.Integer, db.ForeignKey('food.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Reservation(db.Model):
+    """Stock held in an NPO's cart until checkout or expiry."""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    food_id = db.Column(db.Integer, db.ForeignKey('food.id'), primary_key=True, index=True)
     quantity = db.Column(db.Integer, nullable=False)
+    # Epoch seconds, so the sweeper compares plain integers.
+    expires = db.Column(db.Integer, nullable=False, index=True)
+
+
+class QueuedOrder(db.Model):
+    """Order accepted by /order and waiting for a queue worker."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # JSON object of food id to quantity.
+    lines = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued', index=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    # JSON error body of a failed order.
+    error = db.Column(db.Text)
+    created = db.Column(db.Integer, nullable=False)
+    finished = db.Column(db.Integer)
+
+
+class SavedDaily(db.Model):
+    """Food saved per restaurant and order day, for the insight charts."""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
+class FoodEvent(db.Model):
+    """A food change for dashboards to pick up, newest with the highest id."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: events outlive the food they tell about.
+    food_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
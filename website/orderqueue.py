@@ -0,0 +1,160 @@
+"""Durable queue of orders applied in the background.
+
+With ORDER_QUEUE on, ``/order`` only validates the payload and appends it
+to the ``queued_order`` table, then answers 202 with a status URL. A pool
+of ORDER_QUEUE_WORKERS threads drains the table oldest first, up to
+ORDER_QUEUE_BATCH orders per transaction. Each order is applied in its
+own savepoint, so one that runs short of stock fails alone, and the
+whole batch shares one commit.
+
+A batch is claimed, applied and marked in a single transaction. A worker
+that dies half way leaves its orders queued for the next one, and an
+order is never applied twice. Workers wake as soon as this process
+queues an order and poll every ORDER_QUEUE_POLL_SECONDS for orders
+queued by other processes.
+"""
+import json
+import logging
+import threading
+import time
+from sqlalchemy import text
+from . import db, live
+from .models import Food, QueuedOrder
+from .orders import OrderError, write_order
+from .pagecache import page_cache, restaurant_scope
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+# The claim is the transaction's first write, so it takes the write lock
+# before any other worker can read the same rows as still queued.
+CLAIM = text("""UPDATE queued_order SET status = 'claimed' WHERE id IN (
+    SELECT id FROM queued_order WHERE status = 'queued' ORDER BY id LIMIT :batch)""")
+
+
+def enqueue(user_id, lines):
+    """Durably queue {food_id: quantity} for the user and return the entry."""
+    entry = QueuedOrder(user_id=user_id, status=QUEUED, created=int(time.time()),
+                        lines=json.dumps(lines))
+    db.session.add(entry)
+    db.session.commit()
+    queue.wake.set()
+    return entry
+
+
+def order_status(entry):
+    """Describe a queue entry as the status endpoint returns it."""
+    status = dict(id=entry.id, status=entry.status, order_id=entry.order_id)
+    if entry.error:
+        error = json.loads(entry.error)
+        status.update(error=error['error'], items=error['items'])
+    return status
+
+
+def process_batch(batch_size):
+    """Apply up to batch_size queued orders in one transaction.
+
+    Returns the number of orders processed, successful or not.
+    """
+    # Idle polls stay reads and never take the write lock.
+    waiting = db.session.query(QueuedOrder.id).filter_by(status=QUEUED).first()
+    if waiting is None or not db.session.execute(CLAIM, dict(batch=batch_size)).rowcount:
+        db.session.rollback()
+        return 0
+
+    entries = QueuedOrder.query.filter_by(status=CLAIMED).order_by(QueuedOrder.id).all()
+    batch = [(entry, {int(food_id): quantity
+                      for food_id, quantity in json.loads(entry.lines).items()})
+             for entry in entries]
+    foods = {
+        food.id: food for food in
+        db.session.query(Food.id, Food.users_id, Food.quantity)
+        .filter(Food.id.in_({food_id for _, lines in batch for food_id in lines}))
+    }
+
+    now = int(time.time())
+    touched = set()
+    for entry, lines in batch:
+        entry.finished = now
+        try:
+            missing = [food_id for food_id in lines if food_id not in foods]
+            if missing:
+                raise OrderError('Unknown food items', status=409, items=missing)
+            with db.session.begin_nested():
+                order = write_order(entry.user_id, lines, foods)
+        except OrderError as error:
+            entry.status = FAILED
+            entry.error = json.dumps(error.to_dict())
+            continue
+        entry.status = DONE
+        entry.order_id = order.id
+        touched.update(lines)
+    db.session.commit()
+
+    if touched:
+        page_cache.invalidate('catalogue', *{
+            restaurant_scope(foods[food_id].users_id) for food_id in touched})
+        live.publish_food(live.QUANTITY, touched)
+    return len(batch)
+
+
+class OrderQueue(object):
+    """Pool of worker threads draining the order queue."""
+
+    def __init__(self):
+        """Create a queue without workers."""
+        self.wake = threading.Event()
+        self._threads = []
+        self._stop = None
+
+    def start(self, app, workers, batch_size, poll_seconds):
+        """Start workers on app's database, replacing any running ones."""
+        self.stop()
+        self._stop = stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                try:
+                    with app.app_context():
+                        processed = process_batch(batch_size)
+                except Exception:
+                    logger.exception('Processing queued orders failed')
+                    processed = 0
+                # A full batch means more is probably waiting.
+                if processed < batch_size:
+                    self.wake.wait(poll_seconds)
+                    self.wake.clear()
+
+        self._threads = [threading.Thread(target=run, name='order-queue-{}'.format(n),
+                                          daemon=True)
+                         for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop the workers once they finish their current batch."""
+        if self._stop is not None:
+            self._stop.set()
+            self.wake.set()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+            self.wake.clear()
+
+
+queue = OrderQueue()
+
+
+def init_queue(app):
+    """Start the workers when ORDER_QUEUE is on, except under tests."""
+    if not app.config.get('ORDER_QUEUE') or app.config.get('TESTING'):
+        queue.stop()
+        return
+    queue.start(app, app.config.get('ORDER_QUEUE_WORKERS', 2),
+                app.config.get('ORDER_QUEUE_BATCH', 50),
+                app.config.get('ORDER_QUEUE_POLL_SECONDS', 1.0))
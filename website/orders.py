@@ -0,0 +1,116 @@
+"""Order placement for NPO users."""
+import datetime
+from sqlalchemy import bindparam, func, select
+from . import db
+from .insight import record_saved
+from .models import Food, Order, OrderDetails, Reservation
+from .pagecache import page_cache, restaurant_scope
+
+
+class OrderError(Exception):
+    """Raised when an order cannot be placed."""
+
+    def __init__(self, message, status=400, items=None):
+        """Keep the HTTP status and the offending food ids."""
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.items = items or []
+
+    def to_dict(self):
+        """Format the error as a JSON response body."""
+        return dict(status='error', error=self.message, items=self.items)
+
+
+def parse_order(payload):
+    """Validate an order payload and merge it into {food_id: quantity}."""
+    if not isinstance(payload, list) or not payload:
+        raise OrderError('Order must be a non-empty list of items')
+
+    lines = dict()
+    for item in payload:
+        try:
+            food_id = int(item['id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise OrderError('Each item needs an integer id and quantity')
+        if quantity < 1:
+            raise OrderError('Quantities must be positive', items=[food_id])
+        lines[food_id] = lines.get(food_id, 0) + quantity
+    return lines
+
+
+def place_order(user_id, lines):
+    """Create the order and apply stock decrements in one transaction.
+
+    Raises OrderError with status 409 when any food is unknown or does
+    not have enough stock; nothing is written in that case. Stock held
+    in other users' carts does not count as available.
+    """
+    foods = {
+        food.id: food for food in
+        db.session.query(Food.id, Food.users_id, Food.quantity)
+        .filter(Food.id.in_(lines))
+    }
+    missing = [food_id for food_id in lines if food_id not in foods]
+    if missing:
+        raise OrderError('Unknown food items', status=409, items=missing)
+
+    try:
+        order = write_order(user_id, lines, foods)
+    except OrderError:
+        db.session.rollback()
+        raise
+    db.session.commit()
+    page_cache.invalidate('catalogue', *{
+        restaurant_scope(food.users_id) for food in foods.values()})
+    return order
+
+
+def write_order(user_id, lines, foods):
+    """Insert the order and its lines, decrement stock and add to the rollup.
+
+    foods maps every food id in lines to a row with users_id and
+    quantity. Nothing is committed; on a shortage OrderError is raised and
+    the caller rolls back.
+    """
+    order = Order(user_id=user_id, date=datetime.datetime.now())
+    db.session.add(order)
+    db.session.flush()
+
+    rows = [dict(food_id=food_id, order_id=order.id, quantity=quantity)
+            for food_id, quantity in lines.items()]
+    db.session.execute(OrderDetails.__table__.insert(), rows)
+
+    # The quantity guard makes the decrement itself refuse to oversell,
+    # so a concurrent order cannot slip in between the read and the write.
+    # Stock held for other users is off limits; the buyer's own holds are
+    # what a checkout converts.
+    food = Food.__table__
+    reservation = Reservation.__table__
+    held = (
+        select(func.coalesce(func.sum(reservation.c.quantity), 0))
+        .where(reservation.c.food_id == food.c.id)
+        .where(reservation.c.user_id != bindparam('buyer_id'))
+        .scalar_subquery()
+    )
+    decrement = (
+        food.update()
+        .where(food.c.id == bindparam('item_id'))
+        .where(food.c.quantity - held >= bindparam('item_quantity'))
+        .values(quantity=food.c.quantity - bindparam('item_quantity'))
+    )
+    updated = db.session.execute(decrement, [
+        dict(item_id=food_id, item_quantity=quantity, buyer_id=user_id)
+        for food_id, quantity in lines.items()
+    ]).rowcount
+    if updated != len(rows):
+        short = [food_id for food_id, quantity in lines.items()
+                 if (foods[food_id].quantity or 0) < quantity]
+        raise OrderError('Not enough stock', status=409, items=short or list(lines))
+
+    record_saved([
+        dict(user_id=foods[food_id].users_id, food_id=food_id, quantity=quantity)
+        for food_id, quantity in lines.items()
+    ], day=order.date.date())
+    return order
@@ -0,0 +1,154 @@
+"""Rendered page cache for the public pages and dashboards.
+
+Pages are cached by endpoint, path, viewer and the version of the data
+they show, so a stale page is never served even when another process
+made the change. Write paths additionally drop the pages they affect so
+memory is freed straight away. Every cached response carries a strong
+ETag and a matching If-None-Match is answered with 304.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from . import db
+from .catalogue import current_restaurant_version, current_version
+
+
+class PageCache(object):
+    """Thread-safe LRU cache of rendered pages capped by total size."""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        """Create an empty cache."""
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Apply the PAGE_CACHE_BYTES setting and start empty."""
+        self.max_bytes = config.get('PAGE_CACHE_BYTES', self.max_bytes)
+        self.clear()
+
+    def get(self, key):
+        """Return the (scope, etag, body, mimetype) entry for key."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, scope, body, mimetype):
+        """Store a rendered body and return its ETag."""
+        etag = hashlib.sha1(body).hexdigest()
+        if len(body) > self.max_bytes:
+            return etag
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[2])
+            self._entries[key] = (scope, etag, body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[2])
+        return etag
+
+    def invalidate(self, *scopes):
+        """Drop every page cached under any of the given scopes."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] in scopes]:
+                self.size -= len(self._entries.pop(key)[2])
+
+    def clear(self):
+        """Drop every page and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counters, entry count and bytes held."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        entries=len(self._entries), bytes=self.size)
+
+
+page_cache = PageCache()
+
+
+@event.listens_for(db.Model.metadata, 'before_drop')
+def clear_page_cache(target, connection, **kw):
+    """Forget pages rendered from a schema that is going away."""
+    page_cache.clear()
+
+
+def public_page():
+    """Scope and version of a page whose content never changes."""
+    return 'public', 0
+
+
+def dashboard_page():
+    """Scope and version of the current user's dashboard."""
+    if current_user.user_type == 'restaurant':
+        return restaurant_page()
+    # The NPO page lists the whole catalogue, and every order it places
+    # changes food quantities, which bumps the catalogue version too.
+    return 'catalogue', current_version()[0]
+
+
+def restaurant_page():
+    """Scope and version of pages showing only the current user's own food."""
+    return restaurant_scope(current_user.id), current_restaurant_version(current_user.id)
+
+
+def restaurant_scope(user_id):
+    """Cache scope of one restaurant's pages."""
+    return 'restaurant:{}'.format(user_id)
+
+
+def cached_page(scope_func):
+    """Cache a view's rendered response under scope_func's scope and version."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages that show flashed messages are one-offs.
+            if page_cache.max_bytes <= 0 or request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            scope, version = scope_func()
+            # Public pages differ only in the navigation bar, which
+            # depends on the kind of user viewing them.
+            if not current_user.is_authenticated:
+                viewer = None
+            elif scope == 'public':
+                viewer = current_user.user_type
+            else:
+                viewer = (current_user.get_id(), current_user.user_type)
+            key = (request.endpoint, request.full_path, viewer, version)
+
+            entry = page_cache.get(key)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                body = response.get_data()
+                etag = page_cache.put(key, scope, body, response.mimetype)
+            else:
+                _, etag, body, mimetype = entry
+                response = current_app.response_class(body, mimetype=mimetype)
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,135 @@
+"""Password hashing service.
+
+Hashing is deliberately slow, so it runs on a small bounded pool of
+worker threads instead of on whichever request thread happens to be
+handling a login. A burst of logins then queues for the pool while the
+remaining request threads keep serving pages. hashlib releases the GIL
+while it derives keys, so the workers run truly in parallel.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool has no room for more work."""
+
+
+class PasswordHasher(object):
+    """Hash and verify passwords on a bounded worker pool."""
+
+    def __init__(self):
+        """Create a hasher that runs inline until configured."""
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = dict()
+
+    @property
+    def method(self):
+        """Hash method of the current app, e.g. 'pbkdf2:sha256:260000'."""
+        return current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+
+    @property
+    def timeout(self):
+        """Seconds to wait for a pool slot and again for the result."""
+        return current_app.config.get('PASSWORD_HASH_TIMEOUT')
+
+    def configure(self, config):
+        """Size and start the worker pool from the PASSWORD_HASH_* settings.
+
+        Work already running finishes on the old pool and gives its slot
+        back there.
+        """
+        workers = config.get('PASSWORD_HASH_WORKERS', 4)
+        queue = config.get('PASSWORD_HASH_QUEUE', 32)
+        pool = dict(executor=ThreadPoolExecutor(max_workers=workers,
+                                                thread_name_prefix='password-hash'),
+                    slots=threading.BoundedSemaphore(workers + queue),
+                    capacity=workers + queue, pending=0)
+        with self._lock:
+            old, self._pool = self._pool, pool
+        if old is not None:
+            old['executor'].shutdown(wait=False)
+
+    def hash(self, password):
+        """Return a hash of password using the configured method."""
+        return self._run('hash', generate_password_hash, password, method=self.method)
+
+    def verify(self, pwhash, password):
+        """Check password against a stored hash of any supported method."""
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Tell whether a stored hash was made with other settings."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def saturated(self):
+        """Tell whether every worker and queue slot is taken."""
+        with self._lock:
+            return self._pool is not None and self._pool['pending'] >= self._pool['capacity']
+
+    def pending(self):
+        """Return the number of operations running or queued on the pool."""
+        with self._lock:
+            return self._pool['pending'] if self._pool is not None else 0
+
+    def stats(self):
+        """Return count, total and max seconds hashing, and queued, per operation."""
+        with self._lock:
+            return {name: dict(values) for name, values in self._stats.items()}
+
+    def _run(self, name, func, *args, **kwargs):
+        """Run func on the pool, waiting for and timing the result."""
+        queued = time.perf_counter()
+        pool = self._pool
+        if pool is None:
+            return self._timed(name, queued, func, *args, **kwargs)
+        if not pool['slots'].acquire(timeout=self.timeout):
+            raise HashingBusy()
+        with self._lock:
+            pool['pending'] += 1
+        try:
+            future = pool['executor'].submit(self._timed, name, queued, func, *args, **kwargs)
+        except RuntimeError:
+            # The pool was replaced and shut down under us.
+            self._release(pool)
+            raise HashingBusy()
+        except Exception:
+            self._release(pool)
+            raise
+        # The slot stays taken until the work is done, even if we give up
+        # waiting, so abandoned work still counts against the bound.
+        future.add_done_callback(lambda _: self._release(pool))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy()
+
+    def _release(self, pool):
+        """Give back a slot of the pool it was taken from."""
+        with self._lock:
+            pool['pending'] -= 1
+        pool['slots'].release()
+
+    def _timed(self, name, queued, func, *args, **kwargs):
+        """Call func and record how long it took and how long it waited to start."""
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            wait = start - queued
+            with self._lock:
+                stats = self._stats.setdefault(name, dict(
+                    count=0, total=0.0, max=0.0, wait=0.0, wait_max=0.0))
+                stats['count'] += 1
+                stats['total'] += elapsed
+                stats['max'] = max(stats['max'], elapsed)
+                stats['wait'] += wait
+                stats['wait_max'] = max(stats['wait_max'], wait)
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,183 @@
+"""Opt-in per-request SQL profiling.
+
+With SQL_PROFILING on, every statement run while handling a request is
+timed. The response gets a ``Server-Timing`` header with the query count
+and database time, and one JSON log line per request lists the slowest
+statements. Statements of the same shape run SQL_PROFILE_REPEATS times
+or more in one request are reported as likely N+1 queries, once per
+endpoint and shape, and kept in ``current_app.extensions['sql_profiling']``.
+
+SQL_PROFILE_SAMPLE_RATE additionally runs that fraction of requests
+under cProfile and writes each profile to SQL_PROFILE_DIR.
+
+Log lines go to ``app.logger``, which is set to INFO when profiling is
+turned on.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from . import db
+
+
+WHITESPACE = re.compile(r'\s+')
+PLACEHOLDER_LIST = re.compile(r'\(\?(?:,\s*\?)+\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def statement_shape(statement):
+    """Normalise a statement so queries differing only in values match."""
+    shape = WHITESPACE.sub(' ', statement).strip()
+    shape = PLACEHOLDER_LIST.sub('(?)', shape)
+    return LITERAL.sub('?', shape)
+
+
+class RequestProfile(object):
+    """Statements run while handling one request."""
+
+    def __init__(self):
+        """Start an empty profile."""
+        self.started = time.perf_counter()
+        self.queries = []
+        self.profiler = None
+
+    def record(self, statement, duration):
+        """Add one statement and how long it took in seconds."""
+        self.queries.append((statement, duration))
+
+    @property
+    def total(self):
+        """Return the database time in seconds."""
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, count):
+        """Return the slowest statements with their durations in seconds."""
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:count]
+
+    def repeated(self, threshold):
+        """Return {shape: count} for shapes run at least threshold times."""
+        counts = dict()
+        for statement, _ in self.queries:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+
+class SQLProfiling(object):
+    """N+1 findings collected across requests, per endpoint."""
+
+    def __init__(self):
+        """Start without findings."""
+        self.n_plus_one = dict()
+        self._lock = threading.Lock()
+
+    def flag(self, endpoint, repeated):
+        """Record repeated shapes; return the ones not seen before."""
+        new = dict()
+        with self._lock:
+            seen = self.n_plus_one.setdefault(endpoint, dict())
+            for shape, count in repeated.items():
+                if shape not in seen:
+                    new[shape] = count
+                seen[shape] = max(count, seen.get(shape, 0))
+        return new
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Note when a statement starts."""
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Charge a finished statement to the current request."""
+    starts = conn.info.get('query_start')
+    if starts and has_request_context() and 'sql_profile' in g:
+        g.sql_profile.record(statement, time.perf_counter() - starts.pop())
+
+
+def start_profile():
+    """Begin profiling the current request, sampling it for cProfile."""
+    g.sql_profile = profile = RequestProfile()
+    if random.random() < current_app.config['SQL_PROFILE_SAMPLE_RATE']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is already running.
+            return
+        profile.profiler = profiler
+
+
+def finish_profile(response):
+    """Report the current request's statements."""
+    profile = g.pop('sql_profile', None)
+    if profile is None:
+        return response
+    config = current_app.config
+    elapsed = time.perf_counter() - profile.started
+    endpoint = request.endpoint or 'unknown'
+
+    response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(
+        profile.total * 1000, len(profile.queries)))
+    response.headers.add('Server-Timing', 'app;dur={:.1f}'.format(elapsed * 1000))
+
+    repeated = profile.repeated(config['SQL_PROFILE_REPEATS'])
+    new = current_app.extensions['sql_profiling'].flag(endpoint, repeated)
+    for shape, count in new.items():
+        current_app.logger.warning(
+            'Possible N+1 query in %s: %d x %s', endpoint, count, shape)
+
+    record = dict(
+        endpoint=endpoint,
+        method=request.method,
+        path=request.path,
+        status=response.status_code,
+        duration_ms=round(elapsed * 1000, 2),
+        queries=len(profile.queries),
+        db_ms=round(profile.total * 1000, 2),
+        slowest=[dict(ms=round(duration * 1000, 2), statement=statement_shape(statement))
+                 for statement, duration in profile.slowest(config['SQL_PROFILE_SLOWEST'])],
+        repeated=repeated)
+
+    if profile.profiler is not None:
+        profile.profiler.disable()
+        folder = config.get('SQL_PROFILE_DIR') or os.path.join(
+            current_app.instance_path, 'profiles')
+        os.makedirs(folder, exist_ok=True)
+        record['profile'] = os.path.join(folder, '{}-{}-{}.prof'.format(
+            endpoint.replace('.', '-'), int(time.time() * 1000), os.getpid()))
+        profile.profiler.dump_stats(record['profile'])
+
+    current_app.logger.info(json.dumps(record, sort_keys=True))
+    return response
+
+
+def stop_profile(exc):
+    """Stop cProfile for a request that failed before finish_profile ran."""
+    profile = g.pop('sql_profile', None)
+    if profile is not None and profile.profiler is not None:
+        profile.profiler.disable()
+
+
+def init_profiling(app):
+    """Profile the app's requests when SQL_PROFILING is on."""
+    if not app.config.get('SQL_PROFILING'):
+        return None
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(stop_profile)
+    if app.logger.level == logging.NOTSET:
+        app.logger.setLevel(logging.INFO)
+    app.extensions['sql_profiling'] = profiling = SQLProfiling()
+    return profiling
@@ -0,0 +1,180 @@
+"""Token-bucket admission control for expensive endpoints.
+
+RATE_LIMITS maps endpoint names to limits per client IP and per user,
+each a (requests, seconds) pair. Every key gets a bucket of that many
+tokens refilled at requests/seconds per second. A request takes one
+token from each of its buckets if they all have one, or else takes none
+and is answered 429 with a Retry-After saying when a token is next due.
+The user is the logged in user, or for a login the username being
+tried, so a credential-stuffing run is slowed per account as well as per
+address.
+
+Buckets live in lock-striped tables picked by key hash, so concurrent
+requests rarely wait on each other. A stripe forgets its least recently
+used buckets beyond its share of RATE_LIMIT_MAX_KEYS.
+
+Limited endpoints also shed load before doing any work: beyond
+RATE_LIMIT_MAX_INFLIGHT of them running at once in a process, or while
+the password hashing pool is full for the endpoints that hash, requests
+get 503 straight away instead of tying up a request thread in a queue.
+"""
+import math
+import threading
+import time
+from flask import current_app, g, jsonify, request
+from flask_login import current_user
+from .passwords import hasher
+
+
+STRIPES = 16
+HASHING_ENDPOINTS = {'auth.login_post', 'auth.signup_post'}
+
+
+class BucketTable(object):
+    """Token buckets keyed by any hashable, spread over lock stripes."""
+
+    def __init__(self, max_keys=100000):
+        """Create empty stripes holding about max_keys buckets in all."""
+        self.stripe_keys = max(max_keys // STRIPES, 1)
+        # Each stripe maps key -> (tokens, last refill), least recently used first.
+        self.stripes = [(threading.Lock(), dict()) for _ in range(STRIPES)]
+
+    def take(self, key, capacity, per_second, now=None):
+        """Take a token from key's bucket.
+
+        Returns 0 if there was one, else the seconds until one is due.
+        """
+        return self.take_all([(key, capacity, per_second)], now)
+
+    def take_all(self, limits, now=None):
+        """Take a token from each (key, capacity, per_second) bucket, or none.
+
+        Returns 0 if every bucket had one, else the seconds until the
+        emptiest is due, having spent nothing.
+        """
+        now = time.monotonic() if now is None else now
+        stripes = sorted({hash(key) % STRIPES for key, _, _ in limits})
+        # Lock in stripe order so two requests never hold each other's stripes.
+        for index in stripes:
+            self.stripes[index][0].acquire()
+        try:
+            refilled, wait = [], 0.0
+            for key, capacity, per_second in limits:
+                buckets = self.stripes[hash(key) % STRIPES][1]
+                tokens, updated = buckets.pop(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * per_second)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / per_second)
+                refilled.append((key, tokens))
+            for key, tokens in refilled:
+                buckets = self.stripes[hash(key) % STRIPES][1]
+                buckets[key] = (tokens - 1 if not wait else tokens, now)
+                while len(buckets) > self.stripe_keys:
+                    del buckets[next(iter(buckets))]
+        finally:
+            for index in stripes:
+                self.stripes[index][0].release()
+        return wait
+
+    def __len__(self):
+        """Return the number of buckets kept."""
+        return sum(len(buckets) for _, buckets in self.stripes)
+
+
+class RateLimiter(object):
+    """Per-endpoint token buckets and a cap on limited requests in flight."""
+
+    def __init__(self):
+        """Create a limiter that limits nothing until configured."""
+        self.limits = dict()
+        self.buckets = BucketTable()
+        self.max_inflight = 0
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Apply the RATE_LIMIT* settings and start with full buckets."""
+        self.limits = config.get('RATE_LIMITS', dict()) if config.get('RATE_LIMITING') else {}
+        self.buckets = BucketTable(config.get('RATE_LIMIT_MAX_KEYS', 100000))
+        self.max_inflight = config.get('RATE_LIMIT_MAX_INFLIGHT', 0)
+        self.inflight = 0
+
+    def check(self, endpoint, keys, now=None):
+        """Charge a request to its {kind: key} buckets.
+
+        Returns 0 if it may go ahead, else the seconds to wait. A refused
+        request spends no token from any of its buckets.
+        """
+        limits = []
+        for kind, limit in self.limits.get(endpoint, dict()).items():
+            key = keys.get(kind)
+            if key is not None:
+                count, seconds = limit
+                limits.append(((endpoint, kind, key), count, count / seconds))
+        return self.buckets.take_all(limits, now) if limits else 0.0
+
+    def admit(self):
+        """Count a limited request in flight unless the cap is reached."""
+        with self._lock:
+            if self.max_inflight and self.inflight >= self.max_inflight:
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        """Count a limited request as finished."""
+        with self._lock:
+            self.inflight -= 1
+
+
+limiter = RateLimiter()
+
+
+def too_many(status, message, retry_after):
+    """Return a 429 or 503 response, as JSON for JSON requests."""
+    if request.is_json:
+        response = jsonify(status='error', error=message)
+    else:
+        response = current_app.response_class(message + '\n', mimetype='text/plain')
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(int(math.ceil(retry_after)), 1))
+    return response
+
+
+def request_keys():
+    """Return the {kind: key} buckets a request is charged to."""
+    if current_user.is_authenticated:
+        user = current_user.id
+    else:
+        user = (request.form.get('username') or '').strip().casefold() or None
+    return dict(ip=request.remote_addr, user=user)
+
+
+def limit_request():
+    """Refuse limited requests that are over their rate or would queue."""
+    endpoint = request.endpoint
+    if endpoint not in limiter.limits:
+        return None
+    wait = limiter.check(endpoint, request_keys())
+    if wait:
+        return too_many(429, 'Too many requests, please try again shortly.', wait)
+    if endpoint in HASHING_ENDPOINTS and hasher.saturated():
+        return too_many(503, 'Too busy, please try again shortly.', 1)
+    if not limiter.admit():
+        return too_many(503, 'Too busy, please try again shortly.', 1)
+    g.rate_limit_admitted = True
+    return None
+
+
+def finish_request(exc):
+    """Count an admitted request as finished."""
+    if g.pop('rate_limit_admitted', False):
+        limiter.release()
+
+
+def init_ratelimit(app):
+    """Configure the limiter and check every request against it."""
+    limiter.configure(app.config)
+    app.before_request(limit_request)
+    app.teardown_request(finish_request)
+    return limiter
@@ -0,0 +1,109 @@
+"""Full-text search over available food.
+
+Food is indexed in an SQLite FTS5 table together with the name and
+location of the restaurant offering it. Triggers keep the index in sync
+with inserts, updates and deletes, including bulk statements that do not
+go through the ORM.
+"""
+from sqlalchemy import column, event, table, text
+from . import db
+from .inventory import available_food
+from .models import Food
+
+
+PER_PAGE = 25
+
+# Relative bm25 weights of food_name, description, businessname, location.
+RANK = text('bm25(food_search, 10.0, 2.0, 5.0, 5.0)')
+
+food_search = table('food_search', column('rowid'))
+
+INDEX_DDL = [
+    """CREATE VIRTUAL TABLE food_search USING fts5(
+        food_name, description, businessname, location,
+        tokenize = 'unicode61 remove_diacritics 2')""",
+    """INSERT INTO food_search(rowid, food_name, description, businessname, location)
+        SELECT food.id, food.food_name, food.description,
+               "user".businessname, "user".location
+        FROM food LEFT JOIN "user" ON "user".id = food.users_id""",
+]
+
+TRIGGER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS food_search_insert AFTER INSERT ON food
+    BEGIN
+        INSERT INTO food_search(rowid, food_name, description, businessname, location)
+        VALUES (new.id, new.food_name, new.description,
+                (SELECT businessname FROM "user" WHERE id = new.users_id),
+                (SELECT location FROM "user" WHERE id = new.users_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS food_search_update
+    AFTER UPDATE OF food_name, description, users_id ON food
+    BEGIN
+        UPDATE food_search SET
+            food_name = new.food_name,
+            description = new.description,
+            businessname = (SELECT businessname FROM "user" WHERE id = new.users_id),
+            location = (SELECT location FROM "user" WHERE id = new.users_id)
+        WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS food_search_delete AFTER DELETE ON food
+    BEGIN
+        DELETE FROM food_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS food_search_user_update
+    AFTER UPDATE OF businessname, location ON "user"
+    BEGIN
+        UPDATE food_search SET
+            businessname = new.businessname,
+            location = new.location
+        WHERE rowid IN (SELECT id FROM food WHERE users_id = new.id);
+    END""",
+]
+
+
+@event.listens_for(db.Model.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Create the index, filling it from existing food the first time."""
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'food_search'")).first()
+    if not exists:
+        for statement in INDEX_DDL:
+            connection.execute(text(statement))
+    for statement in TRIGGER_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(db.Model.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    """Drop the index along with the tables it mirrors."""
+    connection.execute(text('DROP TABLE IF EXISTS food_search'))
+
+
+def match_expression(tag):
+    """Turn user input into an FTS5 query matching every word as a prefix."""
+    words = tag.replace('"', '""').split()
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def search_food(tag, page=1, per_page=PER_PAGE):
+    """Return one page of available food matching tag, best match first.
+
+    The result is a (rows, has_next) tuple where rows have the same
+    columns as inventory.available_food().
+    """
+    query = match_expression(tag)
+    if not query:
+        return [], False
+
+    rows = (
+        available_food()
+        .join(food_search, food_search.c.rowid == Food.id)
+        .filter(text('food_search MATCH :query'))
+        .params(query=query)
+        .order_by(None)
+        .order_by(RANK, Food.id)
+        .limit(per_page + 1)
+        .offset((page - 1) * per_page)
+        .all()
+    )
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,254 @@
+"""Synthetic data for reproducing production-sized databases locally.
+
+``flask seed`` appends restaurants, NPOs, food and orders to the
+database. Rows are generated in batches and written with Core
+executemany, all inside one ``BEGIN IMMEDIATE`` transaction, so the
+database is never left half seeded. The per-row food triggers are
+replaced while seeding by one set-based update of the search index and
+version counters at the end. The same seed always produces the same
+rows.
+
+Every seeded user's password is ``SEED_PASSWORD`` and their username is
+their user type followed by their id, e.g. ``restaurant12``.
+"""
+import bisect
+import datetime
+import itertools
+import random
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, select
+from werkzeug.security import generate_password_hash
+from . import catalogue, db, search
+from .geo import geocode
+from .migrations import backfill_saved_daily, backfill_saved_totals, locking_engine
+from .models import Food, Order, OrderDetails, User
+from .pagecache import page_cache
+
+
+SEED_PASSWORD = 'password'
+
+# Ordered from largest to smallest; picked with Zipf weights below.
+LOCATIONS = ['Malmo', 'Lund', 'Helsingborg', 'Kristianstad', 'Landskrona',
+             'Trelleborg', 'Angelholm', 'Hassleholm', 'Ystad', 'Eslov',
+             'Hoganas', 'Staffanstorp', 'Hoor', 'Simrishamn', 'Bastad']
+FOODS = ['bread', 'rice', 'pasta', 'soup', 'salad', 'curry', 'stew', 'pizza',
+         'noodles', 'beans', 'potatoes', 'apples', 'bananas', 'yoghurt',
+         'cheese', 'chicken', 'lentils', 'carrots', 'buns', 'pie', 'lasagne',
+         'sandwiches', 'porridge', 'falafel', 'muffins']
+ADJECTIVES = ['fresh', 'day-old', 'vegan', 'spicy', 'frozen', 'baked',
+              'organic', 'mixed', 'homemade', 'leftover', 'surplus', 'seasonal']
+UNITS = ['portions', 'kg', 'trays', 'boxes', 'loaves', 'bags']
+
+# Triggers doing per-row work on food inserts; rebuilt set-based instead.
+FOOD_INSERT_TRIGGERS = ['food_search_insert', 'catalogue_food_insert']
+
+
+def cumulative(weights):
+    """Return running totals of weights, for bisecting with a random number."""
+    return list(itertools.accumulate(weights))
+
+
+class Generator(object):
+    """Deterministic source of realistic looking rows."""
+
+    def __init__(self, random_seed=0, max_lines=8, days=365):
+        """Create a generator; the same arguments give the same rows."""
+        self.rng = random.Random(random_seed)
+        # A stream of its own, so coordinates leave the other rows unchanged.
+        self.jitter = random.Random(random_seed)
+        self.max_lines = max_lines
+        self.days = days
+        self.locations = cumulative(1 / rank for rank in range(1, len(LOCATIONS) + 1))
+
+    def pick(self, values, cum_weights):
+        """Choose one value by weight."""
+        point = self.rng.random() * cum_weights[-1]
+        return values[bisect.bisect(cum_weights, point)]
+
+    def activity(self, count):
+        """Return cumulative lognormal weights, so a few users do most."""
+        return cumulative(self.rng.lognormvariate(0, 1) for _ in range(count))
+
+    def users(self, first_id, count, user_type, password):
+        """Yield user rows with ids from first_id."""
+        for user_id in range(first_id, first_id + count):
+            location = self.pick(LOCATIONS, self.locations)
+            latitude, longitude = geocode(location)
+            yield dict(id=user_id,
+                       username='{}{}'.format(user_type, user_id),
+                       password=password,
+                       businessname='{} {}'.format(user_type.title(), user_id),
+                       location=location,
+                       user_type=user_type,
+                       # Spread users over a few km around the town centre.
+                       latitude=latitude + self.jitter.uniform(-0.03, 0.03),
+                       longitude=longitude + self.jitter.uniform(-0.05, 0.05))
+
+    def foods(self, first_id, count, restaurant_ids):
+        """Yield food rows owned by the restaurants, big menus being rare."""
+        weights = self.activity(len(restaurant_ids))
+        rng = self.rng
+        for food_id in range(first_id, first_id + count):
+            # About one item in ten is sold out; the rest are mostly small.
+            quantity = 0 if rng.random() < 0.1 else 1 + int(rng.expovariate(1 / 12))
+            yield dict(id=food_id,
+                       food_name='{} {}'.format(rng.choice(ADJECTIVES), rng.choice(FOODS)),
+                       description='{} {}'.format(rng.randint(1, 40), rng.choice(UNITS)),
+                       quantity=quantity,
+                       users_id=self.pick(restaurant_ids, weights))
+
+    def orders(self, first_id, count, npo_ids, food_ids):
+        """Yield (order, details) pairs, oldest first, mostly small orders."""
+        weights = self.activity(len(npo_ids))
+        rng = self.rng
+        end = datetime.datetime(2021, 12, 31)
+        start = end - datetime.timedelta(days=self.days)
+        step = self.days * 86400 / max(count, 1)
+        for n, order_id in enumerate(range(first_id, first_id + count)):
+            date = start + datetime.timedelta(seconds=n * step + rng.random() * step)
+            order = dict(id=order_id, user_id=self.pick(npo_ids, weights),
+                         date=date.replace(microsecond=0))
+            lines = min(1 + int(rng.expovariate(1 / 1.5)), self.max_lines, len(food_ids))
+            details = [dict(order_id=order_id, food_id=food_id,
+                            quantity=1 + int(rng.expovariate(1 / 3)))
+                       for food_id in rng.sample(food_ids, lines)]
+            yield order, details
+
+
+def batched(rows, size):
+    """Split an iterable into lists of at most size items."""
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def next_id(connection, column):
+    """Return the id after the largest one in column's table."""
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def seed(connection, restaurants, npos, foods, orders, random_seed=0,
+         batch_size=10000, max_lines=8, password=None, progress=None):
+    """Append generated rows on connection and return the counts written.
+
+    progress, if given, is called with the table name and row count after
+    every batch.
+    """
+    if foods and not restaurants:
+        raise ValueError('Seeding food needs at least one restaurant')
+    if orders and not (npos and foods):
+        raise ValueError('Seeding orders needs NPOs and food')
+    report = progress or (lambda table, count: None)
+    generator = Generator(random_seed, max_lines=max_lines)
+    password = password or generate_password_hash(SEED_PASSWORD)
+    counts = dict(user=0, food=0, order=0, order_details=0)
+
+    def write(table, rows):
+        for batch in batched(rows, batch_size):
+            connection.execute(table.__table__.insert(), batch)
+            counts[table.__tablename__] += len(batch)
+            report(table.__tablename__, len(batch))
+
+    first_user = next_id(connection, User.id)
+    restaurant_ids = list(range(first_user, first_user + restaurants))
+    npo_ids = list(range(first_user + restaurants, first_user + restaurants + npos))
+    write(User, generator.users(first_user, restaurants, 'restaurant', password))
+    write(User, generator.users(first_user + restaurants, npos, 'npo', password))
+
+    first_food = next_id(connection, Food.id)
+    food_ids = list(range(first_food, first_food + foods))
+    if foods:
+        for name in FOOD_INSERT_TRIGGERS:
+            connection.exec_driver_sql('DROP TRIGGER IF EXISTS {}'.format(name))
+        write(Food, generator.foods(first_food, foods, restaurant_ids))
+        index_new_food(connection, first_food)
+        for statement in search.TRIGGER_DDL + catalogue.TRIGGER_DDL:
+            connection.exec_driver_sql(statement)
+
+    if orders:
+        first_order = next_id(connection, Order.id)
+        pending = []
+        for order_batch in batched(
+                generator.orders(first_order, orders, npo_ids, food_ids), batch_size):
+            write(Order, [order for order, _ in order_batch])
+            pending.extend(line for _, details in order_batch for line in details)
+            while len(pending) >= batch_size:
+                write(OrderDetails, pending[:batch_size])
+                del pending[:batch_size]
+        write(OrderDetails, pending)
+        backfill_saved_totals(connection)
+        backfill_saved_daily(connection)
+    return counts
+
+
+def index_new_food(connection, first_id):
+    """Do what the insert triggers would have for food from first_id on."""
+    connection.exec_driver_sql(
+        """INSERT INTO food_search(rowid, food_name, description, businessname, location)
+        SELECT food.id, food.food_name, food.description,
+               "user".businessname, "user".location
+        FROM food LEFT JOIN "user" ON "user".id = food.users_id
+        WHERE food.id >= ?""", (first_id,))
+    connection.exec_driver_sql(catalogue.BUMP)
+    connection.exec_driver_sql(
+        """INSERT INTO restaurant_version (user_id, version)
+        SELECT DISTINCT users_id, 1 FROM food
+        WHERE id >= ? AND users_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1""", (first_id,))
+
+
+def seed_engine(url):
+    """Return a BEGIN IMMEDIATE engine tuned for one long bulk write."""
+    engine = locking_engine(url)
+
+    @event.listens_for(engine, 'connect')
+    def bulk_pragmas(dbapi_connection, connection_record):
+        # A crash mid-seed rolls back anyway, so skip the fsyncs.
+        dbapi_connection.execute('PRAGMA synchronous = OFF')
+        dbapi_connection.execute('PRAGMA cache_size = -262144')
+
+    return engine
+
+
+@click.command('seed')
+@click.option('--restaurants', default=1000, show_default=True)
+@click.option('--npos', default=1000, show_default=True)
+@click.option('--foods', default=100000, show_default=True)
+@click.option('--orders', default=100000, show_default=True)
+@click.option('--max-lines', default=8, show_default=True,
+              help='Most food items in one order.')
+@click.option('--seed', 'random_seed', default=0, show_default=True,
+              help='Random seed; the same seed gives the same rows.')
+@click.option('--batch-size', default=10000, show_default=True)
+@with_appcontext
+def seed_command(restaurants, npos, foods, orders, max_lines, random_seed, batch_size):
+    """Append synthetic users, food and orders to the database."""
+    # Order lines average about two per order.
+    total = restaurants + npos + foods + orders * 3
+    password = generate_password_hash(
+        SEED_PASSWORD, current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'))
+    engine = seed_engine(db.engine.url)
+    start = datetime.datetime.now()
+    try:
+        with click.progressbar(length=total, label='Seeding') as bar, \
+                engine.begin() as connection:
+            counts = seed(connection, restaurants, npos, foods, orders,
+                          random_seed=random_seed, batch_size=batch_size,
+                          max_lines=max_lines, password=password,
+                          progress=lambda table, count: bar.update(count))
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    finally:
+        engine.dispose()
+    page_cache.clear()
+
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    rows = sum(counts.values())
+    click.echo('Wrote {} rows in {:.1f}s ({:.0f} rows/s): {}.'.format(
+        rows, elapsed, rows / max(elapsed, 1e-9),
+        ', '.join('{} {}'.format(count, table) for table, count in counts.items())))
@@ -252,33 +252,102 @@ let colors = [
     "#F44336",
 ];
 
-new Chart("myChart", {
-    type: "bar",
-    data: {
+// Both charts fetch their data once they are about to scroll into view.
+function whenVisible(element, callback) {
+    if (!window.IntersectionObserver){
+        callback();
+        return
+    }
+    const observer = new IntersectionObserver((entries) => {
+        if (entries.some(entry => entry.isIntersecting)){
+            observer.disconnect();
+            callback();
+        }
+    }, {rootMargin: '200px'});
+    observer.observe(element);
+}
+
+const yAxes = [{
+    display: true,
+    ticks: {
+        suggestedMin: 0, // minimum will be 0, unless there is a lower value.
+        // OR //
+        beginAtZero: true // minimum value will be 0.
+    }
+}];
 
-        labels: names,
-        datasets: [{
-            backgroundColor: colors,
-            data: values,
-        }]
-    },
-    options: {
-        legend: { display: false },
-        title: {
-            display: true,
-            text: "YUMMY FOOD SAVIOUR INSIGHT"
-        },
-        scales: {
-            yAxes: [{
-                display: true,
-                ticks: {
+const foodCanvas = document.getElementById('myChart');
+whenVisible(foodCanvas, () => {
+    fetch(foodCanvas.dataset.url)
+    .then(response => response.json())
+    .then(data => {
+        new Chart(foodCanvas, {
+            type: "bar",
+            data: {
 
-                    max: 200,
-                    suggestedMin: 0, // minimum will be 0, unless there is a lower value.
-                    // OR //
-                    beginAtZero: true // minimum value will be 0.
-                }
-            }]
+                labels: data.labels,
+                datasets: [{
+                    backgroundColor: colors,
+                    data: data.values,
+                }]
+            },
+            options: {
+                legend: { display: false },
+                title: {
+                    display: true,
+                    text: "YUMMY FOOD SAVIOUR INSIGHT"
+                },
+                scales: { yAxes: yAxes }
+            }
+        });
+    })
+});
+
+const timeCanvas = document.getElementById('timeChart');
+const bucketButtons = document.getElementById('bucket-buttons');
+let timeChart = null;
+
+function loadSaved(bucket) {
+    // Roughly one point per 6 pixels; the server sums the rest together.
+    const points = Math.max(Math.floor(timeCanvas.clientWidth / 6), 10);
+    fetch(`${timeCanvas.dataset.url}?bucket=${bucket}&points=${points}`)
+    .then(response => response.json())
+    .then(data => {
+        const per = data.step > 1 ? ` (${data.step} ${bucket}s per point)` : '';
+        if (timeChart){
+            timeChart.destroy();
         }
+        timeChart = new Chart(timeCanvas, {
+            type: "line",
+            data: {
+                labels: data.labels,
+                datasets: [{
+                    borderColor: colors[14],
+                    backgroundColor: colors[0],
+                    pointRadius: 0,
+                    data: data.values,
+                }]
+            },
+            options: {
+                legend: { display: false },
+                title: {
+                    display: true,
+                    text: `FOOD SAVED PER ${bucket.toUpperCase()}${per}`
+                },
+                scales: { yAxes: yAxes }
+            }
+        });
+    })
+}
+
+bucketButtons.addEventListener('click', (e) => {
+    const bucket = e.target.dataset.bucket;
+    if (!bucket){
+        return
     }
-});
\ No newline at end of file
+    bucketButtons.querySelectorAll('button').forEach(button =>
+        button.classList.toggle('active', button === e.target));
+    loadSaved(bucket);
+});
+
+whenVisible(timeCanvas, () => loadSaved('week'));
@@ -1,9 +1,15 @@
-order = []
+// The cart lives on the server; every item added is held for us until
+// checkout or until the hold expires.
 
 foodList = document.getElementById('food-list');
 orderTable = document.getElementById('order-table');
 confirmBtn = document.getElementById('confirm-btn');
 orderTableBody = document.getElementById('order-content');
+orderHistory = document.getElementById('order-history');
+
+function cartRow(id) {
+    return orderTableBody.querySelector(`tr[data-id='${id}']`);
+}
 
 foodList.addEventListener('click', (e) => {
     if (e.target.classList.contains('addItem')) {
@@ -15,74 +21,157 @@ foodList.addEventListener('click', (e) => {
         const location = column[4].innerText;
         const quantity = column[5];
         const orderQuantity = column[6].firstElementChild;
+        const amount = parseInt(orderQuantity.value);
 
-        if (orderQuantity.value < 1){
+        if (!(amount > 0) || quantity.innerText - amount < 0){
             return
         }
 
-        if (quantity.innerText - Math.abs(orderQuantity.value) >= 0){
+        fetch('/cart', {
+            method: 'POST',
+            body: JSON.stringify([{"id": id, "quantity": amount}]),
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        })
+        .then(response => response.json().then(body => ({ok: response.ok, body: body})))
+        .then(({ok, body}) => {
+            if (!ok){
+                alert(body.error);
+                return
+            }
             // Update the quantity
-            quantity.innerText = quantity.innerText - orderQuantity.value;
-            // Create a row in the order table
-            orderTableBody.innerHTML += `
-            <tr>
-                <th scope='row'>${id}</th>
-                <td>${name}</td>
-                <td>${info}</td>
-                <td>${business}</td>
-                <td>${location}</td>
-                <td>${orderQuantity.value}</td>
-                <td><button class='btn btn-danger btn-sm remove-btn'>X</button></td>
-            </tr>
-            `
-            order.push({"id":id,"quantity": orderQuantity.value});
+            quantity.innerText = quantity.innerText - amount;
+            const held = body.items.find(item => item.id == id);
+            const row = cartRow(id);
+            if (row){
+                row.children[5].innerText = held.quantity;
+            } else {
+                // Create a row in the order table
+                orderTableBody.innerHTML += `
+                <tr data-id='${id}'>
+                    <th scope='row'>${id}</th>
+                    <td>${name}</td>
+                    <td>${info}</td>
+                    <td>${business}</td>
+                    <td>${location}</td>
+                    <td>${held.quantity}</td>
+                    <td><button class='btn btn-danger btn-sm remove-btn'>X</button></td>
+                </tr>
+                `
+            }
             orderQuantity.value = '';
-        }
+        })
     }
 });
 
 orderTableBody.addEventListener('click', (e) => {
     if (e.target.classList.contains('remove-btn')) {
+        const row = e.target.parentElement.parentElement;
+        const orderFoodId = row.dataset.id;
+        const quantityOrdered = row.children[5].innerText;
 
-        // Add the quantity back to the list
-        quantityOrdered = e.target.parentElement.previousElementSibling.innerText;
-        orderFoodId = e.target.parentElement.parentElement.firstElementChild.innerText;
-        listFoodItem = document.getElementById(orderFoodId);
-        listFoodQty = listFoodItem.children[5];
-        listFoodQty.innerText = parseInt(listFoodQty.innerText) + parseInt(quantityOrdered);
-
-        // remove the item from the dom
-        row = e.target.parentElement.parentElement;
-        row.parentElement.removeChild(row);
-
-        // remove the item from the order object
-        for(i=0; i < order.length; i++){
-            if(order[i].id == orderFoodId){
-                order.splice(i, i+1)
+        fetch(`/cart/${orderFoodId}`, {method: 'DELETE'})
+        .then(
+            response => {
+                // Add the quantity back to the list
+                const listFoodItem = document.getElementById(orderFoodId);
+                if (response.ok && listFoodItem){
+                    const listFoodQty = listFoodItem.children[5];
+                    listFoodQty.innerText = parseInt(listFoodQty.innerText) + parseInt(quantityOrdered);
+                }
+                // remove the item from the dom
+                row.parentElement.removeChild(row);
             }
-        }
+        )
     }
 })
 
 confirmBtn.addEventListener('click', (e) =>{
 
-    if (order.length < 1){
+    if (orderTableBody.children.length < 1){
         return
     }
 
-    fetch('/order', {
-        method: 'POST',
-        body: JSON.stringify(order),
-        headers: {
-            'Content-Type': 'application/json'
-        }
-    })
+    fetch('/cart/checkout', {method: 'POST'})
     .then(
         response => {
-            if(response.status == 200){
-                window.location = '/';
+            if(response.ok){
+                // Move the cart into the order history; stock updates
+                // arrive with the next poll of /api/events.
+                const products = Array.from(orderTableBody.children).map(row =>
+                    `<span>${row.children[1].innerText} ${row.children[5].innerText}Kg</span>`);
+                orderHistory.innerHTML += `
+                <ul class="list-group">
+                    <li class="list-group-item">
+                        <span><strong>Date: </strong>${new Date().toISOString().slice(0, 10)}</span>
+                        <span class="list-products"><strong>Products: </strong>${products.join(' ')}</span>
+                    </li>
+                </ul>
+                `
+                orderTableBody.innerHTML = '';
+            } else {
+                response.json().then(body => alert(body.error));
             }
         }
     )
 })
 
+// Live stock changes from every restaurant.
+const foodRows = foodList.querySelector('tbody');
+const searching = new URLSearchParams(window.location.search).has('tag');
+
+function showFood(food) {
+    let row = document.getElementById(food.id);
+    if (food.quantity < 1){
+        if (row){
+            row.parentElement.removeChild(row);
+        }
+        return
+    }
+    if (!row){
+        // Search results only follow the rows they already list.
+        if (searching){
+            return
+        }
+        row = document.createElement('tr');
+        row.id = food.id;
+        row.innerHTML = `
+            <th scope='row'>${food.id}</th>
+            <td></td><td></td><td></td><td></td><td></td>
+            <td><input type="text" placeholder="Order quantity"></td>
+            <td><button class="btn btn-sm btn-primary addItem">Add to order</button></td>
+        `
+        foodRows.appendChild(row);
+    }
+    const cells = row.children;
+    cells[1].innerText = food.food_name;
+    cells[2].innerText = food.description;
+    cells[3].innerText = food.businessname;
+    cells[4].innerText = food.location;
+    cells[5].innerText = food.quantity;
+}
+
+// Polling, unlike a held open stream, keeps no server thread busy between
+// updates, and any worker process can answer it.
+let cursor = null;
+
+function poll(){
+    const query = cursor === null ? '' : '?after=' + encodeURIComponent(cursor);
+    fetch('/api/events' + query, {credentials: 'same-origin'})
+    .then(response => response.json())
+    .then(body => {
+        for (const food of body.events){
+            if (food.type === 'reset'){
+                // We fell behind; the list is quicker to reload than to patch.
+                return window.location.reload();
+            }
+            showFood(food.type === 'delete' ? {id: food.id, quantity: 0} : food);
+        }
+        cursor = body.cursor;
+        setTimeout(poll, body.poll * 1000);
+    })
+    .catch(() => setTimeout(poll, 30000));
+}
+
+poll();
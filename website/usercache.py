@@ -0,0 +1,130 @@
+"""Per-process cache of logged in users for the Flask-Login loader.
+
+Flask-Login loads the user on every authenticated request. The cache
+keeps a bounded number of lightweight, session-independent user records
+for a limited time, and drops a record as soon as a change to that user
+is committed through the session in this process. Other processes see
+the change once their copy expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from . import db
+from .models import User
+
+
+class CachedUser(UserMixin):
+    """Detached copy of the User columns the app reads from current_user."""
+
+    def __init__(self, id, username, businessname, location, user_type,
+                 latitude=None, longitude=None):
+        """Copy the user's columns."""
+        self.id = id
+        self.username = username
+        self.businessname = businessname
+        self.location = location
+        self.user_type = user_type
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class UserCache(object):
+    """Thread-safe LRU cache of CachedUser records with a time to live."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        """Create an empty cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Apply the USER_CACHE_* settings and start empty."""
+        self.maxsize = config.get('USER_CACHE_SIZE', self.maxsize)
+        self.ttl = config.get('USER_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def get(self, user_id):
+        """Return the user with this id, loading it on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = self.load(user_id)
+        if user is not None and self.maxsize > 0:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, user)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return user
+
+    @staticmethod
+    def load(user_id):
+        """Read one user's columns from the database."""
+        row = (
+            db.session.query(
+                User.id,
+                User.username,
+                User.businessname,
+                User.location,
+                User.user_type,
+                User.latitude,
+                User.longitude)
+            .filter(User.id == user_id)
+            .first()
+        )
+        return CachedUser(*row) if row else None
+
+    def invalidate(self, user_ids):
+        """Forget the given users."""
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Forget every user and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counters and current size."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._entries))
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    """Remember which users this transaction has written."""
+    changed = session.info.setdefault('changed_users', set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_users(session):
+    """Drop committed users from the cache."""
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        user_cache.invalidate(changed)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def forget_changed_users(session, previous_transaction):
+    """Keep cached users when their writes are rolled back."""
+    session.info.pop('changed_users', None)
@@ -1,10 +1,13 @@
 """View routes module."""
-import datetime
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import (Blueprint, current_app, render_template, request, flash, redirect,
+                   url_for, jsonify)
 from flask_login import login_required, current_user
-from . import db
-from .models import Food, User, Order, OrderDetails
-from itertools import product
+from . import bulk, cart, db, live, orderqueue
+from .models import Food
+from .inventory import available_food, order_history
+from .orders import OrderError, parse_order, place_order
+from .pagecache import cached_page, dashboard_page, page_cache, public_page, restaurant_scope
+from .search import search_food
 
 
 views = Blueprint('views', __name__)
@@ -28,6 +31,7 @@ def home():
 
 
 @views.route('/about')
+@cached_page(public_page)
 def about():
     """Route to home page."""
     return render_template("about.html", user=current_user)
@@ -38,21 +42,8 @@ def about():
 def insight():
     """Route to insight page."""
     if current_user.user_type == 'restaurant':
-        foods = Food.query.filter_by(users_id=current_user.id).all()
-        orders = OrderDetails.query.all()
-        data = dict()
-        for item, order in product(foods, orders):
-            if item.id == order.food_id:
-                if item.food_name in data:
-                    data[item.food_name] += order.quantity
-                else:
-                    data[item.food_name] = order.quantity
-
-        return render_template(
-            "insight.html",
-            names=list(data.keys()),
-            values=list(data.values()),
-            user=current_user)
+        # The charts fetch their data from the insight API.
+        return render_template("insight.html", user=current_user)
 
     return redirect(
         url_for("views.dashboard",
@@ -61,6 +52,7 @@ def insight():
 
 
 @views.route('/food-waste')
+@cached_page(public_page)
 def blog():
     """Serve the blog page."""
     return render_template(
@@ -71,6 +63,7 @@ def blog():
 
 @views.route('/<username>')
 @login_required
+@cached_page(dashboard_page)
 def dashboard(username):
     """Show user dashboard depending on user type."""
     if current_user.user_type == 'restaurant':
@@ -82,72 +75,49 @@ def dashboard(username):
             food=food,
             user=current_user)
 
-    food = Food.query.order_by(Food.food_name)
-    users = User.query.all()
-    orders = Order.query.filter_by(user_id=current_user.id)
+    food = available_food().all()
+    orders = order_history(current_user.id)
     # Show NPO page
     return render_template(
         'npo.html',
         businessname=current_user.businessname,
         food=food,
-        users=users,
         user=current_user,
-        orders=orders
+        orders=orders,
+        cart=cart.cart_lines(current_user.id)
         )
 
 
-@views.route('/search', methods=["POST"])
+@views.route('/search', methods=["GET", "POST"])
 @login_required
 def npo_search():
     """Search food items by keyword."""
-    tag = request.form["tag"]
-    orders = Order.query.filter_by(user_id=current_user.id)
-    # details = OrderDetails.query.all()
+    tag = request.values.get("tag", "").strip()
     if not tag:
         flash("Missing keyword")
         return redirect(url_for("views.dashboard", user=current_user, username=current_user.username))
 
-    search = "%{}%".format(tag)
-    location = User.query.filter(User.location.like(search)).all()
-    food = Food.query.all()
-
-    if location is not None:
-        for i in location:
-            filtered = Food.query.filter_by(users_id=i.id).all()
-
-            return render_template(
-                    'npo.html',
-                    businessname=current_user.businessname,
-                    food=food,
-                    filtered=filtered,
-                    users=location,
-                    tag=tag,
-                    orders=orders,
-                    user=current_user)
-
-    businessname = User.query.filter(User.businessname.like(search)).all()
-
-    if businessname is not None:
-        for i in businessname:
-            filtered = Food.query.filter_by(users_id=i.id).all()
-            return render_template(
-                'npo.html',
-                businessname=current_user.businessname,
-                food=food,
-                filtered=filtered,
-                users=businessname,
-                tag=tag,
-                orders=orders,
-                user=current_user)
-
-    flash("Not found")
+    page = max(request.args.get("page", 1, type=int), 1)
+    filtered, has_next = search_food(tag, page=page)
+    orders = order_history(current_user.id)
+
+    # Without hits, show the whole catalogue rather than an empty list.
+    food = []
+    if not filtered:
+        flash("Not found")
+        food = available_food().all()
+
     return render_template(
         'npo.html',
         businessname=current_user.businessname,
+        filtered=filtered,
         food=food,
-        user=current_user,
-        tag=tag
-    )
+        tag=tag,
+        page=page,
+        has_next=has_next,
+        orders=orders,
+        cart=cart.cart_lines(current_user.id),
+        user=current_user)
 
 
 @views.route('/clear_search', methods=["POST"])
@@ -176,6 +146,8 @@ def add(user):
 
         db.session.add(food)
         db.session.commit()
+        page_cache.invalidate(restaurant_scope(current_user.id), 'catalogue')
+        live.publish_food(live.ADD, [food.id])
         flash("Item added!")
 
     food = Food.query.filter_by(users_id=current_user.id).all()
@@ -192,19 +164,17 @@ def add(user):
 @login_required
 def update(id):
     """Update a food item in the restaurant list."""
-    id = request.form.get('id')
-    name = request.form.get('name')
-    description = request.form.get('description')
-    quantity = request.form.get('quantity')
-
-    food = Food.query.filter_by(id=id).first()
-
-    food.food_name = name
-    food.description = description
-    food.quantity = quantity
-
-    db.session.commit()
-    flash('Item Updated!')
+    try:
+        changes, deletes = bulk.parse_changes(dict(update=[dict(
+            id=request.form.get('id'),
+            food_name=request.form.get('name'),
+            description=request.form.get('description'),
+            quantity=request.form.get('quantity'))]))
+        bulk.apply_changes(current_user.id, changes, deletes)
+    except bulk.ChangeError as error:
+        flash(error.message)
+    else:
+        flash('Item Updated!')
 
     return redirect(
         url_for("views.dashboard",
@@ -216,11 +186,13 @@ def update(id):
 @login_required
 def delete():
     """Delete a food item from the restaurant list."""
-    id = request.form.get("id")
-    Food.query.filter_by(id=id).delete()
-    db.session.commit()
-    flash("Item deleted!")
-    Food.query.all()
+    try:
+        changes, deletes = bulk.parse_changes(dict(delete=[request.form.get("id")]))
+        bulk.apply_changes(current_user.id, changes, deletes)
+    except bulk.ChangeError as error:
+        flash(error.message)
+    else:
+        flash("Item deleted!")
     return redirect(
         url_for("views.dashboard",
                 user=current_user,
@@ -230,26 +202,97 @@ def delete():
 @views.route("/order", methods=["POST"])
 @login_required
 def create_order():
-    """Create an order for NPO user."""
-    date = datetime.datetime.now()
-    order = Order(user_id=current_user.id, date=date)
-    db.session.add(order)
-    db.session.commit()
-
-    order_id = db.session.query(Order).filter_by(date=date).first().id
+    """Create an order for NPO user, or queue it when ORDER_QUEUE is on."""
+    try:
+        lines = parse_order(request.get_json(silent=True))
+        if current_app.config['ORDER_QUEUE']:
+            return queue_order(lines)
+        order = place_order(current_user.id, lines)
+    except OrderError as error:
+        return jsonify(error.to_dict()), error.status
+    live.publish_food(live.QUANTITY, list(lines))
+
+    return jsonify(
+        status='created',
+        order_id=order.id,
+        items=len(lines)), 201
+
+
+def queue_order(lines):
+    """Queue an order and point the client at its status."""
+    entry = orderqueue.enqueue(current_user.id, lines)
+    url = url_for('views.order_status', queued_id=entry.id)
+    response = jsonify(status=entry.status, id=entry.id, status_url=url)
+    response.status_code = 202
+    response.headers['Location'] = url
+    return response
+
+
+@views.route("/order/<int:queued_id>")
+@login_required
+def order_status(queued_id):
+    """Report how a queued order of the current user is getting on."""
+    entry = orderqueue.QueuedOrder.query.filter_by(
+        id=queued_id, user_id=current_user.id).first()
+    if entry is None:
+        return jsonify(status='error', error='No such order'), 404
+    response = jsonify(orderqueue.order_status(entry))
+    if entry.status == orderqueue.QUEUED:
+        response.headers['Retry-After'] = '1'
+    return response
+
+
+def cart_response(status=200):
+    """Return the current user's cart as JSON."""
+    lines = cart.cart_lines(current_user.id)
+    return jsonify(
+        items=[dict(id=line.id, food_name=line.food_name, quantity=line.quantity,
+                    expires=line.expires) for line in lines],
+        expires=min((line.expires for line in lines), default=None)), status
+
+
+@views.route("/cart")
+@login_required
+def view_cart():
+    """List the food held in the NPO user's cart."""
+    return cart_response()
 
-    order_data = request.json
 
-    for item in order_data:
-        order_details = OrderDetails(
-            food_id=item['id'],
-            order_id=order_id,
-            quantity=item['quantity']
-        )
-        db.session.add(order_details)
+@views.route("/cart", methods=["POST"])
+@login_required
+def add_to_cart():
+    """Hold food for the NPO user, taking the same items as /order."""
+    try:
+        lines = parse_order(request.get_json(silent=True))
+        cart.hold(current_user.id, lines, current_app.config['CART_HOLD_SECONDS'])
+    except OrderError as error:
+        return jsonify(error.to_dict()), error.status
+    live.publish_food(live.QUANTITY, list(lines))
+    return cart_response()
+
+
+@views.route("/cart/<int:food_id>", methods=["DELETE"])
+@login_required
+def remove_from_cart(food_id):
+    """Release the NPO user's hold on one food item."""
+    if not cart.release(current_user.id, food_id):
+        return jsonify(status='error', error='Not in cart', items=[food_id]), 404
+    live.publish_food(live.QUANTITY, [food_id])
+    return cart_response()
 
-        food = Food.query.filter_by(id=item['id']).first()
-        food.quantity -= int(item['quantity'])
-        db.session.commit()
 
-    return 'a response'
+@views.route("/cart/checkout", methods=["POST"])
+@login_required
+def checkout():
+    """Order everything held in the NPO user's cart."""
+    try:
+        order = cart.checkout(current_user.id)
+    except OrderError as error:
+        return jsonify(error.to_dict()), error.status
+
+    food_ids = [detail.food_id for detail in order.details]
+    live.publish_food(live.QUANTITY, food_ids)
+    return jsonify(
+        status='created',
+        order_id=order.id,
+        items=len(food_ids)), 201